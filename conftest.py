@@ -4,4 +4,11 @@ from django.conf import settings
 
 @pytest.fixture(scope='session')
 def django_db_setup():
-    settings.DATABASES['default'] = settings.DATABASES.get("default")
\ No newline at end of file
+    settings.DATABASES['default'] = settings.DATABASES.get("default")
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # cached counts would outlive the rolled back test data
+    from django.core.cache import cache
+    cache.clear()
+    yield
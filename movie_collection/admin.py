@@ -1,7 +1,13 @@
 from django.contrib import admin
-from .models import Collection, Movie, MovieCollection, RequestData
+from .models import Collection, Movie, MovieCollection, RequestData, RequestCountRollup, LatencyRollup, \
+    MovieSyncCheckpoint, Genre, MovieGenre
 
 admin.site.register(Collection)
 admin.site.register(Movie)
 admin.site.register(MovieCollection)
 admin.site.register(RequestData)
+admin.site.register(RequestCountRollup)
+admin.site.register(LatencyRollup)
+admin.site.register(MovieSyncCheckpoint)
+admin.site.register(Genre)
+admin.site.register(MovieGenre)
@@ -0,0 +1,329 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import LatencyRollup, RequestCountRollup
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_DIMENSIONS = ('path', 'method', 'response_status', 'user', 'node_id')
+LATENCY_DIMENSIONS = ('path', 'method', 'node_id')
+GRANULARITY_SPANS = {
+    RequestCountRollup.MINUTE: timedelta(minutes=1),
+    RequestCountRollup.HOUR: timedelta(hours=1),
+    RequestCountRollup.DAY: timedelta(days=1),
+}
+
+
+def truncate(value: datetime, granularity: str) -> datetime:
+    if granularity == RequestCountRollup.MINUTE:
+        return value.replace(second=0, microsecond=0)
+    if granularity == RequestCountRollup.HOUR:
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def finest_aligned_granularity(*values) -> str:
+    """
+    returns the coarsest granularity whose bucket boundaries line up with every given datetime,so a
+    time range can be answered from rollups without counting partial buckets.
+    """
+    for granularity in [RequestCountRollup.DAY, RequestCountRollup.HOUR]:
+        if all(value is None or truncate(value, granularity) == value for value in values):
+            return granularity
+    return RequestCountRollup.MINUTE
+
+
+def get_request_time(record) -> datetime:
+    request_time = record.get('request_time')
+    if isinstance(request_time, str):
+        request_time = parse_datetime(request_time)
+    if request_time is None:
+        request_time = timezone.now()
+    if timezone.is_naive(request_time):
+        request_time = request_time.replace(tzinfo=dt_timezone.utc)
+    return request_time
+
+
+def rollup_dimensions(record) -> dict:
+    return {'path': record.get('path') or '',
+            'method': record.get('method') or '',
+            'response_status': record.get('response_status') or '',
+            'user': record.get('user') or 0,
+            'node_id': record.get('node_id') or ''}
+
+
+def rollup_keys(records):
+    """
+    request counts and latency histograms of a batch of incoming request records,summed per
+    (granularity, bucket_start, dimensions) key.
+    """
+    counts = Counter()
+    latencies = defaultdict(LatencyHistogram)
+    for record in records:
+        if record.get('request_type', 'incoming') != 'incoming':
+            continue
+        request_time = get_request_time(record)
+        dimensions = rollup_dimensions(record)
+        count_key = tuple(sorted(dimensions.items()))
+        latency_key = tuple((field, dimensions[field]) for field in LATENCY_DIMENSIONS)
+        execution_time = record.get('execution_time')
+        for granularity, _ in RequestCountRollup.GRANULARITY_CHOICES:
+            bucket_start = truncate(request_time, granularity)
+            counts[(granularity, bucket_start, count_key)] += 1
+            if execution_time is not None:
+                latencies[(granularity, bucket_start, latency_key)].record(execution_time.total_seconds() * 1000000)
+    return counts, latencies
+
+
+def record_rollups(records):
+    """
+    adds a batch of written incoming request records to the rollup buffer of the process,which writes
+    the minute,hour and day count and latency rollups once it is due.a failed rollup write is kept in
+    the buffer for the next flush and does not fail the batch,whose logs are already written.
+    """
+    buffer = get_rollup_buffer()
+    buffer.add(records)
+    try:
+        buffer.flush_if_due()
+    except Exception as e:
+        logger.error("failed to write request rollups: %s", e)
+
+
+def write_rollups(counts, latencies):
+    """
+    writes summed rollup keys,each key once: the counts with one upsert statement per chunk where the
+    database supports it,the histograms with one locking read,one bulk update and one bulk insert per chunk.
+    """
+    with transaction.atomic():
+        write_count_rollups(counts)
+        items = list(latencies.items())
+        for start in range(0, len(items), ROLLUP_CHUNK_SIZE):
+            write_latency_rollups(items[start:start + ROLLUP_CHUNK_SIZE])
+
+
+ROLLUP_CHUNK_SIZE = 100
+COUNT_KEY_FIELDS = ('granularity', 'bucket_start') + tuple(sorted(ROLLUP_DIMENSIONS))
+LATENCY_KEY_FIELDS = ('granularity', 'bucket_start') + LATENCY_DIMENSIONS
+
+
+def write_count_rollups(counts):
+    rows = [dict(dimensions, granularity=granularity, bucket_start=bucket_start, count=count)
+            for (granularity, bucket_start, dimensions), count in counts.items()]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for row in rows:
+            increment_rollup(**row)
+        return
+    quote = connection.ops.quote_name
+    table = quote(RequestCountRollup._meta.db_table)
+    fields = [RequestCountRollup._meta.get_field(name) for name in COUNT_KEY_FIELDS + ('count',)]
+    columns = ", ".join(quote(field.column) for field in fields)
+    placeholders = "({})".format(", ".join(["%s"] * len(fields)))
+    for start in range(0, len(rows), ROLLUP_CHUNK_SIZE):
+        chunk = rows[start:start + ROLLUP_CHUNK_SIZE]
+        sql = "INSERT INTO {table} ({columns}) VALUES {values} ON CONFLICT ({keys}) DO UPDATE SET {count} = " \
+              "{table}.{count} + excluded.{count}".format(
+                table=table, columns=columns, values=", ".join([placeholders] * len(chunk)),
+                keys=", ".join(quote(field.column) for field in fields[:-1]), count=quote("count"))
+        params = [field.get_db_prep_value(row[field.name], connection) for row in chunk for field in fields]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+def write_latency_rollups(items):
+    keys = [dict(dimensions, granularity=granularity, bucket_start=bucket_start)
+            for (granularity, bucket_start, dimensions), _ in items]
+    condition = Q()
+    for key in keys:
+        condition |= Q(**key)
+    existing = {tuple(getattr(rollup, field) for field in LATENCY_KEY_FIELDS): rollup
+                for rollup in LatencyRollup.objects.select_for_update().filter(condition)}
+    updated, created = [], []
+    for key, (_, histogram) in zip(keys, items):
+        rollup = existing.get(tuple(key[field] for field in LATENCY_KEY_FIELDS))
+        if rollup is None:
+            created.append((key, histogram))
+            continue
+        merged = rollup.get_histogram().merge(histogram)
+        rollup.count, rollup.total_us, rollup.max_us = merged.count, merged.total, merged.maximum
+        rollup.histogram = merged.to_json()
+        updated.append(rollup)
+    if updated:
+        LatencyRollup.objects.bulk_update(updated, ['count', 'total_us', 'max_us', 'histogram'])
+    if not created:
+        return
+    try:
+        with transaction.atomic():
+            LatencyRollup.objects.bulk_create([
+                LatencyRollup(count=histogram.count, total_us=histogram.total, max_us=histogram.maximum,
+                              histogram=histogram.to_json(), **key) for key, histogram in created])
+    except IntegrityError:
+        # another process created some of the buckets in the meantime
+        for key, histogram in created:
+            merge_latency_rollup(histogram, **key)
+
+
+class RollupBuffer:
+    """
+    rollup keys of the logged requests of this process,summed in memory and written once per key
+    every flush_interval seconds instead of with every log batch.pending rollups are lost if the
+    process dies before the next flush,readers flush the buffer of their process first.
+    """
+
+    def __init__(self, flush_interval=5.0):
+        self.flush_interval = flush_interval
+        self._counts = Counter()
+        self._latencies = defaultdict(LatencyHistogram)
+        self._lock = threading.Lock()
+        self._next_flush = time.monotonic() + flush_interval
+
+    def add(self, records):
+        counts, latencies = rollup_keys(records)
+        with self._lock:
+            self._counts.update(counts)
+            for key, histogram in latencies.items():
+                self._latencies[key].merge(histogram)
+
+    def pending(self):
+        return len(self._counts) + len(self._latencies)
+
+    def flush_if_due(self):
+        if time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, latencies = self._counts, self._latencies
+            self._counts, self._latencies = Counter(), defaultdict(LatencyHistogram)
+            self._next_flush = time.monotonic() + self.flush_interval
+        if not counts and not latencies:
+            return
+        try:
+            write_rollups(counts, latencies)
+        except Exception:
+            # keep the rollups for the next flush
+            with self._lock:
+                self._counts.update(counts)
+                for key, histogram in latencies.items():
+                    self._latencies[key].merge(histogram)
+            raise
+
+    def clear(self):
+        with self._lock:
+            self._counts, self._latencies = Counter(), defaultdict(LatencyHistogram)
+
+
+_rollup_buffer = None
+_rollup_buffer_lock = threading.Lock()
+
+
+def get_rollup_buffer() -> RollupBuffer:
+    global _rollup_buffer
+    if _rollup_buffer is None:
+        with _rollup_buffer_lock:
+            if _rollup_buffer is None:
+                _rollup_buffer = RollupBuffer(flush_interval=settings.REQUEST_ROLLUP_FLUSH_INTERVAL)
+                atexit.register(_rollup_buffer.flush)
+    return _rollup_buffer
+
+
+def increment_rollup(count, **key):
+    if RequestCountRollup.objects.filter(**key).update(count=F('count') + count):
+        return
+    try:
+        with transaction.atomic():
+            RequestCountRollup.objects.create(count=count, **key)
+    except IntegrityError:
+        # another process created the bucket in the meantime
+        RequestCountRollup.objects.filter(**key).update(count=F('count') + count)
+
+
+class LatencyHistogram:
+    """
+    HDR style histogram of latencies in microseconds.values below 2**SUB_BUCKET_BITS are counted exactly,
+    above that every power of two is split into 2**SUB_BUCKET_BITS linear sub buckets,which keeps the
+    relative error of any percentile under 2**-SUB_BUCKET_BITS (about 3%).histograms of the same layout
+    merge by adding bucket counts,so per-minute histograms roll up into any larger window.
+    """
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKET_COUNT = 2 ** SUB_BUCKET_BITS
+
+    def __init__(self, buckets=None, count=0, total=0, maximum=0):
+        self.buckets = Counter({int(index): bucket_count for index, bucket_count in (buckets or {}).items()})
+        self.count = count
+        self.total = total
+        self.maximum = maximum
+
+    @classmethod
+    def bucket_index(cls, value) -> int:
+        value = max(int(value), 0)
+        magnitude = value.bit_length() - 1
+        if magnitude < cls.SUB_BUCKET_BITS:
+            return value
+        shift = magnitude - cls.SUB_BUCKET_BITS
+        return (shift + 1) * cls.SUB_BUCKET_COUNT + (value >> shift) - cls.SUB_BUCKET_COUNT
+
+    @classmethod
+    def bucket_value(cls, index) -> float:
+        """
+        midpoint of the values that fall into bucket index.
+        """
+        if index < cls.SUB_BUCKET_COUNT:
+            return float(index)
+        shift = index // cls.SUB_BUCKET_COUNT - 1
+        lowest = (index % cls.SUB_BUCKET_COUNT + cls.SUB_BUCKET_COUNT) << shift
+        return lowest + ((1 << shift) - 1) / 2
+
+    def record(self, value):
+        value = max(int(value), 0)
+        self.buckets[self.bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        rank = max(percent / 100 * self.count, 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.bucket_value(index), self.maximum)
+        return float(self.maximum)
+
+    def to_json(self) -> dict:
+        return {str(index): bucket_count for index, bucket_count in self.buckets.items() if bucket_count}
+
+
+def merge_latency_rollup(histogram, **key):
+    rollup = LatencyRollup.objects.select_for_update().filter(**key).first()
+    if rollup is None:
+        try:
+            with transaction.atomic():
+                LatencyRollup.objects.create(count=histogram.count, total_us=histogram.total,
+                                             max_us=histogram.maximum, histogram=histogram.to_json(), **key)
+            return
+        except IntegrityError:
+            # another process created the bucket in the meantime
+            rollup = LatencyRollup.objects.select_for_update().get(**key)
+    merged = rollup.get_histogram().merge(histogram)
+    rollup.count, rollup.total_us, rollup.max_us = merged.count, merged.total, merged.maximum
+    rollup.histogram = merged.to_json()
+    rollup.save(update_fields=['count', 'total_us', 'max_us', 'histogram'])
@@ -4,3 +4,21 @@ from django.apps import AppConfig
 class MovieCollectionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'movie_collection'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import m2m_changed, post_delete, post_save
+
+        from .counts import invalidate_counts_receiver
+        from .genres import movie_saved
+        from .middleware import install_query_counter
+        from .models import Collection, Movie
+        connection_created.connect(install_query_counter, dispatch_uid="movie_collection.install_query_counter")
+        post_save.connect(movie_saved, sender=Movie, dispatch_uid="movie_collection.movie_saved")
+        for model in (Collection, Movie):
+            post_save.connect(invalidate_counts_receiver, sender=model,
+                              dispatch_uid="movie_collection.invalidate_counts.save.{}".format(model.__name__))
+            post_delete.connect(invalidate_counts_receiver, sender=model,
+                                dispatch_uid="movie_collection.invalidate_counts.delete.{}".format(model.__name__))
+        m2m_changed.connect(invalidate_counts_receiver, sender=Collection.movies.through,
+                            dispatch_uid="movie_collection.invalidate_counts.collection_movies")
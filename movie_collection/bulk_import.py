@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from .counts import invalidate_counts_receiver
+from .genres import sync_movie_genres
+from .models import Collection, Movie, MovieCollection
+from .serializers import BulkCollectionSerializer
+
+
+def _chunks(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def movie_ids_by_title(titles, batch_size):
+    ids = {}
+    for chunk in _chunks(titles, batch_size):
+        ids.update(Movie.objects.filter(title__in=chunk).values_list("title", "id"))
+    return ids
+
+
+def taken_titles(items, batch_size):
+    """
+    the (user id, title) pairs of items that are already used by a collection.
+    """
+    taken = set()
+    user_ids = {item["user"] for item in items}
+    for chunk in _chunks({item["title"] for item in items}, batch_size):
+        taken.update(Collection.objects.filter(user_id__in=user_ids, title__in=chunk).values_list("user_id", "title"))
+    return taken
+
+
+def import_collections(items, user, batch_size=None) -> dict:
+    """
+    creates collections and their movies from a list of CollectionSerializer style dicts in a fixed
+    number of batched statements.movies are deduplicated by title over all items and existing movies
+    are reused like on create.invalid items,titles the user already has and movies that cannot be
+    created are reported per item and skipped,the others are created in one transaction.items are
+    for `user` unless they name another one,which only superusers may do.
+    """
+    batch_size = batch_size or settings.COLLECTION_BULK_BATCH_SIZE
+    results = [None] * len(items)
+    valid = {}
+    for index, item in enumerate(items):
+        serializer = BulkCollectionSerializer(data=item)
+        if serializer.is_valid():
+            valid[index] = dict(serializer.validated_data, user=serializer.validated_data.get("user", user.id))
+        else:
+            results[index] = {"index": index, "status": "error", "errors": serializer.errors}
+
+    def reject(index, errors):
+        results[index] = {"index": index, "status": "error", "errors": errors}
+        valid.pop(index)
+
+    user_ids = {item["user"] for item in valid.values()}
+    existing_users = set(User.objects.filter(id__in=user_ids).values_list("id", flat=True)) if user_ids else set()
+    taken = taken_titles(valid.values(), batch_size)
+    for index, item in list(valid.items()):
+        if item["user"] != user.id and not user.is_superuser:
+            reject(index, {"user": ["only superusers can import collections of other users"]})
+        elif item["user"] not in existing_users:
+            reject(index, {"user": ["user {} does not exist".format(item["user"])]})
+        elif (item["user"], item["title"]) in taken:
+            reject(index, {"title": ["the user already has a collection with this title"]})
+        else:
+            # later duplicates of the same import are rejected as well
+            taken.add((item["user"], item["title"]))
+
+    with transaction.atomic():
+        movies = {}
+        for item in valid.values():
+            for movie in item["movies"]:
+                movies.setdefault(movie["title"], movie)
+        movie_ids, created_ids = movie_ids_by_title(movies, batch_size), {}
+        new_movies = [Movie(**movie) for title, movie in movies.items() if title not in movie_ids]
+        if new_movies:
+            Movie.objects.bulk_create(new_movies, batch_size=batch_size, ignore_conflicts=True)
+            created_ids = movie_ids_by_title([movie.title for movie in new_movies], batch_size)
+            movie_ids.update(created_ids)
+            sync_movie_genres((created_ids[movie.title], movie.genres) for movie in new_movies
+                              if movie.title in created_ids)
+        for index, item in list(valid.items()):
+            missing = [movie["title"] for movie in item["movies"] if movie["title"] not in movie_ids]
+            if missing:
+                # e.g. a uuid that belongs to a movie with another title
+                reject(index, {"movies": ["movie {} could not be created".format(title) for title in missing]})
+
+        while True:
+            try:
+                with transaction.atomic():
+                    collections = Collection.objects.bulk_create(
+                        [Collection(title=item["title"], description=item["description"], user_id=item["user"])
+                         for item in valid.values()], batch_size=batch_size)
+                break
+            except IntegrityError:
+                # a concurrent request created one of the titles after they were checked
+                raced = taken_titles(valid.values(), batch_size)
+                raced_indexes = [index for index, item in valid.items() if (item["user"], item["title"]) in raced]
+                if not raced_indexes:
+                    raise
+                for index in raced_indexes:
+                    reject(index, {"title": ["the user already has a collection with this title"]})
+        links = []
+        for (index, item), collection in zip(valid.items(), collections):
+            ids = list(dict.fromkeys(movie_ids[movie["title"]] for movie in item["movies"]))
+            links.extend(MovieCollection(collection_id=collection.id, movie_id=movie_id) for movie_id in ids)
+            results[index] = {"index": index, "status": "created", "id": collection.id,
+                              "collection_uuid": str(collection.collection_uuid), "movie_count": len(ids)}
+        MovieCollection.objects.bulk_create(links, batch_size=batch_size)
+        if collections or new_movies:
+            # bulk_create sends no signals
+            invalidate_counts_receiver(Movie if new_movies else Collection)
+    return {"created": len(valid), "failed": len(items) - len(valid),
+            "movies_created": len(created_ids), "results": results}
@@ -0,0 +1,417 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    __slots__ = ('value', 'fresh_until', 'stale_until')
+
+    def __init__(self, value, fresh_until, stale_until):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class TTLCache:
+    """
+    Bounded in-process LRU cache with a time to live and stale-while-revalidate.an entry is fresh for
+    ttl seconds and then stale for another stale_ttl seconds: a stale entry is still served,while a
+    single background refresh per key reloads it.entries older than that are loaded synchronously.
+    """
+
+    def __init__(self, maxsize=256, ttl=60, stale_ttl=300, should_cache=None, clock=time.monotonic,
+                 refresh_workers=4):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.should_cache = should_cache or (lambda value: True)
+        self.clock = clock
+        self.refresh_workers = refresh_workers
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._refresh_tasks = set()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "refreshes": 0, "refresh_errors": 0, "evictions": 0}
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def get_or_load(self, key, loader):
+        """
+        returns the cached value for key,calling loader() on a miss.
+        """
+        if not self.enabled:
+            return loader()
+        found, value = self._lookup(key, lambda: self._get_executor().submit(self._refresh, key, loader))
+        if found:
+            return value
+        value = loader()
+        self.set(key, value)
+        return value
+
+    async def aget_or_load(self, key, loader):
+        """
+        get_or_load for a coroutine function loader,stale entries are refreshed by a task on the running loop.
+        """
+        if not self.enabled:
+            return await loader()
+        found, value = self._lookup(key, lambda: self._start_refresh_task(key, loader))
+        if found:
+            return value
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    def _lookup(self, key, start_refresh):
+        # returns (found, value),calling start_refresh() once per stale key
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.fresh_until:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return True, entry.value
+            if entry is not None and now < entry.stale_until:
+                self._entries.move_to_end(key)
+                self._stats["stale"] += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    start_refresh()
+                return True, entry.value
+            self._stats["misses"] += 1
+        return False, None
+
+    def get(self, key):
+        """
+        returns the cached value even if it is stale,None when there is none.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self.clock() >= entry.stale_until:
+                return None
+            return entry.value
+
+    def set(self, key, value):
+        if not self.enabled or not self.should_cache(value):
+            return
+        now = self.clock()
+        with self._lock:
+            self._entries[key] = CacheEntry(value, now + self.ttl, now + self.ttl + self.stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, size=len(self._entries), maxsize=self.maxsize)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers, thread_name_prefix="cache-refresh")
+        return self._executor
+
+    def _refresh(self, key, loader):
+        try:
+            self._refreshed(key, loader())
+        except Exception as e:
+            self._refresh_failed(key, e)
+
+    def _start_refresh_task(self, key, loader):
+        # the loop only keeps weak references to tasks
+        task = asyncio.get_running_loop().create_task(self._arefresh(key, loader))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _arefresh(self, key, loader):
+        try:
+            self._refreshed(key, await loader())
+        except Exception as e:
+            self._refresh_failed(key, e)
+
+    def _refreshed(self, key, value):
+        self.set(key, value)
+        with self._lock:
+            self._stats["refreshes"] += 1
+            self._refreshing.discard(key)
+
+    def _refresh_failed(self, key, error):
+        with self._lock:
+            self._stats["refresh_errors"] += 1
+            self._refreshing.discard(key)
+        logger.warning("background refresh of %s failed: %s", key, error)
+
+
+class SharedCache:
+    """
+    Disk backed cache shared by all worker processes of a host and kept across restarts.entries live
+    in a local sqlite file in WAL mode,so readers never block each other,with wall clock fresh/stale
+    deadlines like TTLCache.the total size of the values is bounded by max_bytes: expired entries go
+    first,then the least recently accessed ones.connections are opened per process and thread.
+    """
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS cache_entry (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+        "fresh_until REAL NOT NULL, stale_until REAL NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS cache_entry_accessed_at ON cache_entry (accessed_at)",
+    ]
+    # reads refresh accessed_at at most this often,so hot keys do not take the write lock on every hit
+    TOUCH_INTERVAL = 1.0
+    # switching a fresh file to WAL and creating the schema can fail with "database is locked" without
+    # waiting on the busy timeout when several processes open it at once,so those steps are retried
+    RETRY_DELAY = 0.01
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, ttl=60, stale_ttl=300, timeout=5.0, clock=time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.clock = clock
+        self._local = threading.local()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            self._retry_locked(lambda: self._setup(connection))
+        except sqlite3.Error:
+            connection.close()
+            raise
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _setup(self, connection):
+        if connection.execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+            connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            connection.execute(statement)
+
+    def _retry_locked(self, operation):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                return operation()
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or time.monotonic() >= deadline:
+                    raise
+                time.sleep(self.RETRY_DELAY)
+
+    def get(self, key):
+        """
+        returns (value, is_fresh) for key,None when it is missing or past its stale deadline.
+        """
+        if not self.enabled:
+            return None
+        now = self.clock()
+        try:
+            connection = self._connection()
+            row = connection.execute("SELECT value, fresh_until, stale_until, accessed_at FROM cache_entry "
+                                     "WHERE key = ?", (key,)).fetchone()
+            if row is None or now >= row[2]:
+                self._stats["misses"] += 1
+                return None
+            if now - row[3] >= self.TOUCH_INTERVAL:
+                connection.execute("UPDATE cache_entry SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            self._stats["errors"] += 1
+            logger.warning("shared cache read failed: %s", e)
+            return None
+        is_fresh = now < row[1]
+        self._stats["hits" if is_fresh else "stale"] += 1
+        return bytes(row[0]), is_fresh
+
+    def set(self, key, value: bytes):
+        if not self.enabled:
+            return
+        now = self.clock()
+        try:
+            connection = self._connection()
+            self._retry_locked(lambda: connection.execute(
+                "INSERT OR REPLACE INTO cache_entry (key, value, fresh_until, stale_until, size, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, value, now + self.ttl, now + self.ttl + self.stale_ttl, len(value), now)))
+            self._stats["writes"] += 1
+            self._evict(connection, now)
+        except sqlite3.Error as e:
+            self._stats["errors"] += 1
+            logger.warning("shared cache write failed: %s", e)
+
+    def _evict(self, connection, now):
+        evicted = connection.execute("DELETE FROM cache_entry WHERE stale_until <= ?", (now,)).rowcount
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entry").fetchone()[0]
+        if total > self.max_bytes:
+            cutoff = 0
+            for key, size in connection.execute("SELECT key, size FROM cache_entry ORDER BY accessed_at"):
+                total -= size
+                cutoff += 1
+                if total <= self.max_bytes:
+                    break
+            evicted += connection.execute("DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_entry "
+                                          "ORDER BY accessed_at LIMIT ?)", (cutoff,)).rowcount
+        self._stats["evictions"] += evicted
+
+    def clear(self):
+        if self.enabled:
+            self._connection().execute("DELETE FROM cache_entry")
+
+    def stats(self) -> dict:
+        stats = dict(self._stats, path=str(self.path), max_bytes=self.max_bytes)
+        if self.enabled:
+            try:
+                stats["entries"], stats["bytes"] = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entry").fetchone()
+            except sqlite3.Error:
+                pass
+        return stats
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the function and every caller
+    arriving while it runs waits for and shares its result (or exception).with lock_dir set the leader
+    also holds an flock on the lock file of the key,so leaders of different worker processes run one at a
+    time and a later one can find the result in a shared cache instead of calling upstream again.keys
+    share a fixed pool of lock_files files,so the directory does not grow with the number of keys.
+    """
+
+    def __init__(self, lock_dir=None, lock_timeout=30.0, lock_files=64):
+        self.lock_dir = lock_dir if lock_dir and fcntl is not None else None
+        self.lock_timeout = lock_timeout
+        self.lock_files = max(1, lock_files)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "followers": 0, "lock_waits": 0, "lock_timeouts": 0}
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+            else:
+                self._stats["followers"] += 1
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            with self._file_lock(key):
+                call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    @contextmanager
+    def _file_lock(self, key):
+        if not self.lock_dir:
+            yield
+            return
+        # files are never unlinked,a worker could still be waiting on the old one while another locks a new one
+        slot = int(hashlib.sha1(str(key).encode()).hexdigest(), 16) % self.lock_files
+        path = os.path.join(self.lock_dir, "{}.lock".format(slot))
+        descriptor = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+        locked = False
+        try:
+            deadline = time.monotonic() + self.lock_timeout
+            while True:
+                try:
+                    fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        # a stuck worker must not stall everyone else,go ahead without the lock
+                        self._stats["lock_timeouts"] += 1
+                        break
+                    self._stats["lock_waits"] += 1
+                    time.sleep(0.01)
+            yield
+        finally:
+            if locked:
+                fcntl.flock(descriptor, fcntl.LOCK_UN)
+            os.close(descriptor)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls), lock_dir=self.lock_dir)
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines: the first caller starts the function as a task and every caller
+    arriving on the same event loop while it runs awaits that task's result (or exception) instead of
+    starting another call.each caller awaits the task through a shield,so a cancelled caller,the
+    first one included,stops waiting without cancelling the load for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    async def do(self, key, function):
+        loop = asyncio.get_running_loop()
+        # tasks belong to the loop that created them
+        call_key = (id(loop), key)
+        task = self._calls.get(call_key)
+        if task is not None:
+            self._stats["followers"] += 1
+        else:
+            self._stats["leaders"] += 1
+            task = self._calls[call_key] = asyncio.ensure_future(function())
+            task.add_done_callback(lambda done: self._finished(call_key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, call_key, task):
+        del self._calls[call_key]
+        # nobody may be waiting,which must not be reported as an unretrieved exception
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return dict(self._stats, in_flight=len(self._calls))
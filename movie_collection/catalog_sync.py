@@ -0,0 +1,149 @@
+import math
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.db import transaction
+from django.utils import timezone
+
+from .constants import Constant
+from .counts import invalidate_counts_receiver
+from .genres import sync_movie_genres
+from .models import Movie, MovieSyncCheckpoint
+from .utilities import get_retry_session
+from user_collections.settings import env
+
+CHECKPOINT_NAME = 'movies'
+SYNCED_FIELDS = ('title', 'description', 'genres')
+
+
+def fetch_catalog_page(page) -> dict:
+    """
+    one page of the movie api catalog,raises a requests exception for errors and non 2xx answers.
+    """
+    response = get_retry_session().get(env(Constant.MOVIE_API_URL), params={"page": page}, verify=False)
+    response.raise_for_status()
+    return response.json()
+
+
+def iter_catalog_pages(first_page, last_page, workers=4):
+    """
+    yields (page, payload) for first_page..last_page in page order while up to `workers` pages are
+    fetched in parallel.at most 2 * workers fetched pages are held,so the catalog is streamed.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="movie-sync") as executor:
+        pending = deque()
+        next_page = first_page
+        try:
+            while pending or next_page <= last_page:
+                while next_page <= last_page and len(pending) < 2 * workers:
+                    pending.append((next_page, executor.submit(fetch_catalog_page, next_page)))
+                    next_page += 1
+                page, future = pending.popleft()
+                yield page, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def _catalog_movie(item) -> dict:
+    return {"uuid": uuid.UUID(str(item["uuid"])), "title": item.get("title") or "",
+            "description": item.get("description") or "", "genres": item.get("genres") or None}
+
+
+def upsert_movies(items) -> dict:
+    """
+    inserts or updates movie api items in Movie with one statement keyed on uuid.rows whose fields did
+    not change are left alone,and items whose title already belongs to another movie are skipped,
+    because titles are unique.
+    """
+    result = {"created": 0, "updated": 0, "unchanged": 0, "conflicts": 0}
+    movies = {}
+    for item in items:
+        movie = _catalog_movie(item)
+        movies[movie["uuid"]] = movie
+    existing = {row["uuid"]: row for row in Movie.objects.filter(uuid__in=list(movies)).values("uuid", *SYNCED_FIELDS)}
+    taken_titles = dict(Movie.objects.filter(title__in=[movie["title"] for movie in movies.values()])
+                        .values_list("title", "uuid"))
+    to_write = []
+    for movie in movies.values():
+        current = existing.get(movie["uuid"])
+        if current is not None and all(current[field] == movie[field] for field in SYNCED_FIELDS):
+            result["unchanged"] += 1
+            continue
+        if taken_titles.get(movie["title"], movie["uuid"]) != movie["uuid"]:
+            result["conflicts"] += 1
+            continue
+        taken_titles[movie["title"]] = movie["uuid"]
+        result["updated" if current is not None else "created"] += 1
+        to_write.append(Movie(**movie))
+    if to_write:
+        Movie.objects.bulk_create(to_write, batch_size=len(to_write), update_conflicts=True, unique_fields=["uuid"],
+                                  update_fields=list(SYNCED_FIELDS) + ["updated_at"])
+        sync_movie_genres(Movie.objects.filter(uuid__in=[movie.uuid for movie in to_write]).values_list("id", "genres"))
+        # bulk_create sends no post_save
+        invalidate_counts_receiver(Movie)
+    return result
+
+
+def sync_movie_catalog(workers=4, batch_size=500, max_pages=None, restart=False, progress=None) -> dict:
+    """
+    pages through the movie api catalog and upserts it into Movie in batches of about batch_size
+    movies.the checkpoint is advanced in the transaction of each batch,so a failed or stopped sync
+    resumes after the last written page.a finished pass resets it and the next run is an incremental
+    pass that only writes new and changed movies.max_pages stops after that many pages.
+    """
+    checkpoint, _ = MovieSyncCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+    if restart:
+        checkpoint.next_page = 1
+    try:
+        payload = fetch_catalog_page(checkpoint.next_page)
+    except requests.exceptions.HTTPError as e:
+        # the catalog shrank below the checkpoint since the interrupted run
+        if checkpoint.next_page == 1 or e.response is None or e.response.status_code != 404:
+            raise
+        checkpoint.next_page = 1
+        payload = fetch_catalog_page(1)
+    first_page = checkpoint.next_page
+    result = {"resumed_from": first_page if first_page > 1 else None, "pages": 0, "created": 0, "updated": 0,
+              "unchanged": 0, "conflicts": 0, "completed": False}
+    if first_page == 1:
+        checkpoint.started_at = timezone.now()
+    checkpoint.page_size = checkpoint.page_size or len(payload["results"]) or 1
+    checkpoint.total_pages = max(math.ceil(payload["count"] / checkpoint.page_size), first_page)
+    checkpoint.save()
+    last_page = checkpoint.total_pages
+    if max_pages is not None:
+        last_page = min(last_page, first_page + max_pages - 1)
+
+    def pages():
+        yield first_page, payload
+        if first_page < last_page:
+            yield from iter_catalog_pages(first_page + 1, last_page, workers=workers)
+
+    batch = []
+    for page, page_payload in pages():
+        batch.extend(page_payload["results"])
+        result["pages"] += 1
+        if len(batch) >= batch_size or page == last_page:
+            _write_batch(checkpoint, batch, page + 1, result)
+            batch = []
+            if progress is not None:
+                progress(page, checkpoint.total_pages, result)
+
+    if last_page == checkpoint.total_pages:
+        checkpoint.next_page = 1
+        checkpoint.completed_at = timezone.now()
+        checkpoint.save()
+        result["completed"] = True
+    return result
+
+
+def _write_batch(checkpoint, items, next_page, result):
+    with transaction.atomic():
+        counts = upsert_movies(items)
+        checkpoint.next_page = next_page
+        checkpoint.save()
+    for key, count in counts.items():
+        result[key] += count
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import deque
+
+import requests
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """
+    raised instead of calling upstream while the circuit is open.it is a RequestException,so callers
+    that already fall back to cached data on upstream errors do so here as well.
+    """
+
+    def __init__(self, retry_after=None):
+        self.retry_after = retry_after
+        super(CircuitOpenError, self).__init__("movie api circuit is open,retry in {:.0f}s".format(retry_after or 0))
+
+
+class CircuitBreaker:
+    """
+    Rolling window circuit breaker.the outcome of the last `window` calls is kept,and once at least
+    min_calls are recorded the circuit opens when the share of failed calls reaches failure_rate or the
+    share of calls slower than slow_call_seconds reaches slow_call_rate.an open circuit rejects calls
+    for open_seconds,then lets half_open_calls trial calls through: success closes it again,any
+    failure opens it for another open_seconds.trial slots whose outcome was never recorded are given
+    out again after open_seconds,so a lost trial cannot keep the circuit half open for good.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate=0.5, slow_call_seconds=5.0, slow_call_rate=0.8, window=20, min_calls=5,
+                 open_seconds=30.0, half_open_calls=1, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._trial_calls = 0
+        self._trials_started_at = None
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    def before_call(self):
+        """
+        raises CircuitOpenError when the call must not go upstream.
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.open_seconds - self.clock()
+                if remaining > 0:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpenError(retry_after=remaining)
+                self.state = self.HALF_OPEN
+                self._trial_calls = 0
+            if self.state == self.HALF_OPEN:
+                now = self.clock()
+                if self._trial_calls and now - self._trials_started_at >= self.open_seconds:
+                    self._trial_calls = 0
+                if self._trial_calls >= self.half_open_calls:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpenError(retry_after=self._trials_started_at + self.open_seconds - now)
+                if not self._trial_calls:
+                    self._trials_started_at = now
+                self._trial_calls += 1
+
+    def record(self, success: bool, duration: float):
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["failures"] += int(not success)
+            self._stats["slow_calls"] += int(slow)
+            if self.state == self.HALF_OPEN:
+                if success and not slow:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append((success, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+            failures = sum(1 for outcome_success, _ in self._outcomes if not outcome_success)
+            slow_calls = sum(1 for _, outcome_slow in self._outcomes if outcome_slow)
+            if failures / len(self._outcomes) >= self.failure_rate or \
+                    slow_calls / len(self._outcomes) >= self.slow_call_rate:
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+        self._stats["opened"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, state=self.state)
@@ -0,0 +1,99 @@
+import contextvars
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+
+
+class RequestContext:
+    """
+    per request tracking state.it lives on the request and in a context variable instead of on the
+    middleware instance,because one middleware instance is shared by every request of a worker.
+    """
+    SERVER_TIMING_DESCRIPTIONS = {
+        "db": "database",
+        "serialize": "serialization",
+        "upstream": "movie api",
+        "app": "application",
+        "total": "total",
+    }
+
+    def __init__(self):
+        self.request_id = str(uuid.uuid4())
+        self.start = time.perf_counter()
+        self.query_counter = None
+        self.meta_data = {}
+        self.timings = defaultdict(float)
+        self._timing_stack = []
+
+    def elapsed(self) -> timedelta:
+        return timedelta(seconds=time.perf_counter() - self.start)
+
+    @contextmanager
+    def measure(self, name):
+        """
+        adds the time spent in the block to timings[name].time is exclusive: while a nested block
+        runs (e.g. a query issued from a serializer) the enclosing block is paused.
+        """
+        now = time.perf_counter()
+        if self._timing_stack:
+            parent = self._timing_stack[-1]
+            self.timings[parent[0]] += now - parent[1]
+        self._timing_stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            current = self._timing_stack.pop()
+            self.timings[current[0]] += now - current[1]
+            if self._timing_stack:
+                self._timing_stack[-1][1] = now
+
+    def server_timing(self, total: timedelta) -> str:
+        """
+        builds a Server-Timing header value,everything not measured explicitly is reported as app.
+        """
+        total_ms = total.total_seconds() * 1000
+        metrics = [(name, seconds * 1000) for name, seconds in self.timings.items()]
+        metrics.append(("app", max(total_ms - sum(duration for _, duration in metrics), 0)))
+        metrics.append(("total", total_ms))
+        return ", ".join('{};dur={:.2f};desc="{}"'.format(name, duration, self.SERVER_TIMING_DESCRIPTIONS.get(name, name))
+                         for name, duration in metrics)
+
+
+_request_context = contextvars.ContextVar("request_context", default=None)
+
+
+def get_request_context():
+    """
+    returns the RequestContext of the request being served,None outside of a request.
+    """
+    return _request_context.get()
+
+
+def activate_request_context(context: RequestContext):
+    return _request_context.set(context)
+
+
+def deactivate_request_context(token):
+    _request_context.reset(token)
+
+
+def measure(name):
+    """
+    times a block against the current request,does nothing outside of a request.
+    """
+    context = get_request_context()
+    if context is None:
+        return nullcontext()
+    return context.measure(name)
+
+
+def annotate(key, value):
+    """
+    adds value to the meta_data stored with the request log of the current request.
+    """
+    context = get_request_context()
+    if context is not None:
+        context.meta_data[key] = value
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections, transaction
+
+from .models import Collection, Movie
+
+logger = logging.getLogger(__name__)
+
+
+def _generation_key(model):
+    return "count-generation:{}".format(model._meta.label_lower)
+
+
+def _bump_generation(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def invalidate_counts(model):
+    """
+    drops every cached count of model's table by moving it to a new generation once the current
+    transaction commits,so no count is cached under the new generation before the write is visible
+    to other connections,and a rolled back write keeps the counts.with a cache shared by the workers
+    (e.g. redis) this is seen by all of them,with the default per process cache the other workers
+    keep their counts for up to COUNT_CACHE_TTL seconds.
+    """
+    key = _generation_key(model)
+    transaction.on_commit(lambda: _bump_generation(key))
+
+
+def count_cache_key(queryset):
+    """
+    cache key of the count of queryset: its model,the table generation and a hash of the count sql,
+    which includes the user scope,filters and search of the request.
+    """
+    sql, params = queryset.values('pk').query.sql_with_params()
+    digest = hashlib.sha1(json.dumps([sql, [str(param) for param in params]]).encode()).hexdigest()
+    generation = cache.get_or_set(_generation_key(queryset.model), 0, timeout=None)
+    return "count:{}:{}:{}".format(queryset.model._meta.label_lower, generation, digest)
+
+
+def estimate_count(queryset):
+    """
+    row count estimate from table statistics,None when there is none for this queryset.postgresql
+    estimates any query from its plan,on sqlite only unfiltered querysets are estimated,from the
+    sqlite_stat1 table written by ANALYZE.without statistics the exact count is used.
+    """
+    connection = connections[queryset.db]
+    try:
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.values('pk').query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+        if connection.vendor != 'sqlite' or queryset.query.has_filters() or queryset.query.distinct:
+            return None
+        table = queryset.model._meta.db_table
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+                row = cursor.fetchone()
+            except DatabaseError:
+                row = None
+            return int(row[0].split()[0]) if row is not None else None
+    except DatabaseError as e:
+        logger.warning("count estimate failed: %s", e)
+        return None
+
+
+def count_queryset(queryset):
+    """
+    (count, exact) for a paginated queryset: an estimate when that is at least COUNT_ESTIMATE_THRESHOLD
+    rows,else the exact count.both are cached for COUNT_CACHE_TTL seconds or until the table is written to.
+    """
+    key = count_cache_key(queryset) if settings.COUNT_CACHE_TTL else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return tuple(cached)
+    result = None
+    if settings.COUNT_ESTIMATE_THRESHOLD:
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate >= settings.COUNT_ESTIMATE_THRESHOLD:
+            result = (estimate, False)
+    if result is None:
+        result = (queryset.values('pk').count(), True)
+    if key is not None:
+        cache.set(key, result, timeout=settings.COUNT_CACHE_TTL)
+    return result
+
+
+def invalidate_counts_receiver(sender, **kwargs):
+    """
+    post_save/post_delete receiver of Collection and Movie and m2m_changed receiver of
+    Collection.movies.collections are filtered by the genres of their movies,so movie writes drop
+    the collection counts as well.
+    """
+    action = kwargs.get("action")
+    if action is not None and not action.startswith("post_"):
+        return
+    if sender is Movie:
+        invalidate_counts(Movie)
+    invalidate_counts(Collection)
@@ -0,0 +1,43 @@
+import csv
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class Echo:
+    """
+    file-like object whose write returns the value instead of buffering it,so csv.writer rows can be
+    streamed one at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_json(rows, serializer):
+    yield "["
+    for index, row in enumerate(rows):
+        yield ("," if index else "") + json.dumps(serializer.to_representation(row), cls=JSONEncoder)
+    yield "]"
+
+
+def stream_ndjson(rows, serializer):
+    for row in rows:
+        yield json.dumps(serializer.to_representation(row), cls=JSONEncoder) + "\n"
+
+
+def stream_csv(rows, serializer):
+    writer = csv.writer(Echo())
+    field_names = list(serializer.fields)
+    yield writer.writerow(field_names)
+    for row in rows:
+        data = serializer.to_representation(row)
+        yield writer.writerow([json.dumps(data[field], cls=JSONEncoder) if isinstance(data[field], (dict, list))
+                               else data[field] for field in field_names])
+
+
+EXPORT_FORMATS = {
+    "json": (stream_json, "application/json"),
+    "ndjson": (stream_ndjson, "application/x-ndjson"),
+    "csv": (stream_csv, "text/csv"),
+}
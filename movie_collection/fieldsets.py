@@ -0,0 +1,108 @@
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from .models import Movie
+
+COLLECTION_FIELDS = ("id", "user", "movies", "title", "description", "created_at", "updated_at",
+                     "collection_uuid", "is_success")
+# computed in place of the nested movies
+SLIM_FIELDS = ("movie_count", "movie_uuids")
+# the fields of the nested user and movies of a collection,in the order they are rendered
+USER_FIELDS = ("id", "username", "email", "password", "first_name", "last_name", "is_superuser", "is_staff",
+               "is_active")
+MOVIE_FIELDS = ("id", "uuid", "title", "description", "genres", "created_at", "updated_at")
+EXPANDABLE = {"user": USER_FIELDS, "movies": MOVIE_FIELDS}
+
+
+class FieldSelection:
+    """
+    the collection fields of a request: ?fields=id,title,movies.title,user.username picks fields,with
+    dotted names for fields of user and movies,?expand=user,movies nests those as objects instead of
+    ids and ?view=slim replaces the movies with movie_count and movie_uuids.the selection prunes both
+    the serializer fields and the columns loaded by the queryset and its prefetches.
+    """
+    fields_query_param = "fields"
+    expand_query_param = "expand"
+    view_query_param = "view"
+
+    def __init__(self, fields=None, expand=(), slim=False):
+        self.nested = {name: None for name in EXPANDABLE}
+        top = []
+        for name in fields or COLLECTION_FIELDS:
+            relation, _, field = name.partition(".")
+            if field:
+                if relation not in EXPANDABLE or field not in EXPANDABLE[relation]:
+                    raise ValidationError({self.fields_query_param: "unknown field {}".format(name)})
+                self.nested[relation] = (self.nested[relation] or []) + [field]
+                expand = set(expand) | {relation}
+            elif name not in COLLECTION_FIELDS + SLIM_FIELDS:
+                raise ValidationError({self.fields_query_param: "unknown field {}".format(name)})
+            if relation not in top:
+                top.append(relation)
+        unknown = set(expand) - set(EXPANDABLE)
+        if unknown:
+            raise ValidationError({self.expand_query_param: "only {} can be expanded".format(",".join(EXPANDABLE))})
+        if slim and "movies" in top:
+            top[top.index("movies"):top.index("movies") + 1] = [name for name in SLIM_FIELDS if name not in top]
+        self.fields = top
+        self.expand = set(expand)
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        the selection of the request,None without any of the parameters,which keeps the full shape.
+        """
+        params = request.query_params
+        view = params.get(cls.view_query_param)
+        if view not in (None, "", "full", "slim"):
+            raise ValidationError({cls.view_query_param: "must be full or slim"})
+        fields, expand = params.get(cls.fields_query_param), params.get(cls.expand_query_param)
+        if fields is None and expand is None and view != "slim":
+            return None
+        return cls(fields=cls._split(fields) or None, expand=cls._split(expand), slim=view == "slim")
+
+    @staticmethod
+    def _split(value):
+        return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+    def nested_fields(self, relation):
+        return self.nested[relation] or list(EXPANDABLE[relation])
+
+    def prune(self, queryset):
+        """
+        loads only the columns and relations the selected fields need.
+        """
+        columns = {"id", "user"} | {name for name in self.fields if name in COLLECTION_FIELDS and name != "movies"}
+        queryset = queryset.only(*columns).prefetch_related(None)
+        if "user" in self.fields and "user" in self.expand:
+            queryset = queryset.prefetch_related(
+                Prefetch("user", queryset=User.objects.only(*set(self.nested_fields("user")) | {"id"})))
+        if "movies" in self.fields and "movies" in self.expand:
+            queryset = queryset.prefetch_related(
+                Prefetch("movies", queryset=Movie.objects.only(*set(self.nested_fields("movies")) | {"id"})))
+        elif "movies" in self.fields or set(SLIM_FIELDS) & set(self.fields):
+            queryset = queryset.prefetch_related(Prefetch("movies", queryset=Movie.objects.only("id", "uuid")))
+        return queryset
+
+    def apply(self, serializer, user_serializer_class, movie_serializer_class):
+        """
+        drops the unselected fields of a collection serializer and swaps the relations that are not
+        expanded for their ids.
+        """
+        for name in list(serializer.fields):
+            if name not in self.fields:
+                serializer.fields.pop(name)
+        if "user" in self.fields:
+            serializer.fields["user"] = (user_serializer_class(fields=self.nested_fields("user"))
+                                         if "user" in self.expand else serializers.PrimaryKeyRelatedField(read_only=True))
+        if "movies" in self.fields:
+            serializer.fields["movies"] = (movie_serializer_class(many=True, read_only=True, fields=self.nested_fields("movies"))
+                                           if "movies" in self.expand
+                                           else serializers.PrimaryKeyRelatedField(many=True, read_only=True))
+        if "movie_count" in self.fields:
+            serializer.fields["movie_count"] = serializers.IntegerField(source="movies.count", read_only=True)
+        if "movie_uuids" in self.fields:
+            serializer.fields["movie_uuids"] = serializers.SlugRelatedField(source="movies", slug_field="uuid",
+                                                                            many=True, read_only=True)
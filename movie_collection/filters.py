@@ -0,0 +1,82 @@
+from django_filters import rest_framework as filters
+from rest_framework.filters import BaseFilterBackend
+
+from .genres import collections_with_genres, movies_in_genres
+from .models import Collection, LatencyRollup, Movie, RequestCountRollup, RequestData
+from .search import search_movies
+
+
+class RequestCountRollupFilter(filters.FilterSet):
+    start = filters.IsoDateTimeFilter(field_name='bucket_start', lookup_expr='gte')
+    end = filters.IsoDateTimeFilter(field_name='bucket_start', lookup_expr='lt')
+    path = filters.CharFilter(field_name='path')
+    method = filters.CharFilter(field_name='method', lookup_expr='iexact')
+    status = filters.CharFilter(field_name='response_status')
+    user = filters.NumberFilter(field_name='user')
+    node_id = filters.CharFilter(field_name='node_id')
+
+    class Meta:
+        model = RequestCountRollup
+        fields = []
+
+
+class LatencyRollupFilter(filters.FilterSet):
+    start = filters.IsoDateTimeFilter(field_name='bucket_start', lookup_expr='gte')
+    end = filters.IsoDateTimeFilter(field_name='bucket_start', lookup_expr='lt')
+    path = filters.CharFilter(field_name='path')
+    method = filters.CharFilter(field_name='method', lookup_expr='iexact')
+    node_id = filters.CharFilter(field_name='node_id')
+
+    class Meta:
+        model = LatencyRollup
+        fields = []
+
+
+class RequestDataFilter(filters.FilterSet):
+    start = filters.IsoDateTimeFilter(field_name='request_time', lookup_expr='gte')
+    end = filters.IsoDateTimeFilter(field_name='request_time', lookup_expr='lt')
+    path = filters.CharFilter(field_name='path')
+    method = filters.CharFilter(field_name='method', lookup_expr='iexact')
+    status = filters.CharFilter(field_name='response_status')
+    node_id = filters.CharFilter(field_name='node_id')
+    request_type = filters.CharFilter(field_name='request_type')
+
+    class Meta:
+        model = RequestData
+        fields = []
+
+
+class MovieFilter(filters.FilterSet):
+    genre = filters.CharFilter(method='filter_genre', help_text="comma separated,movies in any of the genres")
+
+    class Meta:
+        model = Movie
+        fields = []
+
+    def filter_genre(self, queryset, name, value):
+        return queryset.filter(id__in=movies_in_genres(value))
+
+
+class CollectionFilter(filters.FilterSet):
+    genre = filters.CharFilter(method='filter_genre', help_text="comma separated,collections with a movie in any of the genres")
+
+    class Meta:
+        model = Collection
+        fields = []
+
+    def filter_genre(self, queryset, name, value):
+        return queryset.filter(id__in=collections_with_genres(value))
+
+
+class MovieSearchFilter(BaseFilterBackend):
+    """
+    ?q= search of movie titles and descriptions,every word is matched as a prefix and the best match
+    comes first.see search.search_movies.
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_movies(queryset, query)
@@ -0,0 +1,97 @@
+from collections import defaultdict
+
+from django.db.models import Count, Q
+
+from .models import Genre, MovieCollection, MovieGenre
+
+
+def parse_genres(value) -> list:
+    """
+    genre names of a comma separated Movie.genres value,stripped and without (case insensitive) duplicates.
+    """
+    names, seen = [], set()
+    for name in (value or "").split(","):
+        name = name.strip()[:100]
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            names.append(name)
+    return names
+
+
+def get_genre_ids(names) -> dict:
+    """
+    ids of the genres with the given names by lower cased name,missing genres are created.
+    """
+    wanted = {name.lower(): name for name in names}
+    if not wanted:
+        return {}
+    condition = Q()
+    for name in wanted.values():
+        condition |= Q(name__iexact=name)
+    genre_ids = {name.lower(): genre_id for genre_id, name in Genre.objects.filter(condition).values_list("id", "name")}
+    missing = [name for key, name in wanted.items() if key not in genre_ids]
+    if missing:
+        Genre.objects.bulk_create([Genre(name=name) for name in missing], ignore_conflicts=True)
+        genre_ids.update({name.lower(): genre_id for genre_id, name in
+                          Genre.objects.filter(name__in=missing).values_list("id", "name")})
+    return genre_ids
+
+
+def sync_movie_genres(movies):
+    """
+    brings movie_genre in line with Movie.genres for (movie id, genres) pairs,in a fixed number of
+    queries however many movies are passed.called on save and by the bulk writes of movies,a
+    QuerySet.update() of genres has to call it as well.
+    """
+    movies = dict(movies)
+    if not movies:
+        return
+    parsed = {movie_id: parse_genres(genres) for movie_id, genres in movies.items()}
+    genre_ids = get_genre_ids([name for names in parsed.values() for name in names])
+    wanted = {(movie_id, genre_ids[name.lower()]) for movie_id, names in parsed.items() for name in names}
+    current = set(MovieGenre.objects.filter(movie_id__in=list(movies)).values_list("movie_id", "genre_id"))
+    stale = defaultdict(list)
+    for movie_id, genre_id in current - wanted:
+        stale[genre_id].append(movie_id)
+    if stale:
+        condition = Q()
+        for genre_id, movie_ids in stale.items():
+            condition |= Q(genre_id=genre_id, movie_id__in=movie_ids)
+        MovieGenre.objects.filter(condition).delete()
+    if wanted - current:
+        MovieGenre.objects.bulk_create([MovieGenre(movie_id=movie_id, genre_id=genre_id)
+                                        for movie_id, genre_id in wanted - current], ignore_conflicts=True)
+
+
+def movies_in_genres(value):
+    """
+    values("movie_id") subquery of the movies in any of the comma separated genres of value,case insensitive.
+    """
+    condition = Q()
+    for name in parse_genres(value):
+        condition |= Q(genre__name__iexact=name)
+    if not condition:
+        return MovieGenre.objects.none().values("movie_id")
+    return MovieGenre.objects.filter(condition).values("movie_id")
+
+
+def collections_with_genres(value):
+    return MovieCollection.objects.filter(movie_id__in=movies_in_genres(value)).values("collection_id")
+
+
+def genre_counts(movie_ids):
+    """
+    [{"genre": name, "count": movies}] for the movies selected by movie_ids (a values("id") queryset
+    or a list),most common first,counted in one grouped query.
+    """
+    rows = (MovieGenre.objects.filter(movie_id__in=movie_ids).values("genre__name")
+            .annotate(count=Count("movie_id", distinct=True)).order_by("-count", "genre__name"))
+    return [{"genre": row["genre__name"], "count": row["count"]} for row in rows]
+
+
+def movie_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    post_save receiver of Movie.
+    """
+    if update_fields is None or "genres" in update_fields:
+        sync_movie_genres([(instance.id, instance.genres)])
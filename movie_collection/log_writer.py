@@ -0,0 +1,268 @@
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.utils.dateparse import parse_duration
+
+from .aggregates import get_rollup_buffer, record_rollups
+from .models import RequestData
+
+logger = logging.getLogger(__name__)
+
+
+def write_request_logs(records):
+    """
+    writes a batch of request tracking dicts to requests_tracking in one bulk insert and adds them to
+    the request count rollups once they are written,so a batch that fails and is written again is
+    counted once.
+    """
+    with transaction.atomic():
+        RequestData.objects.bulk_create([RequestData(**record) for record in records], batch_size=len(records))
+    record_rollups(records)
+
+
+class RequestLogWriter:
+    """
+    Buffered sink for request tracking records.records are put on a bounded in-process queue and a
+    background thread writes them in batches,either when batch_size records are waiting or when the
+    oldest waiting record is flush_interval seconds old.when the queue is full the backpressure policy
+    decides what happens: drop the record, block the caller for up to block_timeout seconds, or spill
+    the record to a json lines file which is replayed once the queue has room again.retention is not
+    run here but by the prune_request_logs command.
+    """
+    DROP = 'drop'
+    BLOCK = 'block'
+    SPILL = 'spill'
+    POLICIES = (DROP, BLOCK, SPILL)
+
+    def __init__(self, max_queue_size=10000, batch_size=500, flush_interval=1.0, policy=DROP,
+                 spill_path=None, block_timeout=1.0, asynchronous=True, sink=write_request_logs):
+        if policy not in self.POLICIES:
+            raise ValueError("backpressure policy must be one of {}".format(", ".join(self.POLICIES)))
+        if policy == self.SPILL and not spill_path:
+            raise ValueError("spill_path is required for the spill backpressure policy")
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.spill_path = spill_path
+        self.block_timeout = block_timeout
+        self.asynchronous = asynchronous
+        self.sink = sink
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "spilled": 0, "failed": 0}
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @classmethod
+    def from_settings(cls):
+        return cls(max_queue_size=settings.REQUEST_LOG_MAX_QUEUE_SIZE,
+                   batch_size=settings.REQUEST_LOG_BATCH_SIZE,
+                   flush_interval=settings.REQUEST_LOG_FLUSH_INTERVAL,
+                   policy=settings.REQUEST_LOG_BACKPRESSURE,
+                   spill_path=settings.REQUEST_LOG_SPILL_PATH,
+                   block_timeout=settings.REQUEST_LOG_BLOCK_TIMEOUT,
+                   asynchronous=settings.REQUEST_LOG_ASYNC)
+
+    def add(self, record: dict) -> bool:
+        """
+        hands a record to the writer,returns False when the record was dropped.
+        """
+        if not self.asynchronous:
+            self._write([record])
+            return True
+        self._ensure_started()
+        try:
+            if self.policy == self.BLOCK:
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            if self.policy == self.SPILL:
+                self._spill(record)
+                return True
+            self._count("dropped")
+            return False
+        self._count("queued")
+        return True
+
+    def flush(self):
+        """
+        writes everything that is currently buffered,including spilled records.
+        """
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                break
+            self._write(batch)
+        self._replay_spill()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=max(self.flush_interval * 2, 5))
+        self.flush()
+        # after the last batch,the atexit flush of the rollup buffer may already have run
+        self._flush_rollups(force=True)
+
+    def _ensure_started(self):
+        # the flusher thread does not survive a fork,so each worker process starts its own
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="request-log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+            # under steady traffic the queue wait never times out,so spilled records are replayed
+            # whenever the queue has room,not only when it is idle
+            if self.policy == self.SPILL and not self._queue.full():
+                self._replay_spill()
+            self._flush_rollups()
+            close_old_connections()
+
+    @staticmethod
+    def _flush_rollups(force=False):
+        # rollups of quiet periods are written here,busy periods flush them with the log batches
+        try:
+            buffer = get_rollup_buffer()
+            if force:
+                buffer.flush()
+            else:
+                buffer.flush_if_due()
+        except Exception as e:
+            logger.error("failed to write request rollups: %s", e)
+
+    def _collect_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _count(self, name, amount=1):
+        # request threads and the writer thread update the counters concurrently
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def _write(self, batch) -> bool:
+        """
+        hands a batch to the sink,returns False when it failed.
+        """
+        with self._write_lock:
+            try:
+                self.sink(batch)
+            except Exception as e:
+                self._count("failed", len(batch))
+                logger.error("failed to write %s request logs: %s", len(batch), e)
+                return False
+        self._count("written", len(batch))
+        return True
+
+    def _spill(self, record):
+        with self._spill_lock:
+            try:
+                with open(self.spill_path, "a") as spill_file:
+                    spill_file.write(json.dumps(record, cls=DjangoJSONEncoder) + "\n")
+                self._count("spilled")
+            except Exception as e:
+                self._count("dropped")
+                logger.error("failed to spill request log: %s", e)
+
+    def _replay_spill(self):
+        """
+        writes the spilled records in batches.when a batch fails,it and the records after it are put
+        back in the spill file for the next replay instead of being dropped.
+        """
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        processing_path = "{}.{}.processing".format(self.spill_path, os.getpid())
+        with self._spill_lock:
+            try:
+                os.replace(self.spill_path, processing_path)
+            except FileNotFoundError:
+                return
+        with open(processing_path) as spill_file:
+            batch = []
+            for line in spill_file:
+                if not line.strip():
+                    continue
+                batch.append(line)
+                if len(batch) >= self.batch_size:
+                    if not self._write([self._load_spilled(spilled) for spilled in batch]):
+                        self._respill(itertools.chain(batch, spill_file))
+                        break
+                    batch = []
+            else:
+                if batch and not self._write([self._load_spilled(spilled) for spilled in batch]):
+                    self._respill(batch)
+        os.remove(processing_path)
+
+    def _respill(self, lines):
+        with self._spill_lock:
+            with open(self.spill_path, "a") as spill_file:
+                for line in lines:
+                    if line.strip():
+                        spill_file.write(line if line.endswith("\n") else line + "\n")
+
+    @staticmethod
+    def _load_spilled(line):
+        record = json.loads(line)
+        if isinstance(record.get("execution_time"), str):
+            record["execution_time"] = parse_duration(record["execution_time"])
+        return record
+
+
+_request_log_writer = None
+_request_log_writer_lock = threading.Lock()
+
+
+def get_request_log_writer() -> RequestLogWriter:
+    global _request_log_writer
+    if _request_log_writer is None:
+        with _request_log_writer_lock:
+            if _request_log_writer is None:
+                _request_log_writer = RequestLogWriter.from_settings()
+                atexit.register(_request_log_writer.close)
+    return _request_log_writer
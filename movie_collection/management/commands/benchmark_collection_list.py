@@ -0,0 +1,66 @@
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from movie_collection.models import Collection, Movie, MovieCollection
+from movie_collection.serializers import CollectionListSerializer, CollectionRowSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Times a collection list page rendered by CollectionListSerializer and by CollectionRowSerializer,"
+            "on generated collections that are rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--collections", type=int, default=10, help="collections on the page")
+        parser.add_argument("--movies", type=int, default=300, help="movies in each collection")
+        parser.add_argument("--repeat", type=int, default=5, help="runs of each serializer,the best one is reported")
+
+    def handle(self, *args, **options):
+        if min(options["collections"], options["movies"], options["repeat"]) < 1:
+            raise CommandError("--collections, --movies and --repeat must be positive")
+        try:
+            with transaction.atomic():
+                ids = self.generate(options["collections"], options["movies"])
+                serializer = self.best(options["repeat"], lambda: CollectionListSerializer(
+                    Collection.objects.filter(id__in=ids).order_by("-id").prefetch_related("user", "movies"),
+                    many=True).data)
+                rows = self.best(options["repeat"], lambda: CollectionRowSerializer.to_representation(
+                    CollectionRowSerializer.values(Collection.objects.filter(id__in=ids).order_by("-id"))))
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write("{} collections x {} movies: serializer {:.1f} ms,rows {:.1f} ms,{:.1f}x faster".format(
+            options["collections"], options["movies"], serializer * 1000, rows * 1000, serializer / rows))
+
+    @staticmethod
+    def generate(collections, movies):
+        """
+        collections of the benchmark user,each with its own movies.
+        """
+        user = User.objects.create(username="benchmark-{}".format(uuid.uuid4().hex[:12]))
+        prefix = uuid.uuid4().hex[:8]
+        collection_ids = [collection.id for collection in Collection.objects.bulk_create(
+            [Collection(title="collection {}".format(i), description="generated", user=user) for i in range(collections)])]
+        movie_ids = [movie.id for movie in Movie.objects.bulk_create(
+            [Movie(title="{} movie {}".format(prefix, i), description="a plot " * 40, genres="Drama,Comedy")
+             for i in range(collections * movies)])]
+        MovieCollection.objects.bulk_create([MovieCollection(collection_id=collection_id, movie_id=movie_id)
+                                             for index, collection_id in enumerate(collection_ids)
+                                             for movie_id in movie_ids[index * movies:(index + 1) * movies]])
+        return collection_ids
+
+    @staticmethod
+    def best(repeat, render):
+        timings = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            render()
+            timings.append(time.perf_counter() - started_at)
+        return min(timings)
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from movie_collection.retention import FULL_VACUUM, INCREMENTAL_VACUUM, prune_request_logs
+
+
+class Command(BaseCommand):
+    help = ("Deletes request logs outside the retention window in small primary key chunks,"
+            "schedule it from cron to enforce retention.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.REQUEST_LOG_RETENTION_DAYS,
+                            help="keep request logs of the last N days")
+        parser.add_argument("--keep-per-path", type=int, default=settings.REQUEST_LOG_RETENTION_KEEP_PER_PATH,
+                            help="keep the newest N request logs of each path")
+        parser.add_argument("--chunk-size", type=int, default=settings.REQUEST_LOG_RETENTION_CHUNK_SIZE,
+                            help="ids deleted per transaction")
+        parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between chunks")
+        parser.add_argument("--vacuum", choices=[FULL_VACUUM, INCREMENTAL_VACUUM],
+                            help="vacuum the sqlite database afterwards")
+        parser.add_argument("--minute-rollup-days", type=int, default=settings.REQUEST_ROLLUP_MINUTE_RETENTION_DAYS,
+                            help="delete minute rollups older than N days,0 keeps them")
+        parser.add_argument("--dry-run", action="store_true", help="only count the rows that would be deleted")
+
+    def handle(self, *args, **options):
+        if not options["days"] and not options["keep_per_path"] and not options["minute_rollup_days"]:
+            raise CommandError("pass --days, --keep-per-path and/or --minute-rollup-days")
+        result = prune_request_logs(days=options["days"], keep_per_path=options["keep_per_path"],
+                                    chunk_size=options["chunk_size"], vacuum_mode=options["vacuum"],
+                                    dry_run=options["dry_run"], pause=options["pause"],
+                                    minute_rollup_days=options["minute_rollup_days"])
+        if result["dry_run"]:
+            self.stdout.write("{} request logs would be deleted".format(result["deleted_rows"]))
+            return
+        self.stdout.write("deleted {} request logs and {} minute rollups".format(result["deleted_rows"],
+                                                                                 result["deleted_rollups"]))
+        if result["reclaimed_bytes"] is not None:
+            self.stdout.write("reclaimed {} bytes,database file {} -> {} bytes".format(
+                result["reclaimed_bytes"], result["file_bytes_before"], result["file_bytes_after"]))
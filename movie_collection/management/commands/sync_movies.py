@@ -0,0 +1,36 @@
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from movie_collection.catalog_sync import sync_movie_catalog
+
+
+class Command(BaseCommand):
+    help = "Copies the movie api catalog into the movie table,resuming from the last checkpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="pages fetched in parallel")
+        parser.add_argument("--batch-size", type=int, default=500, help="movies upserted per transaction")
+        parser.add_argument("--max-pages", type=int, help="stop after N pages,the next run continues there")
+        parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start at page 1")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--workers and --batch-size must be positive")
+
+        def progress(page, total_pages, result):
+            if options["verbosity"] > 1:
+                self.stdout.write("page {}/{}: {} created,{} updated".format(
+                    page, total_pages, result["created"], result["updated"]))
+
+        try:
+            result = sync_movie_catalog(workers=options["workers"], batch_size=options["batch_size"],
+                                        max_pages=options["max_pages"], restart=options["restart"],
+                                        progress=progress)
+        except requests.exceptions.RequestException as e:
+            raise CommandError("movie api request failed: {},run the command again to resume".format(e))
+        if result["resumed_from"]:
+            self.stdout.write("resumed at page {}".format(result["resumed_from"]))
+        self.stdout.write("synced {} pages: {} created,{} updated,{} unchanged,{} skipped for a title conflict".format(
+            result["pages"], result["created"], result["updated"], result["unchanged"], result["conflicts"]))
+        if not result["completed"]:
+            self.stdout.write("catalog not finished,run the command again to continue")
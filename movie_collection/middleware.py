@@ -1,48 +1,61 @@
 import copy
 import logging
-import uuid
+import time
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
 import re
-from django.db import connection
+from django.utils.functional import LazyObject, empty
 
-from .models import RequestData
+from .context import RequestContext, activate_request_context, deactivate_request_context, get_request_context, \
+    measure
+from .log_writer import get_request_log_writer
 
 
 class MiddlewareAPI:
+    """
+    request tracking middleware,sync and async capable.under ASGI it runs on the event loop,so async
+    views are not pushed through a thread per request: only loading a lazy user and a synchronous (or
+    blocking) request log write are moved off the loop.
+    """
+    sync_capable = True
+    async_capable = True
     ENVIRONMENT = settings.ENVIRONMENT if hasattr(settings, 'ENVIRONMENT') else ''
 
     def __init__(self, get_response):
-        self.start_time = datetime.now()
-        self.flag = True
         self.get_response = get_response
-        self.req_id = str(uuid.uuid4())
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
 
     @classmethod
-    def get_processing_time(cls, start_time, end_time):
-        processing_time = end_time - start_time
-        return processing_time
+    def get_processing_time(cls, context: RequestContext):
+        return context.elapsed()
 
     def process_request(self, request):
-        self.req_id = str(uuid.uuid4())
-        if self.flag:
-            self.start_time = datetime.now()
+        context = RequestContext()
+        context.query_counter = QueryCounter()
+        setattr(request, "request_context", context)
+        return activate_request_context(context)
 
     def process_response(self, request, response, request_body):
-        total_time = self.get_processing_time(
-            start_time=self.start_time, end_time=datetime.now())
+        total_time = self.get_processing_time(request.request_context)
         try:
             new_request_obj = self.build_request_tracking_obj(
                 request, response, total_time, request_body)
             if self.ENVIRONMENT in ['DEV', 'PROD','LOCAL']:
-                RequestData.objects.create(**new_request_obj)
+                get_request_log_writer().add(new_request_obj)
         except Exception as e:
             logging.error(e)
         return response
 
     @staticmethod
     def _get_response_body(response):
+        if response is not None and response.streaming:
+            return 'Streaming content.. ignored'
         if response:
             try:
                 if 'Content-Type' in response:
@@ -66,7 +79,7 @@ class MiddlewareAPI:
         response_body = self._get_response_body(response)
         query_params = copy.deepcopy(request.GET)
         self._convert_datetime_to_str(query_params, request)
-        new_request_obj = {"request_id": self.req_id, "user": user, "path": request.path,
+        new_request_obj = {"request_id": request.request_context.request_id, "user": user, "path": request.path,
                            "ip_address": request.META['REMOTE_ADDR'],
                            "cookies": dict(request.COOKIES),
                            "query_params": query_params,
@@ -82,54 +95,232 @@ class MiddlewareAPI:
                            'execution_time': total_time,
                            'request_time': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
                            "request_type": "incoming",
-                           "query_count": request.query_count}
+                           "query_count": request.query_count,
+                           "meta_data": request.request_context.meta_data or None}
         return new_request_obj
 
+    def inspect_queries(self, request, response):
+        query_counter = request.request_context.query_counter
+        query_inspector = QueryInspector(request, query_counter)
+        query_count = query_counter._count_queries()
+        repeated_queries = query_inspector.detect_n_plus_one()
+        if repeated_queries:
+            query_count['repeated'] = repeated_queries
+        setattr(request, "query_count", query_count)
+        response.headers["Server-Timing"] = request.request_context.server_timing(
+            self.get_processing_time(request.request_context))
+        return query_inspector
+
     def __call__(self, request):
-        connection.queries_log.clear()
+        if self.is_async:
+            return self.__acall__(request)
         request_body = request.body
-        self.process_request(request=request)
-        response = self.get_response(request)
-        query_cls = QueryCounter(_connection=connection)
-        query_count = query_cls._count_queries()
-        setattr(request, "query_count", query_count)
-        self.process_response(request=request, response=response, request_body=request_body)
+        token = self.process_request(request=request)
+        try:
+            with request.request_context.query_counter.counting():
+                response = self.get_response(request)
+            query_inspector = self.inspect_queries(request, response)
+            self.process_response(request=request, response=response, request_body=request_body)
+            query_inspector.check_budget()
+        finally:
+            deactivate_request_context(token)
+        response.headers["processor_node_id"] = settings.NODE_ID
+        return response
+
+    async def __acall__(self, request):
+        request_body = request.body
+        token = self.process_request(request=request)
+        try:
+            with request.request_context.query_counter.counting():
+                response = await self.get_response(request)
+            query_inspector = self.inspect_queries(request, response)
+            if self._log_write_blocks(request):
+                await sync_to_async(self.process_response)(request=request, response=response,
+                                                           request_body=request_body)
+            else:
+                self.process_response(request=request, response=response, request_body=request_body)
+            query_inspector.check_budget()
+        finally:
+            deactivate_request_context(token)
         response.headers["processor_node_id"] = settings.NODE_ID
         return response
 
+    def _log_write_blocks(self, request):
+        """
+        whether process_response may block: a user that is still lazy is loaded from the database,and
+        a synchronous writer inserts right away.the buffered writer only puts the record on its queue,
+        its thread does the inserts in batches.
+        """
+        user = getattr(request, "user", None)
+        if isinstance(user, LazyObject) and user._wrapped is empty:
+            return True
+        if self.ENVIRONMENT not in ['DEV', 'PROD', 'LOCAL']:
+            return False
+        writer = get_request_log_writer()
+        return not writer.asynchronous or writer.policy == writer.BLOCK
+
 
 class QueryCounter:
+    """
+    database instrumentation,called by the count_request_queries execute wrapper.it counts the statements of a
+    request by type and adds up the time spent executing them,so it works with DEBUG turned off and
+    does not need connection.queries.queries are only fingerprinted when N+1 detection is enabled.
+    """
     select_pattern = re.compile(r'^SELECT ', re.IGNORECASE)
     insert_pattern = re.compile(r'^INSERT ', re.IGNORECASE)
     update_pattern = re.compile(r'^UPDATE ', re.IGNORECASE)
     delete_pattern = re.compile(r'\bDELETE\b', re.IGNORECASE)
 
-    def __init__(self, _connection):
-        self.connection = _connection
-
-    def _count_queries(self):
-        counts = {
+    def __init__(self):
+        self.counts = {
             'SELECT': 0,
             'INSERT': 0,
             'UPDATE': 0,
             'DELETE': 0
         }
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+        self.fingerprinting = bool(getattr(settings, "NPLUSONE_THRESHOLD", 0))
+        self.active = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.active:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            with measure("db"):
+                return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self._count_query(sql)
+            if self.fingerprinting:
+                self.fingerprints[fingerprint_sql(sql)] += 1
+
+    def _count_query(self, sql):
+        sql = sql.lstrip()
+        if QueryCounter.select_pattern.match(sql):
+            self.counts['SELECT'] += 1
+        elif QueryCounter.insert_pattern.match(sql):
+            self.counts['INSERT'] += 1
+        elif QueryCounter.update_pattern.match(sql):
+            self.counts['UPDATE'] += 1
+        elif QueryCounter.delete_pattern.search(sql):
+            self.counts['DELETE'] += 1
 
-        if not hasattr(self.connection, 'queries') or not isinstance(self.connection.queries, list):
-            raise ValueError("Connection object must have a 'queries' attribute that is a list.")
-
-        for query in self.connection.queries:
-            if 'sql' not in query:
-                continue
-            sql = query['sql']
-            if QueryCounter.select_pattern.match(sql):
-                counts['SELECT'] += 1
-            elif QueryCounter.insert_pattern.match(sql):
-                counts['INSERT'] += 1
-            elif QueryCounter.update_pattern.match(sql):
-                counts['UPDATE'] += 1
-            elif QueryCounter.delete_pattern.search(sql):
-                counts['DELETE'] += 1
+    @property
+    def total(self):
+        return sum(self.counts.values())
 
+    def _count_queries(self):
+        counts = dict(self.counts)
+        counts['sql_time_ms'] = round(self.sql_time * 1000, 3)
         return counts
 
+    @contextmanager
+    def counting(self):
+        """
+        counts the queries made while the block runs,by this request only.
+        """
+        self.active = True
+        try:
+            yield self
+        finally:
+            self.active = False
+
+
+def count_request_queries(execute, sql, params, many, context):
+    """
+    execute wrapper passing each query to the QueryCounter of the current request.it is found through
+    the request context variable,which sync_to_async carries over,so queries from the worker threads of
+    async views are counted as well.
+    """
+    request_context = get_request_context()
+    if request_context is None or request_context.query_counter is None:
+        return execute(sql, params, many, context)
+    return request_context.query_counter(execute, sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """
+    connection_created receiver installing count_request_queries on every new database connection.
+    """
+    if count_request_queries not in connection.execute_wrappers:
+        # outermost,so execute_wrapper blocks that are open while connecting still pop their own wrapper
+        connection.execute_wrappers.insert(0, count_request_queries)
+
+
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r"\b\d+(?:\.\d+)?\b")
+_placeholder = re.compile(r"%s|\?")
+_value_list = re.compile(r"\((?:\s*\?\s*,)*\s*\?\s*\)")
+_whitespace = re.compile(r"\s+")
+
+
+def fingerprint_sql(sql):
+    """
+    normalises a statement so that queries differing only in their literals or placeholder counts
+    share a fingerprint,e.g. "... WHERE id = 3" and "... WHERE id = %s" both become "... WHERE id = ?".
+    """
+    sql = _string_literal.sub("?", sql)
+    sql = _number_literal.sub("?", sql)
+    sql = _placeholder.sub("?", sql)
+    sql = _value_list.sub("(...)", sql)
+    return _whitespace.sub(" ", sql).strip()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryInspector:
+    """
+    looks at the queries of one finished request.identical fingerprints repeated at least
+    NPLUSONE_THRESHOLD times are reported as N+1 patterns,and the total query count is checked against
+    QUERY_BUDGETS,keyed on "<ViewSet>.<action>" (e.g. "CollectionAPI.list") or on the url name.
+    a blown budget is logged,or raised as QueryBudgetExceeded when QUERY_BUDGET_STRICT is on (tests).
+    """
+
+    def __init__(self, request, query_counter: QueryCounter):
+        self.request = request
+        self.query_counter = query_counter
+
+    @property
+    def view_name(self):
+        resolver_match = getattr(self.request, "resolver_match", None)
+        if resolver_match is None:
+            return self.request.path
+        view_cls = getattr(resolver_match.func, "cls", None)
+        actions = getattr(resolver_match.func, "actions", None) or {}
+        action = actions.get(self.request.method.lower())
+        if view_cls is not None and action:
+            return "{}.{}".format(view_cls.__name__, action)
+        return resolver_match.url_name or resolver_match.view_name
+
+    def detect_n_plus_one(self):
+        threshold = getattr(settings, "NPLUSONE_THRESHOLD", 0)
+        if not threshold:
+            return []
+        repeated = [{"fingerprint": fingerprint, "count": count}
+                    for fingerprint, count in self.query_counter.fingerprints.most_common()
+                    if count >= threshold]
+        for query in repeated:
+            logging.warning("possible N+1 queries in %s: %s executed %s times",
+                            self.view_name, query["fingerprint"], query["count"])
+        return repeated
+
+    def get_budget(self):
+        budgets = getattr(settings, "QUERY_BUDGETS", {})
+        resolver_match = getattr(self.request, "resolver_match", None)
+        for name in [self.view_name, getattr(resolver_match, "url_name", None)]:
+            if name in budgets:
+                return budgets[name]
+        return None
+
+    def check_budget(self):
+        budget = self.get_budget()
+        if budget is None or self.query_counter.total <= budget:
+            return
+        message = "{} executed {} queries,budget is {}".format(self.view_name, self.query_counter.total, budget)
+        if getattr(settings, "QUERY_BUDGET_STRICT", False):
+            raise QueryBudgetExceeded(message)
+        logging.warning(message)
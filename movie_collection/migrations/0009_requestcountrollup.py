@@ -0,0 +1,54 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:47
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Value
+from django.db.models.functions import Coalesce, Trunc
+
+
+def backfill_request_count_rollups(apps, schema_editor):
+    RequestData = apps.get_model('movie_collection', 'RequestData')
+    RequestCountRollup = apps.get_model('movie_collection', 'RequestCountRollup')
+    incoming = RequestData.objects.filter(Q(request_type='incoming') | Q(request_type__isnull=True))
+    for granularity in ['minute', 'hour', 'day']:
+        rows = incoming.annotate(
+            bucket_start=Trunc('request_time', granularity),
+            rollup_status=Coalesce('response_status', Value('')),
+            rollup_user=Coalesce('user', Value(0)),
+            rollup_node_id=Coalesce('node_id', Value('')),
+        ).values('bucket_start', 'path', 'method', 'rollup_status', 'rollup_user', 'rollup_node_id').annotate(
+            count=Count('id')).order_by()
+        RequestCountRollup.objects.bulk_create([
+            RequestCountRollup(granularity=granularity, bucket_start=row['bucket_start'], path=row['path'],
+                               method=row['method'], response_status=row['rollup_status'],
+                               user=row['rollup_user'], node_id=row['rollup_node_id'], count=row['count'])
+            for row in rows.iterator()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_collection', '0008_requestdata_request_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestCountRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('path', models.CharField(max_length=255)),
+                ('method', models.CharField(max_length=50)),
+                ('response_status', models.CharField(blank=True, default='', max_length=255)),
+                ('user', models.IntegerField(default=0)),
+                ('node_id', models.CharField(blank=True, default='', max_length=255)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'requests_tracking_rollup',
+                'indexes': [models.Index(fields=['granularity', 'bucket_start'], name='requests_tr_granula_6e6fea_idx')],
+                'unique_together': {('granularity', 'bucket_start', 'path', 'method', 'response_status', 'user', 'node_id')},
+            },
+        ),
+        migrations.RunPython(backfill_request_count_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:51
+
+from collections import defaultdict
+from datetime import timezone
+
+from django.db import migrations, models
+from django.db.models import Q
+
+# a frozen copy of the bucketing of movie_collection.aggregates when this migration was written,so
+# later changes to that module do not change what the migration does
+
+
+class LatencyHistogram:
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKET_COUNT = 2 ** SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+
+    @classmethod
+    def bucket_index(cls, value):
+        magnitude = value.bit_length() - 1
+        if magnitude < cls.SUB_BUCKET_BITS:
+            return value
+        shift = magnitude - cls.SUB_BUCKET_BITS
+        return (shift + 1) * cls.SUB_BUCKET_COUNT + (value >> shift) - cls.SUB_BUCKET_COUNT
+
+    def record(self, value):
+        value = max(int(value), 0)
+        self.buckets[self.bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def to_json(self):
+        return {str(index): bucket_count for index, bucket_count in self.buckets.items() if bucket_count}
+
+
+def truncate(value, granularity):
+    if granularity == 'minute':
+        return value.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def backfill_latency_rollups(apps, schema_editor):
+    RequestData = apps.get_model('movie_collection', 'RequestData')
+    LatencyRollup = apps.get_model('movie_collection', 'LatencyRollup')
+    histograms = defaultdict(LatencyHistogram)
+    rows = RequestData.objects.filter(Q(request_type='incoming') | Q(request_type__isnull=True),
+                                      execution_time__isnull=False)
+    for row in rows.values('request_time', 'path', 'method', 'node_id', 'execution_time').iterator():
+        request_time = row['request_time']
+        if request_time.tzinfo is None:
+            request_time = request_time.replace(tzinfo=timezone.utc)
+        for granularity in ['minute', 'hour', 'day']:
+            key = (granularity, truncate(request_time, granularity), row['path'], row['method'], row['node_id'] or '')
+            histograms[key].record(row['execution_time'].total_seconds() * 1000000)
+    LatencyRollup.objects.bulk_create([
+        LatencyRollup(granularity=granularity, bucket_start=bucket_start, path=path, method=method, node_id=node_id,
+                      count=histogram.count, total_us=histogram.total, max_us=histogram.maximum,
+                      histogram=histogram.to_json())
+        for (granularity, bucket_start, path, method, node_id), histogram in histograms.items()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_collection', '0009_requestcountrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatencyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('path', models.CharField(max_length=255)),
+                ('method', models.CharField(max_length=50)),
+                ('node_id', models.CharField(blank=True, default='', max_length=255)),
+                ('count', models.BigIntegerField(default=0)),
+                ('total_us', models.BigIntegerField(default=0)),
+                ('max_us', models.BigIntegerField(default=0)),
+                ('histogram', models.JSONField(default=dict)),
+            ],
+            options={
+                'db_table': 'requests_latency_rollup',
+                'indexes': [models.Index(fields=['granularity', 'bucket_start'], name='requests_la_granula_a6a0cb_idx')],
+                'unique_together': {('granularity', 'bucket_start', 'path', 'method', 'node_id')},
+            },
+        ),
+        migrations.RunPython(backfill_latency_rollups, migrations.RunPython.noop),
+    ]
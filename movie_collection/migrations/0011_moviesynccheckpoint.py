@@ -0,0 +1,29 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_collection', '0010_latencyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieSyncCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('next_page', models.IntegerField(default=1)),
+                ('page_size', models.IntegerField(null=True)),
+                ('total_pages', models.IntegerField(null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'movie_sync_checkpoint',
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+import logging
+
+from django.db import migrations, models
+import django.db.models.deletion
+import movie_collection.search
+from django.db.utils import OperationalError
+
+logger = logging.getLogger(__name__)
+
+# external content index over movie.title/description,the triggers keep it in sync with every write
+# to the movie table,including bulk creates and upserts that do not send model signals
+CREATE_STATEMENTS = [
+    "CREATE VIRTUAL TABLE movie_fts USING fts5(title, description, content='movie', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER movie_fts_after_insert AFTER INSERT ON movie BEGIN "
+    "INSERT INTO movie_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER movie_fts_after_delete AFTER DELETE ON movie BEGIN "
+    "INSERT INTO movie_fts(movie_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER movie_fts_after_update AFTER UPDATE OF title, description ON movie BEGIN "
+    "INSERT INTO movie_fts(movie_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO movie_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "INSERT INTO movie_fts(movie_fts) VALUES ('rebuild')",
+]
+DROP_STATEMENTS = [
+    "DROP TRIGGER IF EXISTS movie_fts_after_insert",
+    "DROP TRIGGER IF EXISTS movie_fts_after_delete",
+    "DROP TRIGGER IF EXISTS movie_fts_after_update",
+    "DROP TABLE IF EXISTS movie_fts",
+]
+
+
+def create_movie_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(probe)")
+            cursor.execute("DROP TABLE temp.fts5_probe")
+        except OperationalError:
+            logger.warning("sqlite is built without fts5,movie search falls back to icontains")
+            return
+        for statement in CREATE_STATEMENTS:
+            cursor.execute(statement)
+
+
+def drop_movie_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in DROP_STATEMENTS:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_collection', '0011_moviesynccheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_movie_fts, drop_movie_fts),
+        # unmanaged,only the state of the model that reads the index
+        migrations.CreateModel(
+            name='MovieSearchIndex',
+            fields=[
+                ('movie', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='movie_collection.movie')),
+                ('title', models.TextField()),
+                ('description', models.TextField()),
+                ('document', movie_collection.search.FullTextField(db_column='movie_fts')),
+            ],
+            options={
+                'db_table': 'movie_fts',
+                'managed': False,
+            },
+        ),
+    ]
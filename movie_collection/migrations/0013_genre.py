@@ -0,0 +1,57 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_movie_genres(apps, schema_editor):
+    Movie = apps.get_model('movie_collection', 'Movie')
+    Genre = apps.get_model('movie_collection', 'Genre')
+    MovieGenre = apps.get_model('movie_collection', 'MovieGenre')
+    genre_ids = {}
+    rows = []
+    for movie_id, genres in Movie.objects.exclude(genres__isnull=True).exclude(genres='').values_list('id', 'genres').iterator():
+        seen = set()
+        for name in genres.split(','):
+            name = name.strip()[:100]
+            if not name or name.lower() in seen:
+                continue
+            seen.add(name.lower())
+            if name.lower() not in genre_ids:
+                genre_ids[name.lower()] = Genre.objects.create(name=name).id
+            rows.append(MovieGenre(movie_id=movie_id, genre_id=genre_ids[name.lower()]))
+    MovieGenre.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_collection', '0012_movie_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'db_table': 'genre',
+            },
+        ),
+        migrations.CreateModel(
+            name='MovieGenre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movie_genres', to='movie_collection.genre')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movie_genres', to='movie_collection.movie')),
+            ],
+            options={
+                'db_table': 'movie_genre',
+                'indexes': [models.Index(fields=['genre', 'movie'], name='movie_genre_genre_i_c38228_idx')],
+                'unique_together': {('movie', 'genre')},
+            },
+        ),
+        migrations.RunPython(backfill_movie_genres, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_collection', '0013_genre'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='requestdata',
+            index=models.Index(fields=['path', 'id'], name='requests_tr_path_220998_idx'),
+        ),
+    ]
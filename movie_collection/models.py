@@ -3,6 +3,8 @@ import uuid
 from django.db import models
 from django.contrib.auth.models import User
 
+from .search import FullTextField
+
 
 class Collection(models.Model):
     title = models.CharField(max_length=255)
@@ -31,6 +33,22 @@ class Movie(models.Model):
         db_table = 'movie'
 
 
+class MovieSearchIndex(models.Model):
+    """
+    Read only view of the movie_fts full text index (created by migration 0012 on sqlite builds with
+    fts5,kept in sync by triggers),joined to Movie on its rowid.
+    """
+    movie = models.OneToOneField(Movie, primary_key=True, db_column='rowid', on_delete=models.DO_NOTHING,
+                                 related_name='search_index')
+    title = models.TextField()
+    description = models.TextField()
+    document = FullTextField(db_column='movie_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'movie_fts'
+
+
 class MovieCollection(models.Model):
     """
     Through table representing the many-to-many relationship between collections and movies,
@@ -74,3 +92,96 @@ class RequestData(models.Model):
 
     class Meta:
         db_table = 'requests_tracking'
+        # the per path retention seeks the newest ids of each path on this index
+        indexes = [models.Index(fields=['path', 'id'])]
+
+
+class RequestCountRollup(models.Model):
+    """
+    Pre-aggregated request counts per time bucket,kept up to date as request logs are written so that
+    counting served requests never scans requests_tracking.
+    """
+    MINUTE = 'minute'
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITY_CHOICES = [(MINUTE, 'Minute'), (HOUR, 'Hour'), (DAY, 'Day')]
+
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    path = models.CharField(max_length=255)
+    method = models.CharField(max_length=50)
+    response_status = models.CharField(max_length=255, default='', blank=True)
+    user = models.IntegerField(default=0)
+    node_id = models.CharField(max_length=255, default='', blank=True)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'requests_tracking_rollup'
+        unique_together = ('granularity', 'bucket_start', 'path', 'method', 'response_status', 'user', 'node_id')
+        indexes = [models.Index(fields=['granularity', 'bucket_start'])]
+
+
+class LatencyRollup(models.Model):
+    """
+    Mergeable latency histogram of incoming requests per time bucket,path,method and node,kept up to
+    date as request logs are written.see aggregates.LatencyHistogram for the bucket layout.
+    """
+    granularity = models.CharField(max_length=10, choices=RequestCountRollup.GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    path = models.CharField(max_length=255)
+    method = models.CharField(max_length=50)
+    node_id = models.CharField(max_length=255, default='', blank=True)
+    count = models.BigIntegerField(default=0)
+    total_us = models.BigIntegerField(default=0)
+    max_us = models.BigIntegerField(default=0)
+    histogram = models.JSONField(default=dict)
+
+    class Meta:
+        db_table = 'requests_latency_rollup'
+        unique_together = ('granularity', 'bucket_start', 'path', 'method', 'node_id')
+        indexes = [models.Index(fields=['granularity', 'bucket_start'])]
+
+    def get_histogram(self):
+        from .aggregates import LatencyHistogram
+        return LatencyHistogram(buckets=self.histogram, count=self.count, total=self.total_us, maximum=self.max_us)
+
+
+class MovieSyncCheckpoint(models.Model):
+    """
+    Progress of the sync_movies command: the next movie api page to fetch,so an interrupted sync
+    resumes there instead of starting over,and when the last full pass over the catalog finished.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    next_page = models.IntegerField(default=1)
+    page_size = models.IntegerField(null=True)
+    total_pages = models.IntegerField(null=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'movie_sync_checkpoint'
+
+
+class Genre(models.Model):
+    """
+    Normalised genre names,split from the comma separated Movie.genres.
+    """
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        db_table = 'genre'
+
+
+class MovieGenre(models.Model):
+    """
+    Genres of a movie,kept in sync with Movie.genres by genres.sync_movie_genres.the (genre, movie)
+    index serves genre filters and facet counts without touching the movie table.
+    """
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='movie_genres')
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name='movie_genres')
+
+    class Meta:
+        db_table = 'movie_genre'
+        unique_together = ('movie', 'genre')
+        indexes = [models.Index(fields=['genre', 'movie'])]
@@ -0,0 +1,294 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cache import AsyncSingleFlight, SharedCache, SingleFlight, TTLCache
+from .circuit_breaker import CircuitBreaker
+from .constants import Constant
+from .context import annotate, get_request_context, measure
+from .log_writer import get_request_log_writer
+from .utilities import get_async_client, get_retry_session
+from user_collections.settings import env
+
+
+class UpstreamResponse:
+    """
+    status,content type and raw body of a movie api response,the unit that is cached.stale marks a
+    response served from an expired shared cache entry because the movie api failed.
+    """
+    __slots__ = ('status', 'content_type', 'body', 'stale')
+
+    def __init__(self, status, content_type, body: bytes, stale=False):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.stale = stale
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def json(self):
+        return json.loads(self.body)
+
+    def to_bytes(self) -> bytes:
+        header = json.dumps({"status": self.status, "content_type": self.content_type}).encode()
+        return header + b"\n" + self.body
+
+    @classmethod
+    def from_bytes(cls, value: bytes, stale=False):
+        header, body = value.split(b"\n", 1)
+        header = json.loads(header)
+        return cls(header["status"], header["content_type"], body, stale=stale)
+
+
+def movie_cache_key(query_params) -> tuple:
+    """
+    normalised cache key for a movies query: params sorted,repeated values kept in order,page always set.
+    """
+    params = {key: tuple(values) for key, values in query_params.lists()}
+    params.setdefault("page", ("1",))
+    return tuple(sorted(params.items()))
+
+
+movie_breaker = CircuitBreaker(failure_rate=settings.MOVIE_CIRCUIT_FAILURE_RATE,
+                               slow_call_seconds=settings.MOVIE_CIRCUIT_SLOW_CALL_SECONDS,
+                               slow_call_rate=settings.MOVIE_CIRCUIT_SLOW_CALL_RATE,
+                               window=settings.MOVIE_CIRCUIT_WINDOW, min_calls=settings.MOVIE_CIRCUIT_MIN_CALLS,
+                               open_seconds=settings.MOVIE_CIRCUIT_OPEN_SECONDS)
+
+
+def record_outgoing_call(url, params, started_at, duration, status=None, body_bytes=None, retries=None,
+                         connection_reused=None, error=None, streamed=False):
+    """
+    logs an upstream call as an "outgoing" request log,linked to the incoming request that made it.
+    """
+    context = get_request_context()
+    annotate("upstream", {"status": status, "bytes": body_bytes, "retries": retries, "streamed": streamed,
+                          "connection_reused": connection_reused})
+    if settings.ENVIRONMENT not in ['DEV', 'PROD', 'LOCAL']:
+        return
+    try:
+        get_request_log_writer().add({
+            "request_id": str(uuid.uuid4()), "user": None, "path": urlparse(url).path, "method": "GET",
+            "ip_address": "", "query_params": dict(params.lists()) if hasattr(params, "lists") else dict(params),
+            "response_status": str(status) if status is not None else "error",
+            "node_id": settings.NODE_ID, "execution_time": timedelta(seconds=duration),
+            "request_time": started_at.strftime('%Y-%m-%d %H:%M:%S'), "request_type": "outgoing",
+            "meta_data": {"url": url, "retries": retries, "bytes": body_bytes, "error": error,
+                          "parent_request_id": context.request_id if context is not None else None}})
+    except Exception as e:
+        logging.error(e)
+
+
+def call_movie_api(params, stream=False):
+    """
+    one guarded upstream call: rejected while the circuit is open,timed,fed to the circuit breaker
+    and logged as an outgoing request.any other exception of the call is recorded as a failure too,
+    else a half open trial would never report back.
+    """
+    movie_breaker.before_call()
+    url = env(Constant.MOVIE_API_URL)
+    started_at = datetime.utcnow()
+    start = time.perf_counter()
+    try:
+        with measure("upstream"):
+            response = get_retry_session().get(url, params=params, verify=False, stream=stream)
+    except requests.exceptions.RequestException as e:
+        duration = time.perf_counter() - start
+        movie_breaker.record(False, duration)
+        record_outgoing_call(url, params, started_at, duration, error=str(e))
+        raise
+    except BaseException:
+        movie_breaker.record(False, time.perf_counter() - start)
+        raise
+    duration = time.perf_counter() - start
+    movie_breaker.record(response.status_code < 500, duration)
+    retries = None
+    if getattr(response.raw, "retries", None) is not None:
+        retries = len(response.raw.retries.history)
+    record_outgoing_call(url, params, started_at, duration, status=response.status_code,
+                         body_bytes=None if stream else len(response.content), retries=retries,
+                         connection_reused=getattr(response, "connection_reused", None), streamed=stream)
+    return response
+
+
+# statuses retried by the async client,as by the Retry of the sync session
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+async def arecord_outgoing_call(*args, **kwargs):
+    # a synchronous request log writer inserts right away,which must not happen on the event loop
+    if get_request_log_writer().asynchronous:
+        record_outgoing_call(*args, **kwargs)
+    else:
+        await sync_to_async(record_outgoing_call)(*args, **kwargs)
+
+
+async def acall_movie_api(params, stream=False):
+    """
+    call_movie_api for the event loop,using the pooled async client of the running loop.5xx answers
+    are retried with the backoff of the sync session,and httpx errors are raised as requests
+    exceptions so both paths are handled alike.
+    """
+    movie_breaker.before_call()
+    url = env(Constant.MOVIE_API_URL)
+    client = get_async_client()
+    started_at = datetime.utcnow()
+    start = time.perf_counter()
+    retries = 0
+    try:
+        with measure("upstream"):
+            while True:
+                response = await client.send(client.build_request("GET", url, params=params), stream=stream)
+                if response.status_code not in RETRY_STATUSES or retries >= settings.UPSTREAM_RETRIES:
+                    break
+                await response.aclose()
+                retries += 1
+                if retries > 1:
+                    await asyncio.sleep(settings.UPSTREAM_RETRY_BACKOFF * (2 ** (retries - 1)))
+    except httpx.HTTPError as e:
+        duration = time.perf_counter() - start
+        movie_breaker.record(False, duration)
+        await arecord_outgoing_call(url, params, started_at, duration, retries=retries, error=str(e))
+        if isinstance(e, httpx.TimeoutException):
+            raise requests.exceptions.Timeout(str(e)) from e
+        raise requests.exceptions.ConnectionError(str(e)) from e
+    except BaseException:
+        # cancellation included
+        movie_breaker.record(False, time.perf_counter() - start)
+        raise
+    duration = time.perf_counter() - start
+    movie_breaker.record(response.status_code < 500, duration)
+    await arecord_outgoing_call(url, params, started_at, duration, status=response.status_code,
+                                body_bytes=None if stream else len(response.content), retries=retries,
+                                streamed=stream)
+    return response
+
+
+def fetch_movies(params) -> UpstreamResponse:
+    response = call_movie_api(params)
+    return UpstreamResponse(response.status_code, response.headers.get("Content-Type", "application/json"),
+                            response.content)
+
+
+def iter_upstream(response, chunk_size):
+    try:
+        yield from response.iter_content(chunk_size=chunk_size)
+    finally:
+        response.close()
+
+
+async def afetch_movies(params) -> UpstreamResponse:
+    response = await acall_movie_api(params)
+    return UpstreamResponse(response.status_code, response.headers.get("Content-Type", "application/json"),
+                            response.content)
+
+
+async def aiter_upstream(response, chunk_size):
+    try:
+        async for chunk in response.aiter_bytes(chunk_size):
+            yield chunk
+    finally:
+        await response.aclose()
+
+
+def stream_movies(query_params):
+    """
+    opens a streamed movie api request and returns (status, content type, chunk iterator),the body
+    is never read into memory here.
+    """
+    response = call_movie_api(query_params.copy(), stream=True)
+    return (response.status_code, response.headers.get("Content-Type", "application/json"),
+            iter_upstream(response, settings.MOVIE_API_STREAM_CHUNK_SIZE))
+
+
+async def astream_movies(query_params):
+    """
+    stream_movies for the event loop,the chunks are an async iterator.
+    """
+    response = await acall_movie_api(query_params.copy(), stream=True)
+    return (response.status_code, response.headers.get("Content-Type", "application/json"),
+            aiter_upstream(response, settings.MOVIE_API_STREAM_CHUNK_SIZE))
+
+
+# a stale fallback is not stored,else the memory cache would serve it as fresh for a full ttl
+movie_cache = TTLCache(maxsize=settings.MOVIE_CACHE_SIZE, ttl=settings.MOVIE_CACHE_TTL,
+                       stale_ttl=settings.MOVIE_CACHE_STALE_TTL,
+                       should_cache=lambda response: response.ok and not response.stale)
+shared_movie_cache = SharedCache(settings.MOVIE_SHARED_CACHE_PATH, max_bytes=settings.MOVIE_SHARED_CACHE_MAX_BYTES,
+                                 ttl=settings.MOVIE_CACHE_TTL, stale_ttl=settings.MOVIE_CACHE_STALE_TTL)
+
+movie_flight = SingleFlight(lock_dir=settings.MOVIE_SINGLE_FLIGHT_LOCK_DIR)
+movie_async_flight = AsyncSingleFlight()
+
+
+def load_movies(params, key) -> UpstreamResponse:
+    """
+    loads a movies page from the shared cache,or from the movie api when the shared entry is missing
+    or stale.a stale shared entry is still returned,marked stale,when the movie api fails.
+    """
+    shared_key = json.dumps(key)
+    cached = shared_movie_cache.get(shared_key)
+    if cached is not None and cached[1]:
+        return UpstreamResponse.from_bytes(cached[0])
+    try:
+        response = fetch_movies(params)
+    except requests.exceptions.RequestException:
+        if cached is None:
+            raise
+        return UpstreamResponse.from_bytes(cached[0], stale=True)
+    if response.ok:
+        shared_movie_cache.set(shared_key, response.to_bytes())
+    elif cached is not None:
+        return UpstreamResponse.from_bytes(cached[0], stale=True)
+    return response
+
+
+def get_movies(query_params) -> UpstreamResponse:
+    """
+    movies page for the given query params,served from the in-process movie_cache,then the shared
+    cache of the host,then the movie api.concurrent misses for the same page share one load.
+    """
+    params = query_params.copy()
+    key = movie_cache_key(params)
+    return movie_cache.get_or_load(key, lambda: movie_flight.do(key, lambda: load_movies(params, key)))
+
+
+async def aload_movies(params, key) -> UpstreamResponse:
+    """
+    load_movies for the event loop,the shared cache file is read and written in a worker thread.
+    """
+    shared_key = json.dumps(key)
+    cached = await sync_to_async(shared_movie_cache.get, thread_sensitive=False)(shared_key)
+    if cached is not None and cached[1]:
+        return UpstreamResponse.from_bytes(cached[0])
+    try:
+        response = await afetch_movies(params)
+    except requests.exceptions.RequestException:
+        if cached is None:
+            raise
+        return UpstreamResponse.from_bytes(cached[0], stale=True)
+    if response.ok:
+        await sync_to_async(shared_movie_cache.set, thread_sensitive=False)(shared_key, response.to_bytes())
+    elif cached is not None:
+        return UpstreamResponse.from_bytes(cached[0], stale=True)
+    return response
+
+
+async def aget_movies(query_params) -> UpstreamResponse:
+    """
+    get_movies for the event loop: same caches,concurrent misses of the loop share one load.
+    """
+    params = query_params.copy()
+    key = movie_cache_key(params)
+    return await movie_cache.aget_or_load(key, lambda: movie_async_flight.do(key, lambda: aload_movies(params, key)))
@@ -1,11 +1,16 @@
 from collections import OrderedDict
 from functools import cached_property
 
-from django.core.paginator import Paginator
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from .constants import Constant
+from .counts import count_queryset
+from .utilities import decode_cursor, encode_cursor
 from user_collections.settings import env
 
 
@@ -21,12 +26,187 @@ class FasterDjangoPaginator(Paginator):
             print(e)
         return super(FasterDjangoPaginator, self).count
 
+
+class LookaheadPage(Page):
+    def __init__(self, object_list, number, paginator, has_next):
+        super(LookaheadPage, self).__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def next_page_number(self):
+        if not self._has_next:
+            raise EmptyPage("That page contains no results")
+        return self.number + 1
+
+
+class LookaheadPaginator(FasterDjangoPaginator):
+    """
+    a page is cut by reading per_page + 1 rows,which also tells whether there is a next page,so the page
+    number is never checked against count.count may be an estimate or a cached count that is too low,
+    it is only displayed: raised to the rows seen,and exact once the last page is read.
+    """
+
+    def validate_number(self, number):
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        if number < 1:
+            raise EmptyPage("That page number is less than 1")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage("That page contains no results")
+        has_next = len(rows) > self.per_page
+        self.count_exact = not has_next
+        seen = bottom + len(rows)
+        # count and num_pages are cached properties,num_pages follows the corrected count
+        self.__dict__["count"] = max(self.count, seen) if has_next else seen
+        self.__dict__.pop("num_pages", None)
+        return LookaheadPage(rows[:self.per_page], number, self, has_next)
+
+class KeysetPage:
+    """
+    one page of a keyset (cursor) paginated queryset.rows are selected with a WHERE on the ordering
+    key instead of an OFFSET,so every page costs the same,and nothing is counted.the ordering is
+    one of KEYSET_ORDERINGS,with id as tie breaker,and cursors are bound to it.
+    """
+    KEYSET_ORDERINGS = {
+        ("-id",): ("-id",),
+        ("id",): ("id",),
+        ("title",): ("title", "id"),
+        ("-title",): ("-title", "-id"),
+    }
+
+    def __init__(self, queryset, page_size, cursor=None):
+        ordering = self.KEYSET_ORDERINGS.get(tuple(queryset.query.order_by))
+        if ordering is None:
+            raise ValidationError({"cursor": "cursor pagination is not available for this ordering"})
+        self.ordering = ordering
+        self.page_size = page_size
+        position = self.decode(cursor) if cursor else None
+        reverse = position is not None and position["d"] == "p"
+        if reverse:
+            queryset = queryset.order_by(*[self._reversed(field) for field in ordering])
+        else:
+            queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(position["v"], reverse))
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+        self.object_list = rows
+        self.has_next = has_more if not reverse else True
+        self.has_previous = position is not None and (has_more if reverse else True)
+
+    @staticmethod
+    def _reversed(field):
+        return field[1:] if field.startswith("-") else "-" + field
+
+    def _after(self, values, reverse):
+        """
+        rows after the position in the (possibly reversed) ordering: (a > x) or (a = x and b > y).
+        """
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            descending = field.startswith("-") != reverse
+            name = field.lstrip("-")
+            step = Q(**{"{}__{}".format(name, "lt" if descending else "gt"): values[index]})
+            for previous_index, previous in enumerate(self.ordering[:index]):
+                step &= Q(**{previous.lstrip("-"): values[previous_index]})
+            condition |= step
+        return condition
+
+    def _key(self, row):
+        if isinstance(row, dict):
+            return [row[field.lstrip("-")] for field in self.ordering]
+        return [getattr(row, field.lstrip("-")) for field in self.ordering]
+
+    def decode(self, cursor):
+        try:
+            position = decode_cursor(cursor)
+        except ValueError:
+            raise NotFound("invalid cursor")
+        if position.get("o") != ",".join(self.ordering) or position.get("d") not in ("n", "p") \
+                or not isinstance(position.get("v"), list) or len(position["v"]) != len(self.ordering):
+            raise NotFound("invalid cursor")
+        return position
+
+    def next_cursor(self):
+        if not self.has_next or not self.object_list:
+            return None
+        return encode_cursor({"o": ",".join(self.ordering), "d": "n", "v": self._key(self.object_list[-1])})
+
+    def previous_cursor(self):
+        if not self.has_previous or not self.object_list:
+            return None
+        return encode_cursor({"o": ",".join(self.ordering), "d": "p", "v": self._key(self.object_list[0])})
+
+
 class CustomPageNumberPagination(PageNumberPagination):
+    """
+    page number pagination,or keyset pagination for requests with ?pagination=cursor or a ?cursor=,
+    answered in the same page/links envelope.page counts come from count_queryset through the
+    custom_count hook of FasterDjangoPaginator and are only displayed,LookaheadPaginator finds the
+    next page without them.count_exact is False when the count is an estimate.
+    """
     page_size = env(Constant.DEFAULT_PAGE_SIZE)
     page_size_query_param = "page_size"
-    django_paginator_class = FasterDjangoPaginator
+    django_paginator_class = LookaheadPaginator
+    cursor_query_param = "cursor"
+    mode_query_param = "pagination"
+    keyset_page = None
+    count_exact = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.mode_query_param) != "cursor" and self.cursor_query_param not in request.query_params:
+            queryset.custom_count, self.count_exact = count_queryset(queryset)
+            page = super(CustomPageNumberPagination, self).paginate_queryset(queryset, request, view)
+            self.count_exact = self.count_exact or self.page.paginator.count_exact
+            return page
+        self.request = request
+        self.keyset_page = KeysetPage(queryset, int(self.get_page_size(request)),
+                                      request.query_params.get(self.cursor_query_param))
+        return self.keyset_page.object_list
+
+    def get_cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
 
     def get_paginated_response(self, data):
+        if self.keyset_page is not None:
+            next_cursor, previous_cursor = self.keyset_page.next_cursor(), self.keyset_page.previous_cursor()
+            return Response(OrderedDict([
+                ('page', OrderedDict([
+                    ('current_page', None),
+                    ('next_page', None),
+                    ('prev_page', None),
+                    ('total_pages', None),
+                    ('page_size', self.keyset_page.page_size),
+                    ('count', None),
+                    ('source', 'db'),
+                    ('mode', 'cursor'),
+                    ('next_cursor', next_cursor),
+                    ('prev_cursor', previous_cursor),
+                ])),
+                ('links', OrderedDict([
+                    ('next', self.get_cursor_link(next_cursor)),
+                    ('previous', self.get_cursor_link(previous_cursor)),
+                ])),
+                ('results', data)
+            ]))
         return Response(OrderedDict([
             ('page', OrderedDict([
                 ('current_page', self.page.number),
@@ -35,6 +215,7 @@ class CustomPageNumberPagination(PageNumberPagination):
                 ('total_pages', self.page.paginator.num_pages),
                 ('page_size', self.page.paginator.per_page),
                 ('count', self.page.paginator.count),
+                ('count_exact', self.count_exact),
                 ('source', 'db'),
             ])),
             ('links', OrderedDict([
@@ -44,3 +225,21 @@ class CustomPageNumberPagination(PageNumberPagination):
             ('results', data)
         ]))
 
+class MovieApiPageNumberPagination(PageNumberPagination):
+    """
+    pages in the count/next/previous/results shape of the movie api,for movies served from the local catalog.
+    """
+    page_size = env(Constant.DEFAULT_PAGE_SIZE)
+    django_paginator_class = FasterDjangoPaginator
+
+
+class OptionalPageNumberPagination(CustomPageNumberPagination):
+    """
+    CustomPageNumberPagination only for requests that ask for a page,a cursor or ?pagination=cursor,
+    other requests get the bare list of results that the endpoint always returned.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not {self.page_query_param, self.cursor_query_param, self.mode_query_param} & set(request.query_params):
+            return None
+        return super(OptionalPageNumberPagination, self).paginate_queryset(queryset, request, view)
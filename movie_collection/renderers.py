@@ -0,0 +1,13 @@
+from rest_framework.renderers import JSONRenderer
+
+from .context import measure
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that reports rendering time as part of the serialize metric of the Server-Timing header.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with measure("serialize"):
+            return super(TimedJSONRenderer, self).render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,125 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import LatencyRollup, RequestCountRollup, RequestData
+
+logger = logging.getLogger(__name__)
+
+FULL_VACUUM = 'full'
+INCREMENTAL_VACUUM = 'incremental'
+
+
+def sqlite_used_bytes():
+    """
+    bytes of the sqlite database that hold data,i.e. all pages except the ones on the freelist.
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+    return (page_count - freelist_count) * page_size
+
+
+def sqlite_file_bytes():
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+    return page_count * page_size
+
+
+def delete_in_chunks(queryset, chunk_size=1000, pause=0.0):
+    """
+    deletes the rows of queryset in batches of up to chunk_size ids,each in its own short transaction,
+    so no single statement holds the write lock for long.each batch is the next ids still matching
+    the queryset,so sparse matches spread over the table cost no empty transactions.
+    """
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            count, _ = queryset.filter(id__in=ids).delete()
+        deleted += count
+        if pause:
+            time.sleep(pause)
+
+
+def get_expired_querysets(days=None, keep_per_path=None):
+    """
+    querysets of the rows outside the retention window,the per path threshold is a seek on the
+    (path, id) index,so each path costs one index lookup instead of a scan.
+    """
+    querysets = []
+    if days:
+        cutoff = timezone.now() - timedelta(days=days)
+        querysets.append(RequestData.objects.filter(request_time__lt=cutoff))
+    if keep_per_path:
+        for path in RequestData.objects.values_list('path', flat=True).distinct().order_by():
+            threshold = RequestData.objects.filter(path=path).order_by('-id').values_list(
+                'id', flat=True)[keep_per_path:keep_per_path + 1].first()
+            if threshold is not None:
+                querysets.append(RequestData.objects.filter(path=path, id__lte=threshold))
+    return querysets
+
+
+def prune_minute_rollups(days, chunk_size=1000, pause=0.0):
+    """
+    deletes count and latency rollups of minute granularity older than days,hour and day rollups are kept.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    return sum(delete_in_chunks(model.objects.filter(granularity=RequestCountRollup.MINUTE, bucket_start__lt=cutoff),
+                                chunk_size=chunk_size, pause=pause)
+               for model in (RequestCountRollup, LatencyRollup))
+
+
+def vacuum(mode):
+    if connection.vendor != 'sqlite':
+        logger.info("vacuum is only supported for sqlite,skipping")
+        return False
+    with connection.cursor() as cursor:
+        if mode == INCREMENTAL_VACUUM:
+            auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+            if auto_vacuum != 2:
+                logger.info("incremental vacuum needs auto_vacuum=INCREMENTAL,skipping")
+                return False
+            cursor.execute("PRAGMA incremental_vacuum")
+        else:
+            cursor.execute("VACUUM")
+    return True
+
+
+def prune_request_logs(days=None, keep_per_path=None, chunk_size=1000, vacuum_mode=None, dry_run=False,
+                       pause=0.0, minute_rollup_days=None) -> dict:
+    """
+    enforces the request log retention window: rows older than days and/or beyond the newest
+    keep_per_path rows of each path are deleted,as are minute rollups older than minute_rollup_days.
+    returns the number of deleted rows and rollups and,on sqlite,the reclaimed bytes.
+    """
+    querysets = get_expired_querysets(days=days, keep_per_path=keep_per_path)
+    if dry_run:
+        return {"deleted_rows": sum(queryset.count() for queryset in querysets), "deleted_rollups": None,
+                "reclaimed_bytes": None, "vacuumed": False, "dry_run": True}
+    used_bytes_before = sqlite_used_bytes()
+    file_bytes_before = sqlite_file_bytes()
+    deleted = sum(delete_in_chunks(queryset, chunk_size=chunk_size, pause=pause) for queryset in querysets)
+    deleted_rollups = prune_minute_rollups(minute_rollup_days, chunk_size=chunk_size, pause=pause) \
+        if minute_rollup_days else 0
+    vacuumed = vacuum(vacuum_mode) if vacuum_mode and (deleted or deleted_rollups) else False
+    used_bytes_after = sqlite_used_bytes()
+    result = {"deleted_rows": deleted, "deleted_rollups": deleted_rollups, "reclaimed_bytes": None,
+              "vacuumed": vacuumed, "dry_run": False}
+    if used_bytes_before is not None:
+        result["reclaimed_bytes"] = max(used_bytes_before - used_bytes_after, 0)
+        result["file_bytes_before"] = file_bytes_before
+        result["file_bytes_after"] = sqlite_file_bytes()
+    return result
+
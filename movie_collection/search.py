@@ -0,0 +1,81 @@
+import re
+
+from django.db import connections, models
+from django.db.models import FloatField, Func, Lookup, Q, Value
+
+FTS_TABLE = 'movie_fts'
+# bm25 weights of the title and description columns,a title match ranks above a description match
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_token = re.compile(r"\w+", re.UNICODE)
+_fts_available = {}
+
+
+class FullTextField(models.TextField):
+    """
+    the hidden column of an fts5 table,named like the table.it takes the match lookup and is the
+    first argument of the ranking functions.
+    """
+
+
+@FullTextField.register_lookup
+class FullTextMatch(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return "{} MATCH {}".format(lhs, rhs), lhs_params + rhs_params
+
+
+class Bm25(Func):
+    """
+    bm25() rank of an fts5 match,lower is better.weights are given per indexed column.
+    """
+    function = 'bm25'
+    output_field = FloatField()
+
+    def __init__(self, document, *weights):
+        super(Bm25, self).__init__(document, *[Value(weight) for weight in weights])
+
+
+def search_terms(query):
+    return _token.findall(query or "")[:16]
+
+
+def fts_available(alias='default') -> bool:
+    """
+    whether the movie_fts index exists on the database,it is only created on sqlite builds with fts5.
+    """
+    if alias not in _fts_available:
+        connection = connections[alias]
+        _fts_available[alias] = (connection.vendor == 'sqlite'
+                                 and FTS_TABLE in connection.introspection.table_names(include_views=False))
+    return _fts_available[alias]
+
+
+def build_match_expression(terms) -> str:
+    """
+    fts5 MATCH expression requiring every term as a word prefix,terms are quoted so user input is never
+    parsed as query syntax.
+    """
+    return " ".join('"{}"*'.format(term) for term in terms)
+
+
+def search_movies(queryset, query):
+    """
+    movies of queryset matching every word of query as a prefix of a title or description word,best
+    match first.uses the movie_fts index and falls back to icontains lookups without it.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    if not fts_available(queryset.db):
+        condition = Q()
+        for term in terms:
+            condition &= Q(title__icontains=term) | Q(description__icontains=term)
+        return queryset.filter(condition)
+    return (queryset.filter(search_index__document__match=build_match_expression(terms))
+            .annotate(search_rank=Bm25("search_index__document", TITLE_WEIGHT, DESCRIPTION_WEIGHT))
+            .order_by("search_rank", "id"))
@@ -1,17 +1,57 @@
+from collections import defaultdict
+
 from django.contrib.auth.models import User, Permission, Group
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Collection, Movie, RequestData
+from .context import measure
+from .counts import invalidate_counts_receiver
+from .fieldsets import MOVIE_FIELDS, USER_FIELDS
+from .genres import sync_movie_genres
+from .models import Collection, Movie, MovieCollection, RequestData
+
+
+class TimedSerializerMixin:
+    """
+    reports the time spent in to_representation as the serialize metric of the Server-Timing header.
+    """
+
+    def to_representation(self, instance):
+        with measure("serialize"):
+            return super().to_representation(instance)
+
+
+class SparseFieldsMixin:
+    """
+    keeps only the fields named in the `fields` argument,when it is given.
+    """
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
-class MovieSerializer(serializers.ModelSerializer):
+
+class MovieSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     uuid = serializers.CharField(read_only=True)
 
     class Meta:
         model = Movie
-        fields = "__all__"
+        fields = MOVIE_FIELDS
 
 
-class CollectionSerializer(serializers.ModelSerializer):
+class CatalogMovieSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    a movie in the item shape of the movie api.
+    """
+    uuid = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Movie
+        fields = ("title", "description", "genres", "uuid")
+
+
+class CollectionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     movies = MovieSerializer(many=True, read_only=True)
     collection_uuid = serializers.CharField(read_only=True)
 
@@ -27,7 +67,10 @@ class CollectionSerializer(serializers.ModelSerializer):
             movies_list.append(Movie(**movie))
         if movies_list:
             Movie.objects.bulk_create(movies_list, ignore_conflicts=True)
-        return list(Movie.objects.filter(title__in=movies_title_from_input).values_list("id", flat=True))
+            invalidate_counts_receiver(Movie)
+        movies = list(Movie.objects.filter(title__in=movies_title_from_input).values_list("id", "genres"))
+        sync_movie_genres(movies)
+        return [movie_id for movie_id, _ in movies]
 
     def create(self, validated_data):
         movies = self.initial_data.pop("movies", [])
@@ -44,7 +87,25 @@ class CollectionSerializer(serializers.ModelSerializer):
             instance.movies.set(movies_id)
         return super(CollectionSerializer, self).update(instance, validated_data)
 
-class RequestDataSerializer(serializers.ModelSerializer):
+class BulkMovieSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField(allow_blank=True, required=False, default="")
+    genres = serializers.CharField(max_length=255, allow_blank=True, allow_null=True, required=False, default=None)
+    uuid = serializers.UUIDField(required=False)
+
+
+class BulkCollectionSerializer(serializers.Serializer):
+    """
+    one collection of a bulk import,validated without queries,the user and title checks are done for
+    the whole import at once.
+    """
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField()
+    user = serializers.IntegerField(required=False)
+    movies = BulkMovieSerializer(many=True, required=False, default=list)
+
+
+class RequestDataSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = RequestData
@@ -52,19 +113,22 @@ class RequestDataSerializer(serializers.ModelSerializer):
 
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = User
         fields = "__all__"
 
 
-class UserListSerializer(serializers.ModelSerializer):
+class UserListSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = ["id","username","email","password","first_name","last_name","is_superuser","is_staff","is_active"]
-class CollectionListSerializer(serializers.ModelSerializer):
+        fields = USER_FIELDS
+class CollectionListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    a collection with its user and movies,or the fields of a FieldSelection passed as `selection`.
+    """
     user = UserListSerializer()
     movies = MovieSerializer(many=True,read_only=True)
 
@@ -72,6 +136,61 @@ class CollectionListSerializer(serializers.ModelSerializer):
         model = Collection
         fields = "__all__"
 
-
-
-
+    def __init__(self, *args, selection=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if selection is not None:
+            selection.apply(self, UserListSerializer, MovieSerializer)
+
+
+COLLECTION_VALUES = ("id", "collection_uuid", "title", "description", "created_at", "updated_at", "is_success",
+                     "user_id") + tuple("user__{}".format(name) for name in USER_FIELDS if name != "id")
+
+
+class CollectionRowSerializer:
+    """
+    read-only CollectionListSerializer output built from values() rows of collections,with the user
+    joined in the same query and the movies of all rows read with one join over movie_collection and
+    grouped in python,without serializer or model instances per row.
+    """
+
+    @classmethod
+    def values(cls, queryset):
+        """
+        the collection queryset as rows for to_representation.
+        """
+        return queryset.prefetch_related(None).values(*COLLECTION_VALUES)
+
+    @classmethod
+    def to_representation(cls, rows):
+        with measure("serialize"):
+            rows = list(rows)
+            # the timezone is looked up once instead of for every value
+            datetime = serializers.DateTimeField(default_timezone=timezone.get_current_timezone()).to_representation
+            movies, seen = defaultdict(list), {}
+            movie_rows = MovieCollection.objects.filter(collection_id__in=[row["id"] for row in rows]).order_by(
+                "id").values_list("collection_id", *("movie__{}".format(name) for name in MOVIE_FIELDS))
+            for collection_id, *values in movie_rows:
+                # a movie in several collections of the page is formatted once
+                movie = seen.get(values[0])
+                if movie is None:
+                    movie = seen[values[0]] = dict(zip(MOVIE_FIELDS, values))
+                    movie["uuid"] = str(movie["uuid"])
+                    movie["created_at"] = datetime(movie["created_at"])
+                    movie["updated_at"] = datetime(movie["updated_at"])
+                movies[collection_id].append(movie)
+            data = []
+            for row in rows:
+                user = {"id": row["user_id"]}
+                user.update((name, row["user__" + name]) for name in USER_FIELDS[1:])
+                data.append({
+                    "id": row["id"],
+                    "user": user,
+                    "movies": movies.get(row["id"], []),
+                    "collection_uuid": str(row["collection_uuid"]),
+                    "title": row["title"],
+                    "description": row["description"],
+                    "created_at": datetime(row["created_at"]),
+                    "updated_at": datetime(row["updated_at"]),
+                    "is_success": row["is_success"],
+                })
+            return data
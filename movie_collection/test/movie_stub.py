@@ -0,0 +1,73 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MovieStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        with server.lock:
+            server.requests.append(self.path)
+        if server.delay:
+            time.sleep(server.delay)
+        page = int(query.get("page", ["1"])[0])
+        status = server.status
+        if status == 200 and page > server.pages:
+            status = 404
+        body = json.dumps(server.build_page(page) if status == 200 else {"error": "stub error"}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MovieStubServer(ThreadingHTTPServer):
+    """
+    local stand-in for the external movie api,serving `pages` pages of `page_size` generated movies.
+    """
+    daemon_threads = True
+
+    def __init__(self, pages=3, page_size=2, delay=0.0, status=200):
+        super().__init__(("127.0.0.1", 0), MovieStubHandler)
+        self.pages = pages
+        self.page_size = page_size
+        self.delay = delay
+        self.status = status
+        self.requests = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/api/v1/movies/".format(self.server_address[1])
+
+    def handle_error(self, request, client_address):
+        # clients that time out close the connection before the stub answers
+        pass
+
+    def build_page(self, page):
+        results = [{"title": "stub movie {}".format((page - 1) * self.page_size + i),
+                    "description": "stub description", "genres": "Drama,Comedy",
+                    "uuid": "00000000-0000-4000-8000-{:012d}".format((page - 1) * self.page_size + i)}
+                   for i in range(self.page_size)]
+        return {"count": self.pages * self.page_size,
+                "next": "{}?page={}".format(self.url, page + 1) if page < self.pages else None,
+                "previous": "{}?page={}".format(self.url, page - 1) if page > 1 else None,
+                "results": results}
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
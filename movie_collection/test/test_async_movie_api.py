@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import time
+from unittest import mock
+
+from django.http import QueryDict
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+
+from movie_collection.cache import AsyncSingleFlight, TTLCache
+from movie_collection.circuit_breaker import CircuitOpenError
+from movie_collection.models import Movie
+from movie_collection.movie_api import aget_movies, movie_async_flight, movie_breaker, movie_cache
+from movie_collection.test.movie_stub import MovieStubServer
+from movie_collection.test.test_movie_api import FakeClock
+from movie_collection.test.test_movie_collections import get_access_token
+
+
+class AsyncSingleFlightTest(SimpleTestCase):
+    def test_concurrent_calls_share_one_load(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "page"
+
+        async def run():
+            return await asyncio.gather(*[flight.do("page-1", load) for _ in range(20)])
+
+        self.assertEqual(asyncio.run(run()), ["page"] * 20)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats(), {"leaders": 1, "followers": 19, "in_flight": 0})
+
+    def test_errors_are_shared(self):
+        flight = AsyncSingleFlight()
+
+        async def load():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream down")
+
+        async def run():
+            return await asyncio.gather(*[flight.do("page-1", load) for _ in range(3)], return_exceptions=True)
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in asyncio.run(run())))
+
+    def test_cancelled_leader_does_not_cancel_followers(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "page"
+
+        async def run():
+            leader = asyncio.ensure_future(flight.do("page-1", load))
+            await asyncio.sleep(0)
+            followers = [asyncio.ensure_future(flight.do("page-1", load)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            results = await asyncio.gather(*followers)
+            return leader.cancelled(), results
+
+        self.assertEqual(asyncio.run(run()), (True, ["page"] * 3))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+
+class TTLCacheAsyncTest(SimpleTestCase):
+    def test_stale_entry_is_refreshed_in_a_task(self):
+        clock = FakeClock()
+        cache = TTLCache(ttl=10, stale_ttl=20, clock=clock)
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            return len(calls)
+
+        async def run():
+            first = await cache.aget_or_load("page-1", loader)
+            clock.now += 15
+            stale = await cache.aget_or_load("page-1", loader)
+            await asyncio.gather(*cache._refresh_tasks)
+            return first, stale, await cache.aget_or_load("page-1", loader)
+
+        self.assertEqual(asyncio.run(run()), (1, 1, 2))
+        self.assertEqual(cache.stats()["refreshes"], 1)
+
+
+@override_settings(UPSTREAM_RETRIES=0)
+class AsyncMovieAPITest(TestCase):
+    def setUp(self):
+        movie_cache.clear()
+        self.async_client = AsyncClient()
+        self.headers = {"Authorization": "Bearer {}".format(get_access_token(user_id=1))}
+
+    def tearDown(self):
+        movie_cache.clear()
+
+    async def test_movies_are_served_and_cached(self):
+        with MovieStubServer(pages=3) as server, mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}):
+            first = await self.async_client.get("/movies/async/", {"page": 2}, headers=self.headers)
+            second = await self.async_client.get("/movies/async/", {"page": 2}, headers=self.headers)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(json.loads(first.content), server.build_page(2))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(len(server.requests), 1)
+
+    async def test_authentication_is_required(self):
+        resp = await AsyncClient().get("/movies/async/")
+        self.assertEqual(resp.status_code, 401)
+
+    async def test_upstream_body_is_streamed_without_cache(self):
+        with MovieStubServer(pages=2) as server, mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}), \
+                mock.patch.object(movie_cache, "maxsize", 0):
+            resp = await self.async_client.get("/movies/async/", {"page": 2}, headers=self.headers)
+            body = b"".join([chunk async for chunk in resp.streaming_content])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(body), server.build_page(2))
+
+    async def test_local_source_is_served_from_the_movie_table(self):
+        with self.settings(MOVIE_API_SOURCE="local"), mock.patch("movie_collection.movie_api.fetch_movies") as fetch:
+            resp = await self.async_client.get("/movies/async/", {"page": 1}, headers=self.headers)
+            denied = await AsyncClient().get("/movies/async/")
+        fetch.assert_not_called()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content)["count"], await Movie.objects.acount())
+        self.assertEqual(denied.status_code, 401)
+
+    async def test_open_circuit(self):
+        with mock.patch.object(movie_breaker, "before_call", side_effect=CircuitOpenError(retry_after=4)):
+            resp = await self.async_client.get("/movies/async/", {"page": 9}, headers=self.headers)
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp["Retry-After"], "5")
+
+    async def test_upstream_timeout(self):
+        with self.settings(UPSTREAM_READ_TIMEOUT=0.1), MovieStubServer(delay=0.5) as server, \
+                mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}), \
+                mock.patch("movie_collection.utilities._async_clients", {}):
+            resp = await self.async_client.get("/movies/async/", {"page": 3}, headers=self.headers)
+        self.assertEqual(resp.status_code, 500)
+
+    async def test_upstream_waits_overlap(self):
+        # 40 pages that each take 0.2s upstream,awaited concurrently on one event loop
+        with MovieStubServer(pages=40, delay=0.2) as server, mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}):
+            start = time.perf_counter()
+            pages = await asyncio.gather(*[aget_movies(QueryDict("page={}".format(page))) for page in range(1, 41)])
+            elapsed = time.perf_counter() - start
+        self.assertEqual([page.json() for page in pages], [server.build_page(page) for page in range(1, 41)])
+        self.assertLess(elapsed, 3)
+        self.assertEqual(movie_async_flight.stats()["in_flight"], 0)
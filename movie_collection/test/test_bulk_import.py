@@ -0,0 +1,116 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from movie_collection import bulk_import
+from movie_collection.models import Collection, Movie, MovieCollection
+from movie_collection.test.test_movie_collections import get_access_token
+
+
+class BulkImportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        self.existing = Movie.objects.create(title="zzbulk existing", description="kept")
+
+    def post(self, payload):
+        return self.client.post("/collection/bulk/", payload, format="json")
+
+    def import_queries(self, items):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.post(items)
+        self.assertEqual(resp.status_code, 201)
+        return [query["sql"] for query in queries
+                if "requests_" not in query["sql"] and "SAVEPOINT" not in query["sql"]]
+
+    def test_imports_collections_with_deduplicated_movies(self):
+        items = [{"title": "zzbulk {}".format(i), "description": "bulk",
+                  "movies": [{"title": "zzbulk shared", "genres": "Drama"}, {"title": "zzbulk existing"},
+                             {"title": "zzbulk own {}".format(i)}]} for i in range(20)]
+        resp = self.post({"collections": items})
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual((resp.data["created"], resp.data["failed"], resp.data["movies_created"]), (20, 0, 21))
+        self.assertEqual([result["index"] for result in resp.data["results"]], list(range(20)))
+        self.assertTrue(all(result["movie_count"] == 3 for result in resp.data["results"]))
+        collection = Collection.objects.get(id=resp.data["results"][3]["id"])
+        self.assertEqual(collection.user_id, 1)
+        self.assertEqual(sorted(collection.movies.values_list("title", flat=True)),
+                         ["zzbulk existing", "zzbulk own 3", "zzbulk shared"])
+        self.assertEqual(Movie.objects.filter(title="zzbulk shared").count(), 1)
+        self.assertEqual(Movie.objects.get(title="zzbulk existing").description, "kept")
+        self.assertEqual(list(Movie.objects.get(title="zzbulk shared").movie_genres.values_list("genre__name", flat=True)),
+                         ["Drama"])
+
+    def test_statements_do_not_grow_with_the_items(self):
+        def items(prefix, count):
+            return [{"title": "{} {}".format(prefix, i), "description": "bulk",
+                     "movies": [{"title": "{} movie {}".format(prefix, i), "genres": "Drama"}]} for i in range(count)]
+
+        self.assertEqual(len(self.import_queries(items("zzbulk small", 5))),
+                         len(self.import_queries(items("zzbulk large", 50))))
+
+    def test_reports_errors_per_item(self):
+        Collection.objects.create(title="zzbulk taken", description="", user=User.objects.get(id=1))
+        resp = self.post([
+            {"title": "zzbulk ok", "description": "bulk", "movies": [{"title": "zzbulk movie"}]},
+            {"title": "zzbulk taken", "description": "bulk"},
+            {"title": "zzbulk ok", "description": "duplicate of the first item"},
+            {"description": "no title"},
+            {"title": "zzbulk movie without title", "description": "bulk", "movies": [{"genres": "Drama"}]},
+            {"title": "zzbulk ghost", "description": "bulk", "user": 987654321},
+            {"title": "zzbulk uuid clash", "description": "bulk",
+             "movies": [{"title": "zzbulk other title", "uuid": str(self.existing.uuid)}]},
+        ])
+        self.assertEqual(resp.status_code, 201)
+        statuses = [result["status"] for result in resp.data["results"]]
+        self.assertEqual(statuses, ["created"] + ["error"] * 6)
+        self.assertIn("title", resp.data["results"][1]["errors"])
+        self.assertIn("title", resp.data["results"][2]["errors"])
+        self.assertIn("movies", resp.data["results"][4]["errors"])
+        self.assertIn("user", resp.data["results"][5]["errors"])
+        self.assertIn("movies", resp.data["results"][6]["errors"])
+        self.assertFalse(Collection.objects.filter(title="zzbulk uuid clash").exists())
+        self.assertEqual(MovieCollection.objects.filter(collection__title="zzbulk ok").count(), 1)
+
+    def test_titles_taken_by_a_concurrent_insert_are_reported_per_item(self):
+        check = bulk_import.taken_titles
+
+        def concurrent_insert(items, batch_size):
+            taken = check(items, batch_size)
+            if not Collection.objects.filter(title="zzbulk raced").exists():
+                # created by another request after the titles were checked
+                Collection.objects.create(title="zzbulk raced", description="", user=User.objects.get(id=1))
+            return taken
+
+        with mock.patch("movie_collection.bulk_import.taken_titles", side_effect=concurrent_insert):
+            resp = self.post([{"title": "zzbulk raced", "description": "bulk", "movies": [{"title": "zzbulk movie"}]},
+                              {"title": "zzbulk not raced", "description": "bulk"}])
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual([result["status"] for result in resp.data["results"]], ["error", "created"])
+        self.assertIn("title", resp.data["results"][0]["errors"])
+        self.assertEqual((resp.data["created"], resp.data["failed"]), (1, 1))
+        self.assertEqual(Collection.objects.get(title="zzbulk raced").description, "")
+        self.assertTrue(Collection.objects.filter(title="zzbulk not raced").exists())
+
+    def test_other_users_need_a_superuser(self):
+        user = User.objects.create(username="zzbulk user")
+        client = APIClient()
+        client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=user.id))
+        resp = client.post("/collection/bulk/", [{"title": "zzbulk mine", "description": "bulk"},
+                                                 {"title": "zzbulk theirs", "description": "bulk", "user": 1}],
+                           format="json")
+        self.assertEqual([result["status"] for result in resp.data["results"]], ["created", "error"])
+        self.assertEqual(Collection.objects.get(title="zzbulk mine").user_id, user.id)
+        resp = self.post([{"title": "zzbulk for user", "description": "bulk", "user": user.id}])
+        self.assertEqual(Collection.objects.get(id=resp.data["results"][0]["id"]).user_id, user.id)
+
+    @override_settings(COLLECTION_BULK_MAX_ITEMS=2)
+    def test_rejects_invalid_payloads(self):
+        self.assertEqual(self.post({"collections": []}).status_code, 400)
+        self.assertEqual(self.post({"title": "not a list"}).status_code, 400)
+        self.assertEqual(self.post([{"title": "zzbulk {}".format(i), "description": "bulk"} for i in range(3)]).status_code, 400)
+        self.assertEqual(self.post([{"description": "no title"}]).status_code, 400)
@@ -0,0 +1,90 @@
+import math
+import os
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from movie_collection import utilities
+from movie_collection.catalog_sync import sync_movie_catalog, upsert_movies
+from movie_collection.models import Movie, MovieSyncCheckpoint
+from movie_collection.pagination import MovieApiPageNumberPagination
+from movie_collection.test.movie_stub import MovieStubServer
+from movie_collection.test.test_movie_collections import get_access_token
+
+STUB_UUID_PREFIX = "00000000-0000-4000-8000-"
+
+
+class MovieCatalogSyncTest(TestCase):
+    def stub_movies(self):
+        return Movie.objects.filter(uuid__startswith=STUB_UUID_PREFIX)
+
+    def test_full_sync_then_incremental_pass(self):
+        with MovieStubServer(pages=5, page_size=3) as server, \
+                mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}):
+            first = sync_movie_catalog(workers=3, batch_size=4)
+            second = sync_movie_catalog(workers=3, batch_size=4)
+        self.assertEqual((first["pages"], first["created"], first["completed"]), (5, 15, True))
+        self.assertEqual((second["created"], second["updated"], second["unchanged"]), (0, 0, 15))
+        self.assertEqual(self.stub_movies().count(), 15)
+        self.assertEqual(sorted(self.stub_movies().values_list("title", flat=True)),
+                         sorted("stub movie {}".format(i) for i in range(15)))
+        checkpoint = MovieSyncCheckpoint.objects.get()
+        self.assertEqual((checkpoint.next_page, checkpoint.total_pages), (1, 5))
+        self.assertIsNotNone(checkpoint.completed_at)
+
+    def test_interrupted_sync_resumes_from_checkpoint(self):
+        with MovieStubServer(pages=5, page_size=2) as server, \
+                mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}):
+            partial = sync_movie_catalog(workers=2, batch_size=1, max_pages=2)
+            self.assertFalse(partial["completed"])
+            self.assertEqual(MovieSyncCheckpoint.objects.get().next_page, 3)
+            server.requests.clear()
+            resumed = sync_movie_catalog(workers=2, batch_size=1)
+        self.assertEqual(resumed["resumed_from"], 3)
+        self.assertEqual(sorted(int(path.split("page=")[1]) for path in server.requests), [3, 4, 5])
+        self.assertEqual(self.stub_movies().count(), 10)
+
+    def test_changed_movies_are_updated_and_title_conflicts_skipped(self):
+        Movie.objects.create(title="stub movie 1", description="added by a user")
+        upsert_movies([{"uuid": STUB_UUID_PREFIX + "000000000000", "title": "stub movie 0", "description": "old"}])
+        result = upsert_movies([
+            {"uuid": STUB_UUID_PREFIX + "000000000000", "title": "stub movie 0", "description": "new"},
+            {"uuid": STUB_UUID_PREFIX + "000000000001", "title": "stub movie 1", "description": "synced"},
+        ])
+        self.assertEqual(result, {"created": 0, "updated": 1, "unchanged": 0, "conflicts": 1})
+        self.assertEqual(self.stub_movies().get().description, "new")
+
+    def test_command(self):
+        out = StringIO()
+        with MovieStubServer(pages=2) as server, mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}):
+            call_command("sync_movies", "--workers", "2", stdout=out)
+        self.assertIn("synced 2 pages: 4 created", out.getvalue())
+
+    def test_command_reports_upstream_failure(self):
+        with MovieStubServer(status=502) as server, mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}), \
+                self.settings(UPSTREAM_RETRIES=0):
+            utilities._reset_retry_session()
+            with self.assertRaises(CommandError):
+                call_command("sync_movies", stdout=StringIO())
+            utilities._reset_retry_session()
+
+
+class LocalMovieAPITest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+
+    def test_movies_are_served_from_the_local_table(self):
+        upsert_movies([{"uuid": STUB_UUID_PREFIX + "000000000007", "title": "stub movie 7", "genres": "Drama"}])
+        # the newest movie is on the last page
+        last_page = math.ceil(Movie.objects.count() / int(MovieApiPageNumberPagination.page_size))
+        with self.settings(MOVIE_API_SOURCE="local"), mock.patch("movie_collection.movie_api.fetch_movies") as fetch:
+            resp = self.client.get("/movies/", {"page": last_page})
+        fetch.assert_not_called()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["count"], Movie.objects.count())
+        self.assertIn({"title": "stub movie 7", "description": "", "genres": "Drama",
+                       "uuid": STUB_UUID_PREFIX + "000000000007"}, [dict(movie) for movie in resp.data["results"]])
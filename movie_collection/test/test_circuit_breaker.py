@@ -0,0 +1,139 @@
+import asyncio
+import os
+from unittest import mock
+
+from django.http import QueryDict
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase, APIClient
+
+from movie_collection.circuit_breaker import CircuitBreaker, CircuitOpenError
+from movie_collection.context import RequestContext, activate_request_context, deactivate_request_context
+from movie_collection.movie_api import acall_movie_api, call_movie_api, fetch_movies, movie_breaker, movie_cache
+from movie_collection.test.movie_stub import MovieStubServer
+from movie_collection.test.test_movie_api import FakeClock
+from movie_collection.test.test_movie_collections import get_access_token
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_rate=0.5, slow_call_seconds=1.0, slow_call_rate=0.5, window=4,
+                                      min_calls=4, open_seconds=10, clock=self.clock)
+
+    def test_opens_on_failure_rate(self):
+        for success in [True, False, True, False]:
+            self.breaker.before_call()
+            self.breaker.record(success, 0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_opens_on_slow_calls(self):
+        for duration in [0.1, 2.0, 0.1, 3.0]:
+            self.breaker.record(True, duration)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_stays_closed_below_thresholds(self):
+        for success in [True, True, True, False]:
+            self.breaker.record(success, 0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_trial(self):
+        for _ in range(4):
+            self.breaker.record(False, 0.1)
+        self.clock.now = 11
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_reopens(self):
+        for _ in range(4):
+            self.breaker.record(False, 0.1)
+        self.clock.now = 11
+        self.breaker.before_call()
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.stats()["opened"], 2)
+
+    def test_unreported_trial_expires(self):
+        for _ in range(4):
+            self.breaker.record(False, 0.1)
+        self.clock.now = 11
+        self.breaker.before_call()
+        self.clock.now = 15
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.clock.now = 21
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+
+class MovieAPITrialTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        breaker = CircuitBreaker(min_calls=1, open_seconds=10, clock=self.clock)
+        breaker._open()
+        self.clock.now = 11
+        patcher = mock.patch("movie_collection.movie_api.movie_breaker", breaker)
+        self.breaker = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_trial_raising_other_errors_reopens(self):
+        with mock.patch("movie_collection.movie_api.get_retry_session") as get_retry_session, \
+                mock.patch("movie_collection.movie_api.record_outgoing_call"):
+            get_retry_session.return_value.get.side_effect = ValueError("bad chunk")
+            with self.assertRaises(ValueError):
+                call_movie_api({})
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.stats()["failures"], 1)
+
+    def test_cancelled_async_trial_reopens(self):
+        async def send(*args, **kwargs):
+            raise asyncio.CancelledError()
+
+        with mock.patch("movie_collection.movie_api.get_async_client") as get_async_client:
+            get_async_client.return_value.send = send
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(acall_movie_api({}))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+
+class OutgoingCallTest(SimpleTestCase):
+    def test_upstream_call_is_logged_as_outgoing(self):
+        context = RequestContext()
+        token = activate_request_context(context)
+        try:
+            with MovieStubServer() as server, mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}), \
+                    mock.patch("movie_collection.movie_api.get_request_log_writer") as writer:
+                response = fetch_movies(QueryDict("page=2"))
+        finally:
+            deactivate_request_context(token)
+        self.assertEqual(response.status, 200)
+        record = writer.return_value.add.call_args[0][0]
+        self.assertEqual(record["request_type"], "outgoing")
+        self.assertEqual(record["path"], "/api/v1/movies/")
+        self.assertEqual(record["response_status"], "200")
+        self.assertEqual(record["query_params"], {"page": ["2"]})
+        self.assertEqual(record["meta_data"]["retries"], 0)
+        self.assertEqual(record["meta_data"]["bytes"], len(response.body))
+        self.assertEqual(record["meta_data"]["parent_request_id"], context.request_id)
+        self.assertEqual(context.meta_data["upstream"]["status"], 200)
+
+
+class MovieAPICircuitTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        movie_cache.clear()
+
+    def test_open_circuit_fails_fast(self):
+        with mock.patch.object(movie_breaker, "state", CircuitBreaker.OPEN), \
+                mock.patch.object(movie_breaker, "_opened_at", movie_breaker.clock()), \
+                mock.patch("movie_collection.utilities.get_retry_session") as get_retry_session:
+            resp = self.client.get("/movies/", {"page": 99})
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn("Retry-After", resp)
+        get_retry_session.assert_not_called()
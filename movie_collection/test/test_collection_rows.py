@@ -0,0 +1,61 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from movie_collection.fieldsets import MOVIE_FIELDS, USER_FIELDS
+from movie_collection.models import Collection, Movie
+from movie_collection.serializers import CollectionListSerializer, CollectionRowSerializer
+from movie_collection.test.test_movie_collections import get_access_token
+
+
+class CollectionRowSerializerTest(TestCase):
+    def setUp(self):
+        user = User.objects.get(id=1)
+        self.collections = [Collection.objects.create(title="zzrows {}".format(i), description="rows", user=user)
+                            for i in range(3)]
+        movies = [Movie.objects.create(title="zzrows movie {}".format(i), description="plot",
+                                       genres="Drama" if i % 2 else None) for i in range(4)]
+        self.collections[0].movies.set(movies)
+        self.collections[1].movies.set(movies[:1])
+
+    def test_parity_with_collection_list_serializer(self):
+        queryset = Collection.objects.filter(title__startswith="zzrows").order_by("-id")
+        expected = CollectionListSerializer(queryset.prefetch_related("user", "movies"), many=True).data
+        rows = CollectionRowSerializer.to_representation(CollectionRowSerializer.values(queryset))
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(expected))
+
+    def test_list_endpoint_parity(self):
+        client = APIClient()
+        client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        fast = client.get("/collection/", {"search": "zzrows"})
+        with override_settings(COLLECTION_FAST_LIST=False):
+            slow = client.get("/collection/", {"search": "zzrows"})
+        self.assertEqual(fast.content, slow.content)
+        cursor = client.get("/collection/", {"search": "zzrows", "pagination": "cursor", "page_size": 2})
+        self.assertEqual(len(client.get(cursor.data["links"]["next"]).data["results"]), 1)
+
+    def test_retrieve_endpoint_parity(self):
+        client = APIClient()
+        client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        path = "/collection/{}/".format(self.collections[0].id)
+        fast = client.get(path)
+        with override_settings(COLLECTION_FAST_LIST=False):
+            slow = client.get(path)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+        self.assertEqual(client.get("/collection/0/").status_code, 404)
+
+    def test_row_fields_follow_the_serializers(self):
+        serializer = CollectionListSerializer()
+        self.assertEqual(tuple(serializer.fields["user"].fields), USER_FIELDS)
+        self.assertEqual(tuple(serializer.fields["movies"].child.fields), MOVIE_FIELDS)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark_collection_list", collections=2, movies=5, repeat=1, stdout=out)
+        self.assertIn("faster", out.getvalue())
+        self.assertFalse(Collection.objects.filter(description="generated").exists())
@@ -0,0 +1,70 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from movie_collection.models import Collection, Movie
+from movie_collection.test.test_movie_collections import get_access_token
+
+
+class FieldSelectionTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        self.collection = Collection.objects.create(title="zzfields", description="long description",
+                                                    user=User.objects.get(id=1))
+        self.movies = [Movie.objects.create(title="zzfields movie {}".format(i), description="plot " * 50)
+                       for i in range(3)]
+        self.collection.movies.set(self.movies)
+
+    def get(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get("/collection/", dict(params, search="zzfields"))
+        self.assertEqual(resp.status_code, 200)
+        return resp.data["results"][0], [query["sql"] for query in queries]
+
+    def test_full_shape_without_parameters(self):
+        row, _ = self.get({})
+        self.assertEqual(row["user"]["id"], 1)
+        self.assertEqual(len(row["movies"]), 3)
+        self.assertIn("description", row["movies"][0])
+
+    def test_fields_prune_serializer_and_sql(self):
+        row, queries = self.get({"fields": "id,title,movies.title,user.username"})
+        self.assertEqual(set(row), {"id", "title", "movies", "user"})
+        self.assertEqual(row["user"], {"username": User.objects.get(id=1).username})
+        self.assertEqual(sorted(movie["title"] for movie in row["movies"]), [movie.title for movie in self.movies])
+        movie_query = next(sql for sql in queries if 'FROM "movie" INNER JOIN' in sql)
+        self.assertNotIn('"movie"."description"', movie_query)
+        collection_query = next(sql for sql in queries if sql.startswith('SELECT "collection"."id"'))
+        self.assertNotIn('"collection"."description"', collection_query)
+        self.assertFalse([sql for sql in queries if '"auth_user"."password"' in sql and "IN (" in sql])
+
+    def test_unexpanded_relations_are_ids(self):
+        row, queries = self.get({"fields": "id,user,movies"})
+        self.assertEqual(row["user"], 1)
+        self.assertEqual(sorted(row["movies"]), [movie.id for movie in self.movies])
+        self.assertFalse([sql for sql in queries if 'FROM "auth_user" WHERE "auth_user"."id" IN' in sql])
+
+    def test_expand(self):
+        row, _ = self.get({"expand": "movies"})
+        self.assertEqual(row["user"], 1)
+        self.assertIn("description", row["movies"][0])
+
+    def test_slim_view(self):
+        row, _ = self.get({"view": "slim"})
+        self.assertNotIn("movies", row)
+        self.assertEqual(row["movie_count"], 3)
+        self.assertEqual(sorted(str(uuid) for uuid in row["movie_uuids"]), sorted(str(movie.uuid) for movie in self.movies))
+        self.assertEqual(row["title"], "zzfields")
+
+    def test_retrieve(self):
+        resp = self.client.get("/collection/{}/".format(self.collection.id), {"fields": "title", "view": "slim"})
+        self.assertEqual(resp.data, {"title": "zzfields"})
+
+    def test_unknown_fields(self):
+        self.assertEqual(self.client.get("/collection/", {"fields": "id,secret"}).status_code, 400)
+        self.assertEqual(self.client.get("/collection/", {"fields": "movies.secret"}).status_code, 400)
+        self.assertEqual(self.client.get("/collection/", {"expand": "title"}).status_code, 400)
+        self.assertEqual(self.client.get("/collection/", {"view": "tiny"}).status_code, 400)
@@ -0,0 +1,74 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from movie_collection.catalog_sync import upsert_movies
+from movie_collection.genres import parse_genres, sync_movie_genres
+from movie_collection.models import Collection, Genre, Movie, MovieGenre
+from movie_collection.test.test_movie_collections import get_access_token
+
+
+class GenreSyncTest(TestCase):
+    def genres_of(self, movie):
+        return sorted(MovieGenre.objects.filter(movie=movie).values_list("genre__name", flat=True))
+
+    def test_parse_genres(self):
+        self.assertEqual(parse_genres(" Drama, comedy,,drama ,Comedy"), ["Drama", "comedy"])
+        self.assertEqual(parse_genres(None), [])
+
+    def test_saved_movies_are_synced(self):
+        movie = Movie.objects.create(title="Zzgenre One", description="", genres="Drama,Zzgenre Noir")
+        self.assertEqual(self.genres_of(movie), ["Drama", "Zzgenre Noir"])
+        movie.genres = "Zzgenre Noir, Comedy"
+        movie.save()
+        self.assertEqual(self.genres_of(movie), ["Comedy", "Zzgenre Noir"])
+        movie.genres = ""
+        movie.save(update_fields=["genres"])
+        self.assertEqual(self.genres_of(movie), [])
+
+    def test_genre_names_are_matched_case_insensitively(self):
+        first = Movie.objects.create(title="Zzgenre Two", description="", genres="Zzgenre Western")
+        second = Movie.objects.create(title="Zzgenre Three", description="", genres="zzgenre western")
+        self.assertEqual(Genre.objects.filter(name__iexact="zzgenre western").count(), 1)
+        self.assertEqual(self.genres_of(first), self.genres_of(second))
+
+    def test_bulk_upserts_are_synced(self):
+        upsert_movies([{"uuid": "00000000-0000-4000-8000-000000000042", "title": "Zzgenre Bulk",
+                        "genres": "Zzgenre Musical"}])
+        self.assertEqual(self.genres_of(Movie.objects.get(title="Zzgenre Bulk")), ["Zzgenre Musical"])
+
+    def test_sync_is_idempotent(self):
+        movie = Movie.objects.create(title="Zzgenre Four", description="", genres="Drama")
+        sync_movie_genres([(movie.id, movie.genres)])
+        self.assertEqual(self.genres_of(movie), ["Drama"])
+
+
+class GenreAPITest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        self.noir = Movie.objects.create(title="Zzgenre Noir Movie", description="", genres="Zzgenre Noir,Drama")
+        self.both = Movie.objects.create(title="Zzgenre Both", description="", genres="Zzgenre Noir,Zzgenre Space")
+        self.collection = Collection.objects.create(title="Zzgenre collection", description="",
+                                                    user=User.objects.get(id=1))
+        self.collection.movies.set([self.noir, self.both])
+
+    def test_genre_filter(self):
+        resp = self.client.get("/db/movies/", {"genre": "zzgenre space,Zzgenre Unknown"})
+        self.assertEqual([movie["title"] for movie in resp.data], ["Zzgenre Both"])
+
+    def test_movie_genre_facets_follow_filters(self):
+        resp = self.client.get("/db/movies/genres/", {"q": "zzgenre"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["genres"], [{"genre": "Zzgenre Noir", "count": 2}, {"genre": "Drama", "count": 1},
+                                               {"genre": "Zzgenre Space", "count": 1}])
+
+    def test_collection_genre_facets(self):
+        resp = self.client.get("/collection/{}/genres/".format(self.collection.id))
+        self.assertEqual(resp.data["genres"][0], {"genre": "Zzgenre Noir", "count": 2})
+        resp = self.client.get("/collection/genres/", {"genre": "zzgenre space"})
+        self.assertIn({"genre": "Zzgenre Space", "count": 1}, resp.data["genres"])
+
+    def test_collection_genre_filter(self):
+        resp = self.client.get("/collection/", {"genre": "Zzgenre Space"})
+        self.assertEqual([collection["title"] for collection in resp.data["results"]], ["Zzgenre collection"])
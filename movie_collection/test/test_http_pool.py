@@ -0,0 +1,29 @@
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from movie_collection import utilities
+from movie_collection.test.movie_stub import MovieStubServer
+
+
+class PooledSessionTest(SimpleTestCase):
+    def test_process_wide_session_is_reused(self):
+        session = utilities.get_retry_session()
+        self.assertIs(session, utilities.get_retry_session())
+        # what a forked worker does before its first request
+        utilities._reset_retry_session()
+        self.assertIsNot(session, utilities.get_retry_session())
+
+    def test_connections_are_kept_alive(self):
+        session = utilities.build_retry_session()
+        with MovieStubServer() as server:
+            responses = [session.get(server.url, params={"page": page}) for page in [1, 2, 3]]
+        self.assertEqual([response.connection_reused for response in responses], [False, True, True])
+        adapter = session.get_adapter(server.url)
+        self.assertEqual(adapter.stats, {"requests": 3, "new_connections": 1, "reused_connections": 2})
+
+    @override_settings(UPSTREAM_READ_TIMEOUT=0.1, UPSTREAM_RETRIES=0)
+    def test_default_read_timeout(self):
+        session = utilities.build_retry_session()
+        with MovieStubServer(delay=0.5) as server:
+            with self.assertRaises(requests.exceptions.RequestException):
+                session.get(server.url)
@@ -0,0 +1,131 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from movie_collection.aggregates import RollupBuffer
+from movie_collection.log_writer import RequestLogWriter
+from movie_collection.test.test_request_counts import build_record
+
+
+class RequestLogWriterTest(SimpleTestCase):
+    """
+    the writer is exercised with an in-memory sink so no rows are written to the database.
+    """
+
+    def setUp(self):
+        self.written = []
+        self.written_event = threading.Event()
+
+    def sink(self, records):
+        self.written.extend(records)
+        self.written_event.set()
+
+    def test_sync_writer_writes_immediately(self):
+        writer = RequestLogWriter(asynchronous=False, sink=self.sink)
+        writer.add({"path": "/collection/"})
+        self.assertEqual(self.written, [{"path": "/collection/"}])
+
+    def test_batches_are_flushed_by_size(self):
+        writer = RequestLogWriter(batch_size=3, flush_interval=5, sink=self.sink)
+        for i in range(3):
+            writer.add({"path": "/movies/", "i": i})
+        self.assertTrue(self.written_event.wait(timeout=5))
+        self.assertEqual(len(self.written), 3)
+        writer.close()
+
+    def test_batches_are_flushed_by_age(self):
+        writer = RequestLogWriter(batch_size=100, flush_interval=0.05, sink=self.sink)
+        writer.add({"path": "/movies/"})
+        self.assertTrue(self.written_event.wait(timeout=5))
+        writer.close()
+        self.assertEqual(len(self.written), 1)
+
+    def test_close_flushes_buffer(self):
+        writer = RequestLogWriter(batch_size=100, flush_interval=60, sink=self.sink)
+        for i in range(10):
+            writer.add({"i": i})
+        writer.close()
+        self.assertEqual(sorted(record["i"] for record in self.written), list(range(10)))
+
+    def test_close_flushes_rollups_of_the_last_batch(self):
+        buffer = RollupBuffer(flush_interval=60)
+        writer = RequestLogWriter(batch_size=100, flush_interval=60, sink=buffer.add)
+        with mock.patch("movie_collection.log_writer.get_rollup_buffer", return_value=buffer), \
+                mock.patch("movie_collection.aggregates.write_rollups") as write_rollups:
+            for i in range(7):
+                writer.add(build_record("/movies/", status=str(200 + i)))
+            # the atexit flush of the buffer runs before the writer is closed
+            buffer.flush()
+            writer.close()
+        counts = write_rollups.call_args[0][0]
+        self.assertEqual(sum(count for key, count in counts.items() if key[0] == "day"), 7)
+
+    def test_drop_policy(self):
+        writer = RequestLogWriter(max_queue_size=1, flush_interval=60, sink=self.sink)
+        writer._ensure_started = lambda: None
+        self.assertTrue(writer.add({"i": 1}))
+        self.assertFalse(writer.add({"i": 2}))
+        self.assertEqual(writer.stats["dropped"], 1)
+
+    def test_spill_policy(self):
+        spill_path = os.path.join(tempfile.mkdtemp(), "spill.jsonl")
+        writer = RequestLogWriter(max_queue_size=1, policy=RequestLogWriter.SPILL, spill_path=spill_path,
+                                  sink=self.sink)
+        writer._ensure_started = lambda: None
+        writer.add({"i": 1})
+        writer.add({"i": 2, "execution_time": timedelta(milliseconds=15)})
+        self.assertEqual(writer.stats["spilled"], 1)
+        writer.flush()
+        self.assertEqual(len(self.written), 2)
+        self.assertEqual(self.written[1]["execution_time"], timedelta(milliseconds=15))
+        self.assertFalse(os.path.exists(spill_path))
+
+    def test_failed_replay_keeps_the_spill(self):
+        spill_path = os.path.join(tempfile.mkdtemp(), "spill.jsonl")
+        writer = RequestLogWriter(max_queue_size=1, batch_size=2, policy=RequestLogWriter.SPILL,
+                                  spill_path=spill_path, sink=self.sink)
+        writer._ensure_started = lambda: None
+        for i in range(6):
+            writer.add({"i": i})
+        writer._drain(1)
+        calls = []
+
+        def failing_sink(records):
+            calls.append(records)
+            if len(calls) == 2:
+                raise ValueError("database is locked")
+            self.sink(records)
+
+        writer.sink = failing_sink
+        writer._replay_spill()
+        self.assertEqual([record["i"] for record in self.written], [1, 2])
+        self.assertEqual(writer.stats["failed"], 2)
+        # the failed batch and the batch after it are replayed next time
+        writer.sink = self.sink
+        writer._replay_spill()
+        self.assertEqual([record["i"] for record in self.written], [1, 2, 3, 4, 5])
+        self.assertFalse(os.path.exists(spill_path))
+
+    def test_spill_is_replayed_under_steady_traffic(self):
+        spill_path = os.path.join(tempfile.mkdtemp(), "spill.jsonl")
+        with open(spill_path, "w") as spill_file:
+            spill_file.write('{"i": "spilled"}\n')
+        writer = RequestLogWriter(batch_size=1, flush_interval=5, policy=RequestLogWriter.SPILL,
+                                  spill_path=spill_path, sink=self.sink)
+        writer.add({"i": 0})
+        # a full batch is written without a timed out queue wait,the spill goes right after it and
+        # well before the queue wait of flush_interval would time out
+        deadline = time.monotonic() + 2
+        while len(self.written) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([record["i"] for record in self.written], [0, "spilled"])
+        writer.close()
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            RequestLogWriter(policy="discard")
@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.db.models import F
+from django.http import JsonResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase
+from django.utils.functional import SimpleLazyObject
+
+from movie_collection.context import RequestContext, get_request_context, measure
+from movie_collection.middleware import MiddlewareAPI, QueryBudgetExceeded, fingerprint_sql
+
+
+class MiddlewareAPITest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.records = []
+        self.writer = mock.Mock()
+        self.writer.add.side_effect = self.records.append
+        patcher = mock.patch("movie_collection.middleware.get_request_log_writer", return_value=self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def build_request(self, path):
+        request = self.factory.get(path)
+        request.user = AnonymousUser()
+        return request
+
+    def test_concurrent_requests_keep_their_own_timing_and_id(self):
+        barrier = threading.Barrier(2)
+        seen_ids = {}
+
+        def view(request):
+            barrier.wait(timeout=5)
+            time.sleep(float(request.GET["sleep"]))
+            seen_ids[request.path] = get_request_context().request_id
+            return JsonResponse({})
+
+        middleware = MiddlewareAPI(view)
+        threads = [threading.Thread(target=middleware, args=(self.build_request(path),))
+                   for path in ["/fast/?sleep=0.01", "/slow/?sleep=0.3"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        records = {record["path"]: record for record in self.records}
+        self.assertLess(records["/fast/"]["execution_time"], timedelta(seconds=0.25))
+        self.assertGreaterEqual(records["/slow/"]["execution_time"], timedelta(seconds=0.3))
+        self.assertEqual(records["/fast/"]["request_id"], seen_ids["/fast/"])
+        self.assertEqual(records["/slow/"]["request_id"], seen_ids["/slow/"])
+        self.assertNotEqual(seen_ids["/fast/"], seen_ids["/slow/"])
+        self.assertIsNone(get_request_context())
+
+    def test_query_count_is_recorded_without_debug(self):
+        def view(request):
+            User.objects.filter(id=1).first()
+            User.objects.filter(id=1).update(first_name=F("first_name"))
+            return JsonResponse({})
+
+        with self.settings(DEBUG=False):
+            MiddlewareAPI(view)(self.build_request("/collection/"))
+        query_count = self.records[0]["query_count"]
+        self.assertEqual(query_count["SELECT"], 1)
+        self.assertEqual(query_count["UPDATE"], 1)
+        self.assertEqual(query_count["INSERT"], 0)
+        self.assertGreaterEqual(query_count["sql_time_ms"], 0)
+
+
+class QueryInspectorTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        patcher = mock.patch("movie_collection.middleware.get_request_log_writer")
+        self.writer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def build_request(self, path):
+        request = self.factory.get(path)
+        request.user = AnonymousUser()
+        return request
+
+    def test_fingerprint_normalises_literals(self):
+        self.assertEqual(fingerprint_sql('SELECT * FROM "movie" WHERE "movie"."id" = 3'),
+                         fingerprint_sql('SELECT * FROM "movie"  WHERE "movie"."id" = %s'))
+        self.assertEqual(fingerprint_sql("SELECT * FROM movie WHERE title IN ('a', 'b', 'c')"),
+                         "SELECT * FROM movie WHERE title IN (...)")
+
+    def test_repeated_queries_are_flagged(self):
+        def view(request):
+            for user_id in range(1, 7):
+                User.objects.filter(id=user_id).first()
+            return JsonResponse({})
+
+        with self.settings(NPLUSONE_THRESHOLD=5), self.assertLogs(level="WARNING") as logs:
+            MiddlewareAPI(view)(self.build_request("/collection/"))
+        record = self.writer.return_value.add.call_args[0][0]
+        self.assertEqual(record["query_count"]["repeated"][0]["count"], 6)
+        self.assertIn("possible N+1 queries", logs.output[0])
+
+    def test_queries_are_not_fingerprinted_without_n_plus_one_detection(self):
+        def view(request):
+            User.objects.filter(id=1).first()
+            return JsonResponse({})
+
+        with self.settings(NPLUSONE_THRESHOLD=0), \
+                mock.patch("movie_collection.middleware.fingerprint_sql") as fingerprint:
+            MiddlewareAPI(view)(self.build_request("/collection/"))
+        fingerprint.assert_not_called()
+        self.assertEqual(self.writer.return_value.add.call_args[0][0]["query_count"]["SELECT"], 1)
+
+    def test_strict_budget_raises(self):
+        def view(request):
+            User.objects.filter(id=1).first()
+            User.objects.filter(id=2).first()
+            return JsonResponse({})
+
+        request = self.build_request("/collection/")
+        with self.settings(QUERY_BUDGETS={"/collection/": 1}, QUERY_BUDGET_STRICT=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                MiddlewareAPI(view)(request)
+        with self.settings(QUERY_BUDGETS={"/collection/": 2}, QUERY_BUDGET_STRICT=True):
+            MiddlewareAPI(view)(self.build_request("/collection/"))
+
+
+class ServerTimingTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        patcher = mock.patch("movie_collection.middleware.get_request_log_writer")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_nested_measurements_are_exclusive(self):
+        context = RequestContext()
+        with context.measure("serialize"):
+            time.sleep(0.02)
+            with context.measure("db"):
+                time.sleep(0.05)
+        self.assertLess(context.timings["serialize"], 0.05)
+        self.assertGreaterEqual(context.timings["db"], 0.05)
+
+    def test_server_timing_header(self):
+        def view(request):
+            User.objects.filter(id=1).first()
+            with measure("upstream"):
+                time.sleep(0.01)
+            return JsonResponse({})
+
+        request = self.factory.get("/movies/")
+        request.user = AnonymousUser()
+        response = MiddlewareAPI(view)(request)
+        metrics = {metric.split(";")[0]: metric for metric in response.headers["Server-Timing"].split(", ")}
+        self.assertEqual(set(metrics), {"db", "upstream", "app", "total"})
+        upstream_ms = float(metrics["upstream"].split("dur=")[1].split(";")[0])
+        self.assertGreaterEqual(upstream_ms, 10)
+
+
+class AsyncMiddlewareAPITest(TestCase):
+    def setUp(self):
+        self.records = []
+        self.writer = mock.Mock(asynchronous=True, policy="drop", BLOCK="block")
+        self.writer.add.side_effect = self.records.append
+        patcher = mock.patch("movie_collection.middleware.get_request_log_writer", return_value=self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_async_view_runs_on_the_event_loop(self):
+        seen = {}
+
+        async def view(request):
+            seen["thread"] = threading.get_ident()
+            seen["request_id"] = get_request_context().request_id
+            return JsonResponse({})
+
+        middleware = MiddlewareAPI(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        request = AsyncRequestFactory().get("/movies/async/")
+        request.user = AnonymousUser()
+
+        async def serve():
+            seen["loop_thread"] = threading.get_ident()
+            return await middleware(request)
+
+        response = asyncio.run(serve())
+        self.assertEqual(seen["thread"], seen["loop_thread"])
+        self.assertIn("Server-Timing", response.headers)
+        self.assertEqual(self.records[0]["request_id"], seen["request_id"])
+        self.assertIsNone(get_request_context())
+
+    async def test_queries_from_worker_threads_are_counted(self):
+        def load_user():
+            return User.objects.filter(id=1).first()
+
+        async def view(request):
+            await sync_to_async(load_user)()
+            await sync_to_async(load_user, thread_sensitive=False)()
+            return JsonResponse({})
+
+        request = AsyncRequestFactory().get("/collection/")
+        request.user = AnonymousUser()
+        await MiddlewareAPI(view)(request)
+        self.assertEqual(self.records[0]["query_count"]["SELECT"], 2)
+
+    async def test_lazy_user_is_loaded_off_the_event_loop(self):
+        async def view(request):
+            return JsonResponse({})
+
+        request = AsyncRequestFactory().get("/collection/")
+        request.user = SimpleLazyObject(lambda: User.objects.get(id=1))
+        await MiddlewareAPI(view)(request)
+        self.assertEqual(self.records[0]["user"], 1)
@@ -0,0 +1,321 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import requests
+
+from django.http import QueryDict
+from django.test import AsyncClient, SimpleTestCase
+from rest_framework.test import APITestCase, APIClient
+
+from movie_collection.cache import SharedCache, SingleFlight, TTLCache
+from movie_collection.movie_api import UpstreamResponse, get_movies, load_movies, movie_cache
+from movie_collection.test.movie_stub import MovieStubServer
+from movie_collection.test.test_movie_collections import get_access_token
+
+MOVIES_PAGE = b'{"count": 1, "next": null, "previous": null, "results": [{"title": "bahubali"}]}'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=2, ttl=10, stale_ttl=20, clock=self.clock)
+        self.calls = 0
+
+    def loader(self):
+        self.calls += 1
+        return self.calls
+
+    def test_hit_and_miss(self):
+        self.assertEqual(self.cache.get_or_load("a", self.loader), 1)
+        self.assertEqual(self.cache.get_or_load("a", self.loader), 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_lru_eviction(self):
+        self.cache.get_or_load("a", self.loader)
+        self.cache.get_or_load("b", self.loader)
+        self.cache.get_or_load("a", self.loader)
+        self.cache.get_or_load("c", self.loader)
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_stale_entry_is_served_while_refreshing_once(self):
+        refreshed = threading.Event()
+        release = threading.Event()
+
+        def slow_loader():
+            release.wait(timeout=5)
+            refreshed.set()
+            return "new"
+
+        self.cache.set("a", "old")
+        self.clock.now = 15
+        self.assertEqual(self.cache.get_or_load("a", slow_loader), "old")
+        self.assertEqual(self.cache.get_or_load("a", slow_loader), "old")
+        release.set()
+        self.assertTrue(refreshed.wait(timeout=5))
+        for _ in range(50):
+            if self.cache.stats()["refreshes"]:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.cache.stats()["stale"], 2)
+        self.assertEqual(self.cache.stats()["refreshes"], 1)
+        self.assertEqual(self.cache.get_or_load("a", self.loader), "new")
+
+    def test_expired_entry_is_loaded_again(self):
+        self.cache.get_or_load("a", self.loader)
+        self.clock.now = 31
+        self.assertEqual(self.cache.get_or_load("a", self.loader), 2)
+
+    def test_uncacheable_values_are_not_stored(self):
+        cache = TTLCache(should_cache=lambda value: value > 1)
+        cache.get_or_load("a", self.loader)
+        self.assertIsNone(cache.get("a"))
+
+
+def write_shared_entries(path, worker):
+    cache = SharedCache(path)
+    for i in range(20):
+        cache.set("{}-{}".format(worker, i), b"x" * 100)
+
+
+class SharedCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "cache.sqlite3")
+        self.clock = FakeClock()
+        self.clock.now = 1000.0
+
+    def test_entries_are_shared_and_persisted(self):
+        SharedCache(self.path, clock=self.clock).set("page-1", b"movies")
+        self.assertEqual(SharedCache(self.path, clock=self.clock).get("page-1"), (b"movies", True))
+
+    def test_fresh_stale_and_expired(self):
+        cache = SharedCache(self.path, ttl=10, stale_ttl=20, clock=self.clock)
+        cache.set("page-1", b"movies")
+        self.clock.now += 15
+        self.assertEqual(cache.get("page-1"), (b"movies", False))
+        self.clock.now += 20
+        self.assertIsNone(cache.get("page-1"))
+
+    def test_size_bounded_eviction_drops_least_recently_used(self):
+        cache = SharedCache(self.path, max_bytes=250, clock=self.clock)
+        for key in ["a", "b"]:
+            cache.set(key, b"x" * 100)
+            self.clock.now += 2
+        cache.get("a")
+        self.clock.now += 2
+        cache.set("c", b"x" * 100)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["bytes"], 200)
+
+    def test_concurrent_processes(self):
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=write_shared_entries, args=(self.path, worker)) for worker in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=30)
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(SharedCache(self.path).stats()["entries"], 80)
+
+
+def run_locked(lock_dir, log_path):
+    def record():
+        with open(log_path, "a") as log:
+            log.write("start {}\n".format(time.time()))
+        time.sleep(0.2)
+        with open(log_path, "a") as log:
+            log.write("end {}\n".format(time.time()))
+
+    SingleFlight(lock_dir=lock_dir).do("page-1", record)
+
+
+class SingleFlightTest(SimpleTestCase):
+    def run_concurrently(self, flight, function, callers=10):
+        results, errors = [], []
+        barrier = threading.Barrier(callers)
+
+        def call():
+            barrier.wait(timeout=5)
+            try:
+                results.append(flight.do("page-1", function))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_concurrent_calls_share_one_result(self):
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return "movies"
+
+        flight = SingleFlight()
+        results, errors = self.run_concurrently(flight, slow_fetch)
+        self.assertEqual(results, ["movies"] * 10)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats()["followers"], 9)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_errors_are_shared(self):
+        def failing_fetch():
+            time.sleep(0.2)
+            raise requests.exceptions.ConnectionError("upstream down")
+
+        results, errors = self.run_concurrently(SingleFlight(), failing_fetch, callers=4)
+        self.assertEqual(len(errors), 4)
+
+    def test_lock_file_serialises_workers(self):
+        lock_dir = tempfile.mkdtemp()
+        log_path = os.path.join(lock_dir, "calls.log")
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=run_locked, args=(lock_dir, log_path)) for _ in range(2)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=30)
+        with open(log_path) as log:
+            events = [line.split()[0] for line in log]
+        self.assertEqual(events, ["start", "end", "start", "end"])
+
+    def test_lock_files_do_not_grow_with_the_keys(self):
+        lock_dir = tempfile.mkdtemp()
+        flight = SingleFlight(lock_dir=lock_dir, lock_files=4)
+        for page in range(50):
+            self.assertEqual(flight.do("page-{}".format(page), lambda: page), page)
+        self.assertLessEqual(len(os.listdir(lock_dir)), 4)
+
+
+class LoadMoviesTest(SimpleTestCase):
+    def setUp(self):
+        clock = FakeClock()
+        self.shared_cache = SharedCache(os.path.join(tempfile.mkdtemp(), "cache.sqlite3"), ttl=10, stale_ttl=100,
+                                        clock=clock)
+        self.clock = clock
+        patcher = mock.patch("movie_collection.movie_api.shared_movie_cache", self.shared_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fresh_shared_entry_skips_upstream(self):
+        self.shared_cache.set('[["page", ["1"]]]', UpstreamResponse(200, "application/json", MOVIES_PAGE).to_bytes())
+        with mock.patch("movie_collection.movie_api.fetch_movies") as fetch_movies:
+            response = load_movies({}, [["page", ["1"]]])
+        fetch_movies.assert_not_called()
+        self.assertEqual(response.body, MOVIES_PAGE)
+
+    def test_stale_shared_entry_is_served_when_upstream_fails(self):
+        self.shared_cache.set('[["page", ["1"]]]', UpstreamResponse(200, "application/json", MOVIES_PAGE).to_bytes())
+        self.clock.now += 20
+        with mock.patch("movie_collection.movie_api.fetch_movies", side_effect=requests.exceptions.ConnectionError):
+            response = load_movies({}, [["page", ["1"]]])
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.body, MOVIES_PAGE)
+        self.assertTrue(response.stale)
+
+    def test_stale_fallback_is_not_cached_in_memory(self):
+        self.shared_cache.set('[["page", ["1"]]]', UpstreamResponse(200, "application/json", MOVIES_PAGE).to_bytes())
+        self.clock.now += 20
+        movie_cache.clear()
+        self.addCleanup(movie_cache.clear)
+        query_params = QueryDict("page=1")
+        with mock.patch("movie_collection.movie_api.fetch_movies",
+                        side_effect=requests.exceptions.ConnectionError) as fetch_movies:
+            self.assertEqual(get_movies(query_params).body, MOVIES_PAGE)
+            self.assertEqual(get_movies(query_params).body, MOVIES_PAGE)
+        # the movie api is asked again instead of the memory cache serving the stale page as fresh
+        self.assertEqual(fetch_movies.call_count, 2)
+
+
+class MovieAPICacheTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        movie_cache.clear()
+        self.addCleanup(movie_cache.clear)
+
+    def test_repeated_queries_hit_the_cache(self):
+        upstream = UpstreamResponse(200, "application/json", MOVIES_PAGE)
+        with mock.patch("movie_collection.movie_api.fetch_movies", return_value=upstream) as fetch_movies:
+            first = self.client.get("/movies/", {"page": 1, "genre": "x"})
+            second = self.client.get("/movies/", {"genre": "x"})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.content, MOVIES_PAGE)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(fetch_movies.call_count, 1)
+
+    def test_errors_are_not_cached(self):
+        upstream = UpstreamResponse(503, "application/json", b'{"error": "unavailable"}')
+        with mock.patch("movie_collection.movie_api.fetch_movies", return_value=upstream) as fetch_movies:
+            self.client.get("/movies/")
+            resp = self.client.get("/movies/")
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(fetch_movies.call_count, 2)
+
+    def test_cache_stats(self):
+        resp = self.client.get("/movies/cache-stats/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("hits", resp.data["memory"])
+        self.assertIn("hits", resp.data["shared"])
+
+
+class MoviePassthroughTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+
+    def test_upstream_body_is_streamed_without_cache(self):
+        with MovieStubServer(pages=2) as server, mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}), \
+                mock.patch.object(movie_cache, "maxsize", 0):
+            resp = self.client.get("/movies/", {"page": 2})
+            body = b"".join(resp.streaming_content)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "application/json")
+        self.assertEqual(json.loads(body), server.build_page(2))
+
+    async def test_upstream_body_is_streamed_asynchronously_under_asgi(self):
+        headers = {"Authorization": self.client.defaults['HTTP_AUTHORIZATION']}
+        with MovieStubServer(pages=2) as server, mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}), \
+                mock.patch.object(movie_cache, "maxsize", 0):
+            resp = await AsyncClient().get("/movies/", {"page": 2}, headers=headers)
+            body = b"".join([chunk async for chunk in resp.streaming_content])
+        self.assertTrue(resp.is_async)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(body), server.build_page(2))
+
+    def test_upstream_status_is_kept(self):
+        with MovieStubServer(status=404) as server, mock.patch.dict(os.environ, {"MOVIE_API_URL": server.url}), \
+                mock.patch.object(movie_cache, "maxsize", 0):
+            resp = self.client.get("/movies/")
+            b"".join(resp.streaming_content)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_parsed_mode(self):
+        upstream = UpstreamResponse(200, "application/json", MOVIES_PAGE)
+        movie_cache.clear()
+        with self.settings(MOVIE_API_PASSTHROUGH=False), \
+                mock.patch("movie_collection.movie_api.fetch_movies", return_value=upstream):
+            resp = self.client.get("/movies/", {"page": 7})
+        movie_cache.clear()
+        self.assertEqual(resp.data["results"][0]["title"], "bahubali")
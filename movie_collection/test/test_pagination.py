@@ -0,0 +1,190 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from movie_collection.models import Collection, Movie
+from movie_collection.test.test_movie_collections import get_access_token
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        user = User.objects.get(id=1)
+        # duplicate titles across users are allowed,so title ordering needs the id tie breaker
+        for title in ["zzpage c", "zzpage a", "zzpage b", "zzpage a2", "zzpage d"]:
+            Collection.objects.create(title=title, description="", user=user)
+
+    def walk(self, path, params):
+        """
+        follows the next links and returns the titles of every page.
+        """
+        pages = []
+        resp = self.client.get(path, params)
+        while True:
+            self.assertEqual(resp.status_code, 200)
+            pages.append([row["title"] for row in resp.data["results"]])
+            if not resp.data["links"]["next"]:
+                return pages, resp
+            resp = self.client.get(resp.data["links"]["next"])
+
+    def test_cursor_pages_follow_the_id_ordering(self):
+        expected = list(Collection.objects.order_by("-id").values_list("title", flat=True))
+        pages, _ = self.walk("/collection/", {"pagination": "cursor", "page_size": 2})
+        self.assertEqual([title for page in pages for title in page], expected)
+        self.assertTrue(all(len(page) == 2 for page in pages[:-1]))
+
+    def test_cursor_envelope_has_no_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get("/collection/", {"pagination": "cursor", "page_size": 2})
+        self.assertFalse([query for query in queries if "COUNT(" in query["sql"] and '"collection"' in query["sql"]])
+        page = resp.data["page"]
+        self.assertEqual((page["mode"], page["count"], page["total_pages"], page["prev_cursor"]), ("cursor", None, None, None))
+        self.assertIsNotNone(page["next_cursor"])
+
+    def test_title_ordering_and_previous_links(self):
+        expected = list(Collection.objects.filter(title__startswith="zzpage").order_by("title", "id")
+                        .values_list("title", flat=True))
+        pages, last = self.walk("/collection/", {"pagination": "cursor", "page_size": 2, "ordering": "title",
+                                                 "search": "zzpage"})
+        self.assertEqual([title for page in pages for title in page], expected)
+        previous = self.client.get(last.data["links"]["previous"])
+        self.assertEqual([row["title"] for row in previous.data["results"]], pages[-2])
+        self.assertIsNotNone(previous.data["page"]["next_cursor"])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/collection/", {"cursor": "garbage"}).status_code, 404)
+        first = self.client.get("/collection/", {"pagination": "cursor", "page_size": 1})
+        # a cursor of the id ordering cannot be used with the title ordering
+        resp = self.client.get("/collection/", {"cursor": first.data["page"]["next_cursor"], "ordering": "title"})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_page_numbers_still_work(self):
+        resp = self.client.get("/collection/", {"page_size": 2, "page": 2})
+        self.assertEqual(resp.data["page"]["current_page"], 2)
+        self.assertIsNotNone(resp.data["page"]["count"])
+
+    def test_db_movies_cursor(self):
+        for index in range(3):
+            Movie.objects.create(title="zzpage movie {}".format(index), description="")
+        expected = list(Movie.objects.order_by("-id").values_list("title", flat=True))
+        pages, _ = self.walk("/db/movies/", {"pagination": "cursor", "page_size": 4})
+        self.assertEqual([title for page in pages for title in page], expected)
+
+    def test_db_movies_are_a_bare_list_without_page_parameters(self):
+        Movie.objects.create(title="zzpage movie", description="")
+        resp = self.client.get("/db/movies/")
+        self.assertEqual([movie["title"] for movie in resp.data],
+                         list(Movie.objects.order_by("-id").values_list("title", flat=True)))
+        resp = self.client.get("/db/movies/", {"page": 1, "q": "zzpage"})
+        self.assertEqual((resp.data["page"]["current_page"], resp.data["results"][0]["title"]), (1, "zzpage movie"))
+
+    def test_cursor_with_unsupported_ordering(self):
+        resp = self.client.get("/db/movies/", {"q": "zzpage", "pagination": "cursor"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class CountStrategyTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        self.user = User.objects.get(id=1)
+
+    def count_queries(self, params=None):
+        # pages of one row,so the first page is not the last one,whose count is exact anyway
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get("/collection/", dict({"page_size": 1}, **(params or {})))
+        self.assertEqual(resp.status_code, 200)
+        counts = [query for query in queries if "COUNT(" in query["sql"] and '"collection"' in query["sql"]]
+        return resp.data["page"], len(counts)
+
+    def test_exact_counts_are_cached_until_collection_writes(self):
+        page, counted = self.count_queries()
+        self.assertEqual((page["count"], page["count_exact"], counted), (Collection.objects.count(), True, 1))
+        page, counted = self.count_queries()
+        self.assertEqual((page["count"], counted), (Collection.objects.count(), 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            collection = Collection.objects.create(title="zzcount", description="", user=self.user)
+        page, counted = self.count_queries()
+        self.assertEqual((page["count"], counted), (Collection.objects.count(), 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            collection.delete()
+        self.assertEqual(self.count_queries()[0]["count"], Collection.objects.count())
+
+    def test_counts_are_kept_until_the_write_commits(self):
+        count = self.count_queries()[0]["count"]
+        with self.captureOnCommitCallbacks() as callbacks:
+            Collection.objects.create(title="zzcount pending", description="", user=self.user)
+            # the write is not committed yet,so the count is not dropped yet either
+            page, counted = self.count_queries()
+            self.assertEqual((page["count"], counted), (count, 0))
+        for callback in callbacks:
+            callback()
+        page, counted = self.count_queries()
+        self.assertEqual((page["count"], counted), (count + 1, 1))
+
+    def test_rolled_back_writes_keep_the_counts(self):
+        self.count_queries()
+        try:
+            with transaction.atomic():
+                Collection.objects.create(title="zzcount rolled back", description="", user=self.user)
+                raise DatabaseError
+        except DatabaseError:
+            pass
+        self.assertEqual(cache.get("count-generation:movie_collection.collection"), 0)
+
+    def test_counts_are_cached_per_filter(self):
+        Collection.objects.create(title="zzcount one", description="", user=self.user)
+        self.count_queries()
+        page, counted = self.count_queries({"search": "zzcount"})
+        self.assertEqual((page["count"], counted), (1, 1))
+
+    def test_movie_changes_drop_genre_filtered_counts(self):
+        collection = Collection.objects.create(title="zzcount genre", description="", user=self.user)
+        self.assertEqual(self.count_queries({"genre": "zzgenre"})[0]["count"], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            movie = Movie.objects.create(title="zzcount movie", description="", genres="zzgenre")
+            collection.movies.add(movie)
+        self.assertEqual(self.count_queries({"genre": "zzgenre"})[0]["count"], 1)
+
+    @override_settings(COUNT_ESTIMATE_THRESHOLD=1)
+    def test_estimates_below_the_row_count_do_not_hide_pages(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE collection")
+        for index in range(25):
+            Collection.objects.create(title="zzcount low {}".format(index), description="", user=self.user)
+        total = Collection.objects.count()
+        page, _ = self.count_queries({"page_size": 10})
+        self.assertFalse(page["count_exact"])
+        self.assertLess(page["count"], total)
+        seen, resp = [], self.client.get("/collection/", {"page_size": 10})
+        while True:
+            self.assertEqual(resp.status_code, 200)
+            seen += [row["id"] for row in resp.data["results"]]
+            if resp.data["page"]["next_page"] is None:
+                break
+            resp = self.client.get("/collection/", {"page_size": 10, "page": resp.data["page"]["next_page"]})
+        self.assertEqual(sorted(seen), sorted(Collection.objects.values_list("id", flat=True)))
+        # the last page knows the real count
+        self.assertEqual((resp.data["page"]["count"], resp.data["page"]["count_exact"],
+                          resp.data["page"]["total_pages"]), (total, True, -(-total // 10)))
+        self.assertEqual(self.client.get("/collection/", {"page_size": 10, "page": 99}).status_code, 404)
+
+    @override_settings(COUNT_ESTIMATE_THRESHOLD=1)
+    def test_large_unfiltered_tables_are_estimated(self):
+        Collection.objects.create(title="zzcount estimate", description="", user=self.user)
+        # without table statistics the count is exact
+        page, counted = self.count_queries()
+        self.assertEqual((page["count"], page["count_exact"], counted), (Collection.objects.count(), True, 1))
+        cache.clear()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE collection")
+        page, counted = self.count_queries()
+        self.assertEqual((page["count_exact"], counted), (False, 0))
+        self.assertGreaterEqual(page["count"], Collection.objects.count())
+        # the statistics are for the whole table,filtered lists are counted
+        page, counted = self.count_queries({"search": "zzcount"})
+        self.assertEqual((page["count"], page["count_exact"], counted), (1, True, 1))
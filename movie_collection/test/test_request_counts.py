@@ -0,0 +1,280 @@
+import csv
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import AsyncClient, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.test import APITestCase, APIClient
+
+from movie_collection.aggregates import LatencyHistogram, RollupBuffer
+from movie_collection.log_writer import write_request_logs
+from movie_collection.models import LatencyRollup, RequestCountRollup, RequestData
+from movie_collection.retention import prune_request_logs
+from movie_collection.test.test_movie_collections import get_access_token
+
+
+def build_record(path, status="200", request_time="2024-09-22 10:15:30"):
+    return {"request_id": "id-{}-{}-{}".format(path, status, request_time), "user": 1, "path": path,
+            "ip_address": "127.0.0.1", "method": "GET", "response_status": status, "node_id": "node_a",
+            "execution_time": timedelta(milliseconds=12), "request_time": request_time,
+            "request_type": "incoming"}
+
+
+class RequestCountRollupTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        self.request_count_path = "/request-count/"
+        RequestCountRollup.objects.all().delete()
+        write_request_logs([build_record("/collection/"), build_record("/collection/", status="404"),
+                            build_record("/movies/", request_time="2024-09-22 11:00:05")])
+
+    def test_rollups_are_updated_when_logs_are_written(self):
+        for granularity in [RequestCountRollup.MINUTE, RequestCountRollup.HOUR, RequestCountRollup.DAY]:
+            rollups = RequestCountRollup.objects.filter(granularity=granularity)
+            self.assertEqual(sum(rollups.values_list("count", flat=True)), 3)
+        self.assertEqual(RequestCountRollup.objects.get(granularity=RequestCountRollup.DAY, path="/collection/",
+                                                        response_status="200").count, 1)
+
+    def test_count_with_time_range_and_grouping(self):
+        resp = self.client.get(self.request_count_path, {"start": "2024-09-22T10:00:00Z",
+                                                         "end": "2024-09-22T11:00:00Z", "group_by": "path,status"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["count"], 2)
+        self.assertEqual(sorted((group["path"], group["status"], group["count"]) for group in resp.data["groups"]),
+                         [("/collection/", "200", 1), ("/collection/", "404", 1)])
+
+    def test_count_rejects_unknown_group(self):
+        resp = self.client.get(self.request_count_path, {"group_by": "colour"})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_reset_clears_rollups(self):
+        resp = self.client.post(self.request_count_path + "reset/")
+        self.assertEqual(resp.status_code, 200)
+        # only the reset request itself is counted afterwards
+        self.assertFalse(RequestCountRollup.objects.exclude(path=self.request_count_path + "reset/").exists())
+        self.assertFalse(LatencyRollup.objects.exclude(path=self.request_count_path + "reset/").exists())
+
+
+class RollupBufferTest(TestCase):
+    def setUp(self):
+        RequestCountRollup.objects.all().delete()
+        LatencyRollup.objects.all().delete()
+
+    def records(self, count):
+        return [build_record("/path/{}/".format(i % 20), request_time="2024-09-22 10:{:02d}:00".format(i % 60))
+                for i in range(count)]
+
+    def test_rollups_are_written_once_per_key_on_flush(self):
+        buffer = RollupBuffer(flush_interval=60)
+        buffer.add(self.records(100))
+        buffer.add(self.records(100))
+        buffer.flush_if_due()
+        self.assertFalse(RequestCountRollup.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            buffer.flush()
+        # one upsert for the counts,one read and one insert for the histograms,plus the transaction
+        self.assertLessEqual(len([query for query in queries if "SAVEPOINT" not in query["sql"]]), 6)
+        self.assertEqual(buffer.pending(), 0)
+        for granularity in [RequestCountRollup.MINUTE, RequestCountRollup.HOUR, RequestCountRollup.DAY]:
+            self.assertEqual(sum(RequestCountRollup.objects.filter(granularity=granularity)
+                                 .values_list("count", flat=True)), 200)
+            self.assertEqual(sum(LatencyRollup.objects.filter(granularity=granularity)
+                                 .values_list("count", flat=True)), 200)
+
+    def test_flushes_add_to_existing_rollups(self):
+        buffer = RollupBuffer(flush_interval=60)
+        for _ in range(2):
+            buffer.add([build_record("/collection/")])
+            buffer.flush()
+        self.assertEqual(RequestCountRollup.objects.get(granularity=RequestCountRollup.DAY).count, 2)
+        latency = LatencyRollup.objects.get(granularity=RequestCountRollup.DAY)
+        self.assertEqual((latency.count, latency.get_histogram().count), (2, 2))
+
+    def test_failed_batches_are_not_counted(self):
+        buffer = RollupBuffer(flush_interval=60)
+        write_request_logs([build_record("/collection/")])
+        with mock.patch("movie_collection.aggregates._rollup_buffer", buffer):
+            # the request id is taken,so the insert fails and the batch is not counted
+            with self.assertRaises(IntegrityError):
+                write_request_logs([build_record("/collection/")])
+            write_request_logs([build_record("/movies/")])
+        self.assertEqual([dict(key[2])["path"] for key in buffer._counts], ["/movies/"] * 3)
+
+
+class RequestLogExportTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        self.request_log_path = "/request-count/request-log/"
+        RequestData.objects.all().delete()
+        write_request_logs([build_record("/collection/", request_time="2024-09-22 10:00:0{}".format(i))
+                            for i in range(5)] + [build_record("/movies/", status="500")])
+
+    def get_rows(self, resp):
+        self.assertTrue(resp.streaming)
+        return [json.loads(line) for line in b"".join(resp.streaming_content).decode().splitlines()]
+
+    def test_json_export(self):
+        resp = self.client.get(self.request_log_path)
+        self.assertEqual(resp.status_code, 200)
+        rows = json.loads(b"".join(resp.streaming_content))
+        # the export request is logged before its body is streamed,so it shows up last
+        self.assertEqual([row["path"] for row in rows], ["/collection/"] * 5 + ["/movies/", self.request_log_path])
+
+    def test_ndjson_export_with_filters(self):
+        resp = self.client.get(self.request_log_path, {"export_format": "ndjson", "path": "/movies/",
+                                                       "status": "500"})
+        rows = self.get_rows(resp)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["response_status"], "500")
+
+    def test_csv_export(self):
+        resp = self.client.get(self.request_log_path, {"export_format": "csv", "path": "/movies/"})
+        rows = list(csv.reader(b"".join(resp.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:2], ["id", "request_id"])
+        self.assertEqual(len(rows), 2)
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        resp = await AsyncClient().get(self.request_log_path, {"export_format": "ndjson", "chunk_size": 2},
+                                       headers={"Authorization": self.client.defaults['HTTP_AUTHORIZATION']})
+        self.assertEqual(resp.status_code, 200)
+        # a sync iterator would be read into a list by Django before sending
+        self.assertTrue(resp.is_async)
+        rows = [json.loads(line) for line in b"".join([chunk async for chunk in resp.streaming_content]).splitlines()]
+        self.assertEqual([row["path"] for row in rows][:6], ["/collection/"] * 5 + ["/movies/"])
+
+    def test_cursor_resumes_export(self):
+        resp = self.client.get(self.request_log_path, {"export_format": "ndjson", "limit": 4, "chunk_size": 2})
+        first_page = self.get_rows(resp)
+        self.assertEqual(len(first_page), 4)
+        resp = self.client.get(self.request_log_path, {"export_format": "ndjson", "cursor": resp["X-Next-Cursor"]})
+        second_page = self.get_rows(resp)
+        self.assertFalse(resp.has_header("X-Next-Cursor"))
+        self.assertEqual([row["id"] for row in first_page + second_page],
+                         sorted(RequestData.objects.values_list("id", flat=True)))
+
+    def test_invalid_export_format(self):
+        resp = self.client.get(self.request_log_path, {"export_format": "xml"})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get(self.request_log_path, {"cursor": "not-a-cursor"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class RequestLogRetentionTest(TestCase):
+    def setUp(self):
+        RequestData.objects.all().delete()
+        old = (timezone.now() - timedelta(days=40)).strftime('%Y-%m-%d %H:%M:%S')
+        recent = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+        write_request_logs([build_record("/collection/", request_time=old)] +
+                           [build_record("/movies/", request_time=recent, status=str(200 + i)) for i in range(5)])
+
+    def test_prune_by_age(self):
+        result = prune_request_logs(days=30, chunk_size=2)
+        self.assertEqual(result["deleted_rows"], 1)
+        self.assertIsNotNone(result["reclaimed_bytes"])
+        self.assertEqual(set(RequestData.objects.values_list("path", flat=True)), {"/movies/"})
+
+    def test_keep_last_rows_per_path(self):
+        newest = list(RequestData.objects.filter(path="/movies/").order_by("-id").values_list("id", flat=True)[:2])
+        prune_request_logs(keep_per_path=2, chunk_size=1)
+        self.assertEqual(sorted(RequestData.objects.filter(path="/movies/").values_list("id", flat=True)),
+                         sorted(newest))
+        self.assertEqual(RequestData.objects.filter(path="/collection/").count(), 1)
+
+    def test_sparse_deletes_take_one_transaction_per_chunk(self):
+        write_request_logs([build_record("/spread/{}/".format(i % 2), request_time="2024-09-22 10:{:02d}:00".format(i))
+                            for i in range(40)])
+        with CaptureQueriesContext(connection) as queries:
+            result = prune_request_logs(keep_per_path=18, chunk_size=2)
+        # two old rows per /spread/ path,each path's ids span the whole table
+        self.assertEqual(result["deleted_rows"], 4)
+        deletes = [query for query in queries.captured_queries if query["sql"].startswith("DELETE")]
+        self.assertEqual(len(deletes), 2)
+
+    def test_keep_per_path_threshold_uses_path_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            prune_request_logs(keep_per_path=2, dry_run=True)
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                for row in cursor.execute("EXPLAIN QUERY PLAN " + query["sql"]):
+                    # distinct paths read the index only,everything else seeks it
+                    self.assertFalse(row[-1].startswith("SCAN requests_tracking") and "INDEX" not in row[-1],
+                                     query["sql"])
+
+    def test_prune_minute_rollups(self):
+        RequestCountRollup.objects.all().delete()
+        LatencyRollup.objects.all().delete()
+        write_request_logs([build_record("/collection/", request_time="2024-09-22 10:15:30")])
+        result = prune_request_logs(minute_rollup_days=7)
+        # the minute count and latency rollups of the request
+        self.assertEqual(result["deleted_rollups"], 2)
+        self.assertEqual(LatencyRollup.objects.count(), 2)
+        self.assertEqual(set(RequestCountRollup.objects.filter(path="/collection/", bucket_start__year=2024)
+                             .values_list("granularity", flat=True)), {RequestCountRollup.HOUR, RequestCountRollup.DAY})
+
+    def test_command_dry_run(self):
+        out = StringIO()
+        call_command("prune_request_logs", "--days", "30", "--dry-run", stdout=out)
+        self.assertIn("1 request logs would be deleted", out.getvalue())
+        self.assertEqual(RequestData.objects.count(), 6)
+
+
+class LatencyHistogramTest(SimpleTestCase):
+    def test_percentiles_are_within_relative_error(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 100001):
+            histogram.record(value)
+        for percent in [50, 95, 99]:
+            expected = percent * 1000
+            self.assertAlmostEqual(histogram.percentile(percent), expected, delta=expected * 0.04)
+        self.assertEqual(histogram.maximum, 100000)
+
+    def test_merged_histograms_match_single_histogram(self):
+        single, first, second = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        for value in range(0, 5000, 7):
+            single.record(value)
+            (first if value % 2 else second).record(value)
+        merged = LatencyHistogram(buckets=first.to_json(), count=first.count, total=first.total,
+                                  maximum=first.maximum).merge(second)
+        self.assertEqual(merged.to_json(), single.to_json())
+        self.assertEqual(merged.percentile(99), single.percentile(99))
+
+
+class LatencyEndpointTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        LatencyRollup.objects.all().delete()
+        records = []
+        for i in range(100):
+            record = build_record("/collection/", request_time="2024-09-22 10:{:02d}:00".format(i % 60))
+            record["request_id"] += str(i)
+            record["execution_time"] = timedelta(milliseconds=i + 1)
+            records.append(record)
+        write_request_logs(records)
+
+    def test_latency_percentiles(self):
+        resp = self.client.get("/request-count/latency/", {"start": "2024-09-22T10:00:00Z",
+                                                          "end": "2024-09-22T11:00:00Z"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["window"]["granularity"], "hour")
+        result = resp.data["results"][0]
+        self.assertEqual((result["path"], result["method"], result["node_id"]), ("/collection/", "GET", "node_a"))
+        self.assertEqual(result["count"], 100)
+        self.assertAlmostEqual(result["p50_ms"], 50, delta=2)
+        self.assertAlmostEqual(result["p99_ms"], 99, delta=4)
+        self.assertEqual(result["max_ms"], 100)
+        self.assertAlmostEqual(result["throughput_rps"], 100 / 3600, places=4)
+
+    def test_latency_grouped_by_node(self):
+        resp = self.client.get("/request-count/latency/", {"group_by": "node_id", "path": "/collection/"})
+        self.assertEqual(resp.data["results"][0]["node_id"], "node_a")
+        self.assertEqual(resp.data["results"][0]["count"], 100)
+        self.assertNotIn("path", resp.data["results"][0])
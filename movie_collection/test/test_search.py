@@ -0,0 +1,58 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from movie_collection.catalog_sync import upsert_movies
+from movie_collection.models import Movie
+from movie_collection.search import build_match_expression, fts_available, search_movies, search_terms
+from movie_collection.test.test_movie_collections import get_access_token
+
+
+class MovieSearchTest(TestCase):
+    def setUp(self):
+        self.godfather = Movie.objects.create(title="Zzsearch Godfather", description="a crime family saga")
+        self.documentary = Movie.objects.create(title="Zzsearch Documentary",
+                                                description="how the godfather trilogy was made")
+        self.other = Movie.objects.create(title="Zzsearch Other", description="nothing in common")
+
+    def search(self, query):
+        return list(search_movies(Movie.objects.all(), query).values_list("title", flat=True))
+
+    def test_index_is_available_on_sqlite(self):
+        self.assertEqual(fts_available(), connection.vendor == "sqlite")
+
+    def test_prefix_match_ranks_title_first(self):
+        self.assertEqual(self.search("zzsearch godf"), ["Zzsearch Godfather", "Zzsearch Documentary"])
+
+    def test_index_follows_updates_and_deletes(self):
+        Movie.objects.filter(id=self.other.id).update(description="a godfather parody")
+        self.documentary.delete()
+        self.assertEqual(self.search("zzsearch godfather"), ["Zzsearch Godfather", "Zzsearch Other"])
+
+    def test_bulk_upserts_are_indexed(self):
+        upsert_movies([{"uuid": "00000000-0000-4000-8000-000000000099", "title": "Zzsearch Upserted",
+                        "description": "bulk"}])
+        self.assertEqual(self.search("zzsearch bulk"), ["Zzsearch Upserted"])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(search_terms('godfather" OR (NEAR'), ["godfather", "OR", "NEAR"])
+        self.assertEqual(build_match_expression(["godf", "OR"]), '"godf"* "OR"*')
+        self.assertEqual(self.search('"*)('), [])
+
+    def test_icontains_fallback(self):
+        with mock.patch.dict("movie_collection.search._fts_available", {"default": False}):
+            self.assertEqual(sorted(self.search("zzsearch godfather")), ["Zzsearch Documentary", "Zzsearch Godfather"])
+
+
+class MovieSearchAPITest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(get_access_token(user_id=1))
+        Movie.objects.create(title="Zzsearch Heat", description="a heist")
+
+    def test_q_parameter(self):
+        resp = self.client.get("/db/movies/", {"q": "zzsearch hea"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([movie["title"] for movie in resp.data], ["Zzsearch Heat"])
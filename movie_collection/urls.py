@@ -15,5 +15,6 @@ router.register(r'request-count', views.RequestDataAPI, basename='RequestDataAPI
 router.register(r'user', UserAPI, 'UserAPI')
 router.register(r'db/movies', views.MoviesFromDbAPI, basename='MoviesFromDbAPI')
 urlpatterns = [
+    path('movies/async/', views.AsyncMovieAPI.as_view(), name='AsyncMovieAPI'),
 ]
 urlpatterns += router.urls
\ No newline at end of file
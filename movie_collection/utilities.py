@@ -1,22 +1,214 @@
+import asyncio
+import base64
+import itertools
+import json
+import os
+import threading
+import weakref
+
+import httpx
 import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from requests.adapters import HTTPAdapter
-from urllib3 import Retry
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool, Retry
 
 
-def get_retry_session():
+_pool_local = threading.local()
+
+
+class ConnectionCountingPoolMixin:
+    """
+    counts the connections opened by the current thread,so a request can tell whether it reused a
+    pooled connection or had to open (and handshake) a new one.
+    """
+
+    def _new_conn(self):
+        _pool_local.new_connections = getattr(_pool_local, "new_connections", 0) + 1
+        return super()._new_conn()
+
+
+class CountingHTTPConnectionPool(ConnectionCountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(ConnectionCountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with a default (connect, read) timeout and connection reuse statistics.each response
+    gets a connection_reused attribute.
+    """
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.timeout = timeout
+        self.stats = {"requests": 0, "new_connections": 0, "reused_connections": 0}
+        self._stats_lock = threading.Lock()
+        super(PooledHTTPAdapter, self).__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": CountingHTTPConnectionPool,
+                                                   "https": CountingHTTPSConnectionPool}
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        new_connections_before = getattr(_pool_local, "new_connections", 0)
+        response = super(PooledHTTPAdapter, self).send(request, **kwargs)
+        new_connections = getattr(_pool_local, "new_connections", 0) - new_connections_before
+        response.connection_reused = new_connections == 0
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["new_connections"] += new_connections
+            self.stats["reused_connections"] += int(response.connection_reused)
+        return response
+
+
+def build_retry_session():
     """
-    Create a requests session with retry mechanism.
+    Create a requests session with retry mechanism,connection pooling and timeouts.
     """
     session = requests.Session()
     retries = Retry(
-        total=3,
-        backoff_factor=0.5,
+        total=settings.UPSTREAM_RETRIES,
+        backoff_factor=settings.UPSTREAM_RETRY_BACKOFF,
         status_forcelist=[500, 502, 503, 504],
-        method_whitelist=["GET"],
+        allowed_methods=["GET"],
         raise_on_status=False
     )
-    adapter = HTTPAdapter(max_retries=retries)
+    adapter = PooledHTTPAdapter(max_retries=retries,
+                                pool_connections=settings.UPSTREAM_POOL_CONNECTIONS,
+                                pool_maxsize=settings.UPSTREAM_POOL_MAXSIZE,
+                                timeout=(settings.UPSTREAM_CONNECT_TIMEOUT, settings.UPSTREAM_READ_TIMEOUT))
     session.mount('http://', adapter)
     session.mount('https://', adapter)
 
-    return session
\ No newline at end of file
+    return session
+
+
+_retry_session = None
+_retry_session_lock = threading.Lock()
+
+
+def _reset_retry_session():
+    # pooled sockets must not be shared between a parent and its forked workers
+    global _retry_session, _retry_session_lock
+    _retry_session = None
+    _retry_session_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_retry_session)
+
+
+def get_retry_session():
+    """
+    process wide pooled session,so upstream calls reuse keep-alive connections instead of paying a
+    tcp and tls handshake each time.
+    """
+    global _retry_session
+    if _retry_session is None:
+        with _retry_session_lock:
+            if _retry_session is None:
+                _retry_session = build_retry_session()
+    return _retry_session
+
+
+def build_async_client():
+    """
+    Create an async http client with connection pooling,timeouts and retries of failed connects.
+    """
+    limits = httpx.Limits(max_connections=settings.UPSTREAM_ASYNC_MAX_CONNECTIONS,
+                          max_keepalive_connections=settings.UPSTREAM_POOL_MAXSIZE)
+    transport = httpx.AsyncHTTPTransport(verify=False, limits=limits, retries=settings.UPSTREAM_RETRIES)
+    return httpx.AsyncClient(transport=transport,
+                             timeout=httpx.Timeout(settings.UPSTREAM_READ_TIMEOUT,
+                                                   connect=settings.UPSTREAM_CONNECT_TIMEOUT))
+
+
+# an async client can only be used on the event loop it was created on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _reset_async_clients():
+    global _async_clients
+    _async_clients = weakref.WeakKeyDictionary()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_async_clients)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    pooled async client of the running event loop,shared by all requests served on it.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = build_async_client()
+    return client
+
+
+def get_pool_stats() -> dict:
+    adapter = get_retry_session().get_adapter("https://")
+    with adapter._stats_lock:
+        stats = dict(adapter.stats)
+    stats["reuse_ratio"] = round(stats["reused_connections"] / stats["requests"], 4) if stats["requests"] else None
+    stats["pool_maxsize"] = adapter._pool_maxsize
+    return stats
+
+
+def encode_cursor(position: dict) -> str:
+    """
+    encodes a keyset position as an opaque url safe cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    decodes a cursor created by encode_cursor,raises ValueError for anything else.
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(position, dict):
+        raise ValueError("invalid cursor")
+    return position
+
+
+def is_asgi_request(request) -> bool:
+    return isinstance(getattr(request, "_request", request), ASGIRequest)
+
+
+def streaming_content(request, iterator, batch_size=100):
+    """
+    the content for a StreamingHttpResponse of a sync iterator.under ASGI Django 4.2 reads a sync
+    iterator into a list before sending it,so there the items are pulled batch_size at a time in the
+    thread sensitive worker and yielded from an async iterator,which keeps memory flat.
+    """
+    if not is_asgi_request(request):
+        return iterator
+    iterator = iter(iterator)
+    take = sync_to_async(lambda: list(itertools.islice(iterator, batch_size)), thread_sensitive=True)
+
+    async def content():
+        try:
+            while True:
+                items = await take()
+                if not items:
+                    return
+                for item in items:
+                    yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                await sync_to_async(close, thread_sensitive=True)()
+
+    return content()
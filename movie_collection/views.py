@@ -1,7 +1,18 @@
+from collections import defaultdict
+from functools import cached_property
+
 import requests
+from asgiref.sync import sync_to_async
 from django.db import transaction
-from django.db.models import Prefetch
+from django.db.models import Prefetch, Sum
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied
+from rest_framework.generics import get_object_or_404
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.mixins import ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin, \
     DestroyModelMixin
@@ -12,13 +23,21 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
 
-from .constants import Constant
-from .models import Collection, Movie, RequestData, MovieCollection
-from .serializers import CollectionSerializer, MovieSerializer, RequestDataSerializer, UserSerializer, \
-    CollectionListSerializer, UserListSerializer
-from user_collections.settings import env
-from .utilities import get_retry_session
-from .pagination import CustomPageNumberPagination
+from .aggregates import finest_aligned_granularity, get_rollup_buffer, GRANULARITY_SPANS, LATENCY_DIMENSIONS, LatencyHistogram
+from .exports import EXPORT_FORMATS
+from .bulk_import import import_collections
+from .fieldsets import FieldSelection
+from .filters import CollectionFilter, LatencyRollupFilter, MovieFilter, MovieSearchFilter, RequestCountRollupFilter, \
+    RequestDataFilter
+from .genres import genre_counts
+from .models import Collection, Movie, RequestData, MovieCollection, RequestCountRollup, LatencyRollup
+from .serializers import CatalogMovieSerializer, CollectionSerializer, MovieSerializer, RequestDataSerializer, \
+    UserSerializer, CollectionListSerializer, CollectionRowSerializer, UserListSerializer
+from .circuit_breaker import CircuitOpenError
+from .movie_api import aget_movies, astream_movies, get_movies, movie_async_flight, movie_breaker, movie_cache, \
+    movie_flight, shared_movie_cache, stream_movies
+from .utilities import encode_cursor, decode_cursor, get_pool_stats, streaming_content
+from .pagination import CustomPageNumberPagination, MovieApiPageNumberPagination, OptionalPageNumberPagination
 
 
 class RegisterAPI(GenericViewSet, CreateModelMixin):
@@ -68,31 +87,116 @@ class UserAPI(GenericViewSet, CreateModelMixin, UpdateModelMixin, RetrieveModelM
 
 class MovieAPI(GenericViewSet, ListModelMixin):
     """
-    movies list is called from external api.This list is not stored in database
+    movies list is called from external api.This list is not stored in database,unless MOVIE_API_SOURCE
+    is "local": then it is served from the movie table that the sync_movies command fills.
     """
     permission_classes = [IsAuthenticated]
-    serializer_class = MovieSerializer
+    serializer_class = CatalogMovieSerializer
+    pagination_class = MovieApiPageNumberPagination
 
     def get_queryset(self):
-        return Movie.objects.all()
+        return Movie.objects.order_by('id')
 
     def list(self, request, *args, **kwargs):
-        retry_session = get_retry_session()
+        """
+        in passthrough mode the upstream bytes are sent as they are,without parsing and re-rendering
+        them: cached pages as one body,and with the cache disabled the upstream body is streamed in chunks.
+        """
+        if settings.MOVIE_API_SOURCE == 'local':
+            return super(MovieAPI, self).list(request, *args, **kwargs)
         try:
-            response = retry_session.get(env(Constant.MOVIE_API_URL),params=request.query_params.copy(),verify=False)
+            if not settings.MOVIE_API_PASSTHROUGH:
+                response = get_movies(request.query_params)
+                return Response(response.json(), status=response.status)
+            if not movie_cache.enabled:
+                status, content_type, chunks = stream_movies(request.query_params)
+                return StreamingHttpResponse(streaming_content(request, chunks, batch_size=1), status=status,
+                                             content_type=content_type)
+            response = get_movies(request.query_params)
+        except CircuitOpenError as e:
+            return Response({"error": str(e)}, status=503, headers={"Retry-After": str(int(e.retry_after or 0) + 1)})
         except requests.exceptions.RequestException as e:
             return Response({"error": str(e)}, status=500)
-        return Response(response.json(), status=response.status_code)
+        return HttpResponse(response.body, status=response.status, content_type=response.content_type)
+
+    @action(methods=['get'], detail=False, url_path="cache-stats")
+    def cache_stats(self, request, *args, **kwargs):
+        return Response({"memory": movie_cache.stats(), "shared": shared_movie_cache.stats(),
+                         "single_flight": movie_flight.stats(), "async_single_flight": movie_async_flight.stats()})
+
+    @action(methods=['get'], detail=False, url_path="pool-stats")
+    def pool_stats(self, request, *args, **kwargs):
+        return Response(dict(get_pool_stats(), circuit_breaker=movie_breaker.stats()))
+
+class AsyncMovieAPI(View):
+    """
+    movies list from the external api as a native async view for the ASGI deployment,the upstream round
+    trip is awaited instead of holding a worker thread.caches,circuit breaker and responses are the same
+    as MovieAPI.list,and with MOVIE_API_SOURCE "local" the movie table is served through MovieAPI.list.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    def local_list(request):
+        # MovieAPI authenticates the request itself
+        return MovieAPI.as_view({"get": "list"})(request).render()
+
+    def check_access(self, request):
+        """
+        authenticates the request with the rest framework authenticators,returns an error response or None.
+        """
+        drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            for permission in self.permission_classes:
+                if not permission().has_permission(drf_request, self):
+                    raise NotAuthenticated() if drf_request.user is None or not drf_request.user.is_authenticated \
+                        else PermissionDenied()
+        except APIException as e:
+            return JsonResponse({"detail": e.detail}, status=e.status_code)
+        return None
+
+    async def get(self, request, *args, **kwargs):
+        if settings.MOVIE_API_SOURCE == 'local':
+            return await sync_to_async(self.local_list)(request)
+        denied = await sync_to_async(self.check_access)(request)
+        if denied is not None:
+            return denied
+        try:
+            if not settings.MOVIE_API_PASSTHROUGH:
+                response = await aget_movies(request.GET)
+                return JsonResponse(response.json(), status=response.status, safe=False)
+            if not movie_cache.enabled:
+                status, content_type, chunks = await astream_movies(request.GET)
+                return StreamingHttpResponse(chunks, status=status, content_type=content_type)
+            response = await aget_movies(request.GET)
+        except CircuitOpenError as e:
+            return JsonResponse({"error": str(e)}, status=503, headers={"Retry-After": str(int(e.retry_after or 0) + 1)})
+        except requests.exceptions.RequestException as e:
+            return JsonResponse({"error": str(e)}, status=500)
+        return HttpResponse(response.body, status=response.status, content_type=response.content_type)
+
 
 class MoviesFromDbAPI(GenericViewSet, ListModelMixin,UpdateModelMixin,RetrieveModelMixin,CreateModelMixin):
     """
-    movies list is called from external api.
+    movies list is called from external api.?q= searches titles and descriptions,?genre= filters by genre.
+    the list is a bare list unless ?page=,?cursor= or ?pagination=cursor asks for the paginated envelope.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = MovieSerializer
+    filter_backends = [DjangoFilterBackend, MovieSearchFilter]
+    filterset_class = MovieFilter
+    pagination_class = OptionalPageNumberPagination
 
     def get_queryset(self):
-        return Movie.objects.all()
+        return Movie.objects.order_by('-id')
+
+    @action(methods=['get'], detail=False, url_path="genres")
+    def genres(self, request, *args, **kwargs):
+        """
+        genre facet counts of the movies matching the same filters as the list.
+        """
+        movies = self.filter_queryset(self.get_queryset())
+        return Response({"genres": genre_counts(movies.values("id"))})
 
 
 class CollectionAPI(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin,
@@ -102,6 +206,7 @@ class CollectionAPI(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveMo
     """
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filterset_class = CollectionFilter
     pagination_class = CustomPageNumberPagination
 
     ordering_fields = ['title']
@@ -110,11 +215,21 @@ class CollectionAPI(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveMo
 
     def get_queryset(self):
         qs = Collection.objects.all().prefetch_related(Prefetch("user",queryset=User.objects.all()),'movies')
+        if self.field_selection is not None:
+            qs = self.field_selection.prune(qs)
         if self.request.user.is_superuser:
             return qs
         else:
             return qs.filter(user_id=self.request.user.id)
 
+    @cached_property
+    def field_selection(self):
+        """
+        the ?fields=/?expand=/?view= selection of list and retrieve requests.
+        """
+        if self.action not in ['list', 'retrieve']:
+            return None
+        return FieldSelection.from_request(self.request)
 
     def get_serializer_class(self):
         if self.action in ['create', 'partial_update', 'update','delete']:
@@ -122,6 +237,36 @@ class CollectionAPI(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveMo
         else:
             return CollectionListSerializer
 
+    def get_serializer(self, *args, **kwargs):
+        if self.field_selection is not None:
+            kwargs["selection"] = self.field_selection
+        return super(CollectionAPI, self).get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        """
+        without a field selection the page is read with values() and rendered by CollectionRowSerializer.
+        """
+        if self.field_selection is not None or not settings.COLLECTION_FAST_LIST:
+            return super(CollectionAPI, self).list(request, *args, **kwargs)
+        queryset = CollectionRowSerializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(CollectionRowSerializer.to_representation(page))
+        return Response(CollectionRowSerializer.to_representation(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        without a field selection the collection is read with values() and rendered by CollectionRowSerializer,
+        as in list.
+        """
+        if self.field_selection is not None or not settings.COLLECTION_FAST_LIST:
+            return super(CollectionAPI, self).retrieve(request, *args, **kwargs)
+        queryset = CollectionRowSerializer.values(self.filter_queryset(self.get_queryset()))
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, row)
+        return Response(CollectionRowSerializer.to_representation([row])[0])
+
     def create(self, request, *args, **kwargs):
         with transaction.atomic():
             input_data = request.data
@@ -164,6 +309,38 @@ class CollectionAPI(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveMo
         instance.delete()
         return Response({"collection deleted successfully"},status=200)
 
+    @action(methods=['post'], detail=False, url_path="bulk")
+    def bulk(self, request, *args, **kwargs):
+        """
+        creates up to COLLECTION_BULK_MAX_ITEMS collections,given as a list or as {"collections": [...]},
+        and reports a result per item.
+        """
+        items = request.data.get("collections") if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({"collections": ["expected a non empty list of collections"]}, status=400)
+        if len(items) > settings.COLLECTION_BULK_MAX_ITEMS:
+            return Response({"collections": ["at most {} collections per request".format(
+                settings.COLLECTION_BULK_MAX_ITEMS)]}, status=400)
+        result = import_collections(items, request.user)
+        return Response(result, status=201 if result["created"] else 400)
+
+    @action(methods=['get'], detail=True, url_path="genres")
+    def genres(self, request, *args, **kwargs):
+        """
+        genre facet counts of the movies of one collection.
+        """
+        collection = self.get_object()
+        return Response({"genres": genre_counts(MovieCollection.objects.filter(collection=collection).values("movie_id"))})
+
+    @action(methods=['get'], detail=False, url_path="genres")
+    def all_genres(self, request, *args, **kwargs):
+        """
+        genre facet counts of the distinct movies of all collections matching the list filters.
+        """
+        collections = self.filter_queryset(self.get_queryset())
+        movie_ids = MovieCollection.objects.filter(collection_id__in=collections.values("id")).values("movie_id")
+        return Response({"genres": genre_counts(movie_ids)})
+
 
 
 class RequestDataAPI(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin,
@@ -174,6 +351,7 @@ class RequestDataAPI(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveM
     permission_classes = [IsAuthenticated]
     serializer_class = RequestDataSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filterset_class = RequestDataFilter
     pagination_class = CustomPageNumberPagination
 
     ordering_fields = []
@@ -182,16 +360,122 @@ class RequestDataAPI(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveM
     def get_queryset(self):
         return RequestData.objects.all()
 
+    group_by_fields = {"path": "path", "method": "method", "status": "response_status", "user": "user",
+                       "node_id": "node_id"}
+
     def list(self, request, *args, **kwargs):
-        no_of_requests = self.get_queryset().count()
-        return Response({"requests": "{} requests are served by server till now".format(no_of_requests)})
+        """
+        request counts are read from the pre-aggregated rollups,optionally restricted with start/end
+        (ISO 8601) and the path/method/status/user/node_id filters,and grouped with group_by=path,status...
+        """
+        get_rollup_buffer().flush()
+        rollup_filter = RequestCountRollupFilter(request.query_params, queryset=RequestCountRollup.objects.all())
+        if not rollup_filter.is_valid():
+            return Response(rollup_filter.errors, status=400)
+        group_by = [field.strip() for field in request.query_params.get("group_by", "").split(",") if field.strip()]
+        unknown_fields = [field for field in group_by if field not in self.group_by_fields]
+        if unknown_fields:
+            return Response({"group_by": "unknown fields {}".format(", ".join(unknown_fields))}, status=400)
+        granularity = finest_aligned_granularity(rollup_filter.form.cleaned_data.get("start"),
+                                                 rollup_filter.form.cleaned_data.get("end"))
+        rollups = rollup_filter.qs.filter(granularity=granularity)
+        no_of_requests = rollups.aggregate(total=Sum("count"))["total"] or 0
+        data = {"requests": "{} requests are served by server till now".format(no_of_requests),
+                "count": no_of_requests}
+        if group_by:
+            columns = [self.group_by_fields[field] for field in group_by]
+            groups = rollups.values(*columns).annotate(count=Sum("count")).order_by("-count")
+            data["groups"] = [dict({field: group[self.group_by_fields[field]] for field in group_by},
+                                   count=group["count"]) for group in groups]
+        return Response(data)
+
+    @action(methods=['get'], detail=False, url_path="latency")
+    def latency(self, request, *args, **kwargs):
+        """
+        p50/p95/p99/max latency and throughput per path,method and node_id (group_by=...) over the
+        start/end window,merged from the latency rollup histograms.
+        """
+        get_rollup_buffer().flush()
+        latency_filter = LatencyRollupFilter(request.query_params, queryset=LatencyRollup.objects.all())
+        if not latency_filter.is_valid():
+            return Response(latency_filter.errors, status=400)
+        group_by = [field.strip() for field in request.query_params.get("group_by", "path,method,node_id").split(",")
+                    if field.strip()]
+        unknown_fields = [field for field in group_by if field not in LATENCY_DIMENSIONS]
+        if unknown_fields:
+            return Response({"group_by": "unknown fields {}".format(", ".join(unknown_fields))}, status=400)
+        start = latency_filter.form.cleaned_data.get("start")
+        end = latency_filter.form.cleaned_data.get("end")
+        granularity = finest_aligned_granularity(start, end)
+        histograms = defaultdict(LatencyHistogram)
+        first_bucket, last_bucket = None, None
+        for rollup in latency_filter.qs.filter(granularity=granularity).iterator():
+            histograms[tuple(getattr(rollup, field) for field in group_by)].merge(rollup.get_histogram())
+            first_bucket = min(first_bucket or rollup.bucket_start, rollup.bucket_start)
+            last_bucket = max(last_bucket or rollup.bucket_start, rollup.bucket_start)
+        window_start = start or first_bucket
+        window_end = end or (last_bucket + GRANULARITY_SPANS[granularity] if last_bucket else None)
+        window_seconds = (window_end - window_start).total_seconds() if window_start and window_end else 0
+        results = []
+        for key, histogram in sorted(histograms.items(), key=lambda item: -item[1].count):
+            result = dict(zip(group_by, key))
+            result.update({
+                "count": histogram.count,
+                "throughput_rps": round(histogram.count / window_seconds, 4) if window_seconds else None,
+                "avg_ms": round(histogram.total / histogram.count / 1000, 3),
+                "p50_ms": round(histogram.percentile(50) / 1000, 3),
+                "p95_ms": round(histogram.percentile(95) / 1000, 3),
+                "p99_ms": round(histogram.percentile(99) / 1000, 3),
+                "max_ms": round(histogram.maximum / 1000, 3),
+            })
+            results.append(result)
+        return Response({"window": {"start": window_start, "end": window_end, "seconds": window_seconds,
+                                    "granularity": granularity},
+                         "results": results})
 
     @action(methods=['POST'], detail=False, url_path="reset")
     def reset(self, request, *args, **kwargs):
-        self.get_queryset().delete()
+        """
+        resets the request count and latency by clearing the rollups,raw request logs are left for the retention job.
+        """
+        get_rollup_buffer().clear()
+        RequestCountRollup.objects.all().delete()
+        LatencyRollup.objects.all().delete()
         return Response({"message": "request count reset successfully"}, status=200)
 
     @action(methods=['get'], detail=False, url_path="request-log")
     def get_request_log(self, request, *args, **kwargs):
-        return Response(RequestDataSerializer(self.get_queryset(),many=True).data)
+        """
+        streams the request log as json (default),ndjson or csv (export_format=...) in id order.rows are
+        read in chunks so memory stays flat.start/end/path/method/status/node_id narrow the export,limit
+        caps it and the X-Next-Cursor header holds the cursor to resume with; an interrupted export can
+        also resume with after_id=<last id received>.
+        """
+        export_format = request.query_params.get("export_format", "json")
+        if export_format not in EXPORT_FORMATS:
+            return Response({"export_format": "must be one of {}".format(", ".join(EXPORT_FORMATS))}, status=400)
+        try:
+            after_id = int(request.query_params.get("after_id", 0))
+            if request.query_params.get("cursor"):
+                after_id = int(decode_cursor(request.query_params["cursor"])["after_id"])
+            limit = int(request.query_params.get("limit", 0))
+            chunk_size = min(max(int(request.query_params.get("chunk_size", 2000)), 1), 10000)
+        except (KeyError, TypeError, ValueError):
+            return Response({"message": "after_id,cursor,limit and chunk_size must be valid"}, status=400)
+        queryset = self.filter_queryset(self.get_queryset()).filter(id__gt=after_id).order_by("id")
+        next_cursor = None
+        if limit > 0:
+            boundary = list(queryset.values_list("id", flat=True)[limit - 1:limit + 1])
+            if len(boundary) == 2:
+                queryset = queryset.filter(id__lte=boundary[0])
+                next_cursor = encode_cursor({"after_id": boundary[0]})
+        stream, content_type = EXPORT_FORMATS[export_format]
+        rows = stream(queryset.iterator(chunk_size=chunk_size), RequestDataSerializer())
+        response = StreamingHttpResponse(streaming_content(request, rows, batch_size=chunk_size),
+                                         content_type=content_type)
+        if export_format == "csv":
+            response["Content-Disposition"] = 'attachment; filename="request-log.csv"'
+        if next_cursor:
+            response["X-Next-Cursor"] = next_cursor
+        return response
 
@@ -162,9 +162,31 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'movie_collection.renderers.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     )
 }
 NODE_ID = env("NODE_ID")
+
+# request logs written by MiddlewareAPI are buffered and inserted in batches by a background thread
+REQUEST_LOG_ASYNC = env.bool("REQUEST_LOG_ASYNC", default=True)
+REQUEST_LOG_MAX_QUEUE_SIZE = env.int("REQUEST_LOG_MAX_QUEUE_SIZE", default=10000)
+REQUEST_LOG_BATCH_SIZE = env.int("REQUEST_LOG_BATCH_SIZE", default=500)
+REQUEST_LOG_FLUSH_INTERVAL = env.float("REQUEST_LOG_FLUSH_INTERVAL", default=1.0)
+# one of drop, block or spill
+REQUEST_LOG_BACKPRESSURE = env("REQUEST_LOG_BACKPRESSURE", default="drop")
+REQUEST_LOG_BLOCK_TIMEOUT = env.float("REQUEST_LOG_BLOCK_TIMEOUT", default=1.0)
+REQUEST_LOG_SPILL_PATH = env("REQUEST_LOG_SPILL_PATH", default=os.path.join(BASE_DIR, "request_log_spill.jsonl"))
+# request count and latency rollups are summed in memory and written once per key every N seconds
+REQUEST_ROLLUP_FLUSH_INTERVAL = env.float("REQUEST_ROLLUP_FLUSH_INTERVAL", default=5.0)
+# minute rollups older than this are deleted by prune_request_logs,0 keeps them
+REQUEST_ROLLUP_MINUTE_RETENTION_DAYS = env.int("REQUEST_ROLLUP_MINUTE_RETENTION_DAYS", default=7)
+# defaults of the prune_request_logs command,run it from cron;both limits 0 keeps all request logs
+REQUEST_LOG_RETENTION_DAYS = env.int("REQUEST_LOG_RETENTION_DAYS", default=0)
+REQUEST_LOG_RETENTION_KEEP_PER_PATH = env.int("REQUEST_LOG_RETENTION_KEEP_PER_PATH", default=0)
+REQUEST_LOG_RETENTION_CHUNK_SIZE = env.int("REQUEST_LOG_RETENTION_CHUNK_SIZE", default=1000)
 if env.bool('LOGGING'):
     LOGGING = {
         'version': 1,
@@ -195,3 +217,65 @@ if env.bool('LOGGING'):
 
     }
 DEBUG = env.bool('DEBUG')
+
+# identical queries repeated this many times in one request are logged as N+1 patterns,0 disables it
+NPLUSONE_THRESHOLD = env.int("NPLUSONE_THRESHOLD", default=5)
+# maximum number of queries per "<ViewSet>.<action>",checked by MiddlewareAPI
+QUERY_BUDGETS = {
+    "CollectionAPI.list": 8,
+    "CollectionAPI.retrieve": 6,
+    "MoviesFromDbAPI.list": 4,
+    "MovieAPI.list": 3,
+    # as MovieAPI.list when MOVIE_API_SOURCE is "local"
+    "AsyncMovieAPI": 3,
+    "RequestDataAPI.list": 4,
+}
+# raise instead of logging when a budget is exceeded
+QUERY_BUDGET_STRICT = env.bool("QUERY_BUDGET_STRICT", default=False)
+
+# in-process cache of movie api pages,MOVIE_CACHE_SIZE=0 disables it
+MOVIE_CACHE_SIZE = env.int("MOVIE_CACHE_SIZE", default=256)
+MOVIE_CACHE_TTL = env.int("MOVIE_CACHE_TTL", default=60)
+# seconds a page is still served after its ttl while it is refreshed in the background
+MOVIE_CACHE_STALE_TTL = env.int("MOVIE_CACHE_STALE_TTL", default=300)
+# sqlite file shared by the worker processes of a host for movie api pages,empty disables it
+MOVIE_SHARED_CACHE_PATH = env("MOVIE_SHARED_CACHE_PATH", default=os.path.join(BASE_DIR, "movie_cache.sqlite3"))
+MOVIE_SHARED_CACHE_MAX_BYTES = env.int("MOVIE_SHARED_CACHE_MAX_BYTES", default=64 * 1024 * 1024)
+# directory for per page lock files so only one worker of the host loads a page at a time,empty keeps
+# the coalescing of identical movie api requests per worker
+MOVIE_SINGLE_FLIGHT_LOCK_DIR = env("MOVIE_SINGLE_FLIGHT_LOCK_DIR", default="")
+
+# send movie api bodies to the client as they are instead of parsing and re-rendering them
+MOVIE_API_PASSTHROUGH = env.bool("MOVIE_API_PASSTHROUGH", default=True)
+MOVIE_API_STREAM_CHUNK_SIZE = env.int("MOVIE_API_STREAM_CHUNK_SIZE", default=64 * 1024)
+# "local" serves /movies/ from the movie table filled by the sync_movies command instead of the movie api
+MOVIE_API_SOURCE = env("MOVIE_API_SOURCE", default="upstream")
+
+# pooled http client used for the movie api
+UPSTREAM_POOL_CONNECTIONS = env.int("UPSTREAM_POOL_CONNECTIONS", default=4)
+UPSTREAM_POOL_MAXSIZE = env.int("UPSTREAM_POOL_MAXSIZE", default=16)
+UPSTREAM_CONNECT_TIMEOUT = env.float("UPSTREAM_CONNECT_TIMEOUT", default=3.05)
+UPSTREAM_READ_TIMEOUT = env.float("UPSTREAM_READ_TIMEOUT", default=10.0)
+UPSTREAM_RETRIES = env.int("UPSTREAM_RETRIES", default=3)
+UPSTREAM_RETRY_BACKOFF = env.float("UPSTREAM_RETRY_BACKOFF", default=0.5)
+# connections the async client of an event loop may open at once,for the ASGI movie proxy
+UPSTREAM_ASYNC_MAX_CONNECTIONS = env.int("UPSTREAM_ASYNC_MAX_CONNECTIONS", default=200)
+
+# render collection list pages and single collections from values() rows instead of nested model serializers
+COLLECTION_FAST_LIST = env.bool("COLLECTION_FAST_LIST", default=True)
+# collections accepted by one /collection/bulk/ request and rows per insert statement of the import
+COLLECTION_BULK_MAX_ITEMS = env.int("COLLECTION_BULK_MAX_ITEMS", default=1000)
+COLLECTION_BULK_BATCH_SIZE = env.int("COLLECTION_BULK_BATCH_SIZE", default=500)
+
+# circuit breaker around the movie api,over the last MOVIE_CIRCUIT_WINDOW calls
+MOVIE_CIRCUIT_FAILURE_RATE = env.float("MOVIE_CIRCUIT_FAILURE_RATE", default=0.5)
+MOVIE_CIRCUIT_SLOW_CALL_SECONDS = env.float("MOVIE_CIRCUIT_SLOW_CALL_SECONDS", default=5.0)
+MOVIE_CIRCUIT_SLOW_CALL_RATE = env.float("MOVIE_CIRCUIT_SLOW_CALL_RATE", default=0.8)
+MOVIE_CIRCUIT_WINDOW = env.int("MOVIE_CIRCUIT_WINDOW", default=20)
+MOVIE_CIRCUIT_MIN_CALLS = env.int("MOVIE_CIRCUIT_MIN_CALLS", default=5)
+MOVIE_CIRCUIT_OPEN_SECONDS = env.float("MOVIE_CIRCUIT_OPEN_SECONDS", default=30.0)
+
+# seconds an exact page count is cached,per count query,until the table is written to,0 disables it
+COUNT_CACHE_TTL = env.int("COUNT_CACHE_TTL", default=300)
+# page counts at or above this many rows by the table statistics are estimated instead of counted,0 disables it
+COUNT_ESTIMATE_THRESHOLD = env.int("COUNT_ESTIMATE_THRESHOLD", default=100000)